@@ -0,0 +1,228 @@
+"""Admission control: per-route concurrency limits and load shedding.
+
+Analytic endpoints (GTD analysis, time reports, search, recurring task
+processing, archival, the NDJSON export) share the event loop and the MongoDB pool with cheap
+CRUD. Under a burst they would all run at once and push up everyone's
+latency, so routes decorated with ``limited`` run at most ``concurrency``
+calls at a time and queue at most ``queue`` more. A request that finds the
+queue full, or waits longer than ``ADMISSION_QUEUE_TIMEOUT_SECONDS`` for a
+slot, is answered 503 with ``Retry-After`` straight away.
+
+``shed_requests`` bounds everything in flight under ``/api``. Past
+``ADMISSION_MAX_IN_FLIGHT``, reads are shed, while interactive writes
+(POST, PUT, PATCH and DELETE to routes without a limit) may use another
+``ADMISSION_WRITE_RESERVE`` requests, so edits keep working under analytic
+load.
+
+Limits are configured as ``name=concurrency:queue`` in ``ADMISSION_LIMITS``.
+Applied beneath ``singleflight.coalesce``, only the shared computation
+takes a slot. A route returning a ``StreamingResponse`` holds its slot until
+the response has been sent or abandoned, since the work happens while
+streaming.
+"""
+import asyncio
+import collections
+import functools
+import os
+import time
+from typing import Deque, Dict
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+import metrics
+
+ADMISSION_LIMITS = os.environ.get(
+    'ADMISSION_LIMITS',
+    'gtd_analysis=2:16,time_report=2:8,search=8:32,projects_summary=4:16,'
+    'recurring_tasks=1:0,archive_tasks=1:0,export=2:4'
+)
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT_SECONDS', '5'))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.environ.get('ADMISSION_RETRY_AFTER_SECONDS', '2'))
+# Requests in flight under /api before reads are shed; 0 disables shedding
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', '256'))
+ADMISSION_WRITE_RESERVE = int(os.environ.get('ADMISSION_WRITE_RESERVE', '32'))
+
+WRITE_METHODS = frozenset({"POST", "PUT", "PATCH", "DELETE"})
+
+
+def parse_limits(spec: str) -> Dict[str, tuple]:
+    limits = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, sizes = entry.partition("=")
+        concurrency, _, queue = sizes.partition(":")
+        limits[name.strip()] = (int(concurrency), int(queue or 0))
+    return limits
+
+
+class Overloaded(Exception):
+    def __init__(self, name: str, reason: str):
+        super().__init__(f"{name} is overloaded ({reason})")
+        self.name = name
+        self.reason = reason
+
+
+class Limiter:
+    """At most ``concurrency`` holders, at most ``queue`` waiters, first come first served."""
+
+    def __init__(self, name: str, concurrency: int, queue: int = 0,
+                 timeout: float = ADMISSION_QUEUE_TIMEOUT_SECONDS):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue = queue
+        self.timeout = timeout
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = collections.deque()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self):
+        if self.active < self.concurrency and not self._waiters:
+            self.active += 1
+            self._admitted(0.0)
+            return
+        if len(self._waiters) >= self.queue:
+            self._reject("queue_full")
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        metrics.ADMISSION_QUEUED.labels(self.name).set(len(self._waiters))
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the wait ended; pass it on
+                self.release()
+            else:
+                waiter.cancel()
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+            metrics.ADMISSION_QUEUED.labels(self.name).set(len(self._waiters))
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject("timeout")
+            raise
+        metrics.ADMISSION_QUEUED.labels(self.name).set(len(self._waiters))
+        self._admitted(time.perf_counter() - started)
+
+    def release(self):
+        self.active -= 1
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # Hand the slot straight to the next waiter so newcomers cannot overtake it
+                waiter.set_result(None)
+                self.active += 1
+                break
+        metrics.ADMISSION_ACTIVE.labels(self.name).set(self.active)
+
+    def _admitted(self, waited: float):
+        metrics.ADMISSION_ACTIVE.labels(self.name).set(self.active)
+        metrics.ADMISSION_WAIT.labels(self.name).observe(waited)
+
+    def _reject(self, reason: str):
+        metrics.ADMISSION_REJECTED.labels(self.name, reason).inc()
+        raise Overloaded(self.name, reason)
+
+
+limiters: Dict[str, Limiter] = {
+    name: Limiter(name, concurrency, queue) for name, (concurrency, queue) in parse_limits(ADMISSION_LIMITS).items()
+}
+
+
+def overloaded_headers() -> dict:
+    return {"Retry-After": str(ADMISSION_RETRY_AFTER_SECONDS)}
+
+
+def limited(name: str):
+    """Route decorator admitting calls through the limiter ``name``, when one is configured."""
+    def decorate(function):
+        limiter = limiters.get(name)
+        if limiter is None:
+            return function
+
+        @functools.wraps(function)
+        async def admitted(*args, **kwargs):
+            try:
+                await limiter.acquire()
+            except Overloaded:
+                raise HTTPException(status_code=503, detail=f"Too many concurrent {name} requests; retry shortly",
+                                    headers=overloaded_headers())
+            try:
+                response = await function(*args, **kwargs)
+            except BaseException:
+                limiter.release()
+                raise
+            if isinstance(response, StreamingResponse):
+                return _HeldResponse(response, limiter)
+            limiter.release()
+            return response
+
+        admitted.limiter = limiter
+        return admitted
+    return decorate
+
+
+class _HeldResponse(Response):
+    """Sends ``response`` and then releases its limiter slot, however sending ends.
+
+    The body iterator may never start (the client left first, or an outer
+    middleware failed), so the slot is released around the ASGI call, and
+    when the response is dropped without ever being called.
+    """
+
+    def __init__(self, response: StreamingResponse, limiter: Limiter):
+        self.response = response
+        self.limiter = limiter
+        self.background = None
+        self._held = True
+
+    def _release(self):
+        if self._held:
+            self._held = False
+            self.limiter.release()
+
+    async def __call__(self, scope, receive, send):
+        if self.response.background is None:
+            self.response.background = self.background
+        try:
+            await self.response(scope, receive, send)
+        finally:
+            self._release()
+
+    def __del__(self):
+        self._release()
+
+
+_in_flight = 0
+
+
+def limited_paths(app) -> frozenset:
+    """Paths of the app's routes that have a limiter; writes to them are not interactive."""
+    return frozenset(route.path for route in app.routes if hasattr(getattr(route, "endpoint", None), "limiter"))
+
+
+def shed_requests(app):
+    """HTTP middleware shedding ``/api`` reads past ``ADMISSION_MAX_IN_FLIGHT``, reserving room for writes."""
+    limited_routes = limited_paths(app)
+
+    async def shed(request, call_next):
+        global _in_flight
+        path = request.url.path
+        if not ADMISSION_MAX_IN_FLIGHT or not path.startswith("/api/"):
+            return await call_next(request)
+        interactive_write = request.method in WRITE_METHODS and path not in limited_routes
+        capacity = ADMISSION_MAX_IN_FLIGHT + (ADMISSION_WRITE_RESERVE if interactive_write else 0)
+        if _in_flight >= capacity:
+            metrics.ADMISSION_REJECTED.labels("in_flight", "write" if interactive_write else "read").inc()
+            return JSONResponse({"detail": "Server is overloaded; retry shortly"}, status_code=503,
+                                headers=overloaded_headers())
+        _in_flight += 1
+        metrics.ADMISSION_ACTIVE.labels("in_flight").set(_in_flight)
+        try:
+            return await call_next(request)
+        finally:
+            _in_flight -= 1
+            metrics.ADMISSION_ACTIVE.labels("in_flight").set(_in_flight)
+    return shed
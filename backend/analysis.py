@@ -0,0 +1,226 @@
+"""CPU-bound GTD analysis run off the event loop.
+
+``get_gtd_analysis`` packs the active tasks into compact tuples
+(``compact_task``) and hands them to ``AnalysisRunner``, which evaluates
+``analyse`` in a ``ProcessPoolExecutor`` so scoring, grouping, dependency
+suggestions and the critical path never block other requests. Small inputs
+are analysed inline because shipping them to a worker costs more than the
+work itself. When a worker times out or the pool breaks, the last good
+result for the same key is served instead, marked stale.
+"""
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', '2'))
+ANALYSIS_TIMEOUT_SECONDS = float(os.environ.get('ANALYSIS_TIMEOUT_SECONDS', '10'))
+# Below this many tasks the pickling round trip outweighs the analysis
+ANALYSIS_INLINE_BELOW = int(os.environ.get('ANALYSIS_INLINE_BELOW', '200'))
+
+PRIORITY_SCORES = {"high": 3, "medium": 2, "low": 1}
+HIGH_IMPACT_THRESHOLD = 4
+DEPENDENCY_KEYWORDS = {
+    "contract": ["nda", "agreement", "review"],
+    "presentation": ["slides", "document", "prepare"],
+    "meeting": ["agenda", "invite", "prepare"],
+    "launch": ["test", "review", "deploy"],
+    "document": ["draft", "review", "approve"],
+}
+
+# (id, title, priority, task_type, deadline as epoch seconds, estimated_hours, dependency ids)
+CompactTask = Tuple[str, str, str, Optional[str], Optional[float], Optional[float], Tuple[str, ...]]
+
+
+class AnalysisUnavailable(Exception):
+    """The analysis failed or timed out and no earlier result is cached."""
+
+
+def epoch_seconds(value: Optional[datetime]) -> Optional[float]:
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        return value.timestamp()
+    return (value - datetime(1970, 1, 1)).total_seconds()
+
+
+def compact_task(task: dict) -> CompactTask:
+    priority = task.get("priority") or "medium"
+    return (
+        task["id"],
+        task.get("title") or "",
+        getattr(priority, "value", priority),
+        task.get("task_type"),
+        epoch_seconds(task.get("deadline")),
+        task.get("estimated_hours"),
+        tuple(task.get("dependencies") or ()),
+    )
+
+
+def impact_score(task: CompactTask, now: float) -> float:
+    _, _, priority, _, deadline, _, dependencies = task
+    score = PRIORITY_SCORES.get(priority, 1)
+    if deadline is not None:
+        days_until_deadline = (deadline - now) // 86400
+        if days_until_deadline <= 1:
+            score += 4
+        elif days_until_deadline <= 3:
+            score += 3
+        elif days_until_deadline <= 7:
+            score += 2
+        else:
+            score += 1
+    return score + len(dependencies) * 0.5
+
+
+def suggest_dependencies(tasks: Sequence[CompactTask], limit: int) -> List[dict]:
+    """Keyword-based dependency suggestions.
+
+    Each dependency keyword is looked up once for its first two matching
+    tasks (two, so one remains when the first is the task itself), which
+    keeps this linear in the number of tasks.
+    """
+    lowered = [task[1].lower() for task in tasks]
+    wanted = {dep for deps in DEPENDENCY_KEYWORDS.values() for dep in deps}
+    first_matches: Dict[str, List[int]] = {dep: [] for dep in wanted}
+    for index, title in enumerate(lowered):
+        for dep in wanted:
+            matches = first_matches[dep]
+            if len(matches) < 2 and dep in title:
+                matches.append(index)
+
+    suggestions = []
+    for index, task in enumerate(tasks):
+        for keyword, dependencies in DEPENDENCY_KEYWORDS.items():
+            if keyword not in lowered[index]:
+                continue
+            for dep in dependencies:
+                match = next((m for m in first_matches[dep] if tasks[m][0] != task[0]), None)
+                if match is None:
+                    continue
+                suggestions.append({
+                    "main_task": task[1],
+                    "main_task_id": task[0],
+                    "suggested_dependency": tasks[match][1],
+                    "suggested_dependency_id": tasks[match][0],
+                    "reason": f"Tasks involving '{keyword}' often require '{dep}'",
+                })
+                if len(suggestions) >= limit:
+                    return suggestions
+    return suggestions
+
+
+def critical_path(tasks: Sequence[CompactTask]) -> Tuple[List[str], float]:
+    """Longest chain of open dependencies by estimated hours (1h when unestimated).
+
+    Dependencies on tasks outside the input are ignored and cycles are cut
+    where they are found, so the result is always a simple path.
+    """
+    by_id = {task[0]: task for task in tasks}
+    best: Dict[str, Tuple[float, Optional[str]]] = {}
+    visiting = set()
+
+    # Iterative post-order walk so long chains cannot hit the recursion limit
+    for root in by_id:
+        stack = [(root, False)]
+        while stack:
+            task_id, expanded = stack.pop()
+            if task_id in best:
+                continue
+            deps = [dep for dep in by_id[task_id][6] if dep in by_id]
+            if not expanded:
+                visiting.add(task_id)
+                stack.append((task_id, True))
+                stack.extend((dep, False) for dep in deps if dep not in best and dep not in visiting)
+                continue
+            visiting.discard(task_id)
+            hours, via = 0.0, None
+            for dep in deps:
+                if dep in best and best[dep][0] > hours:
+                    hours, via = best[dep][0], dep
+            best[task_id] = ((by_id[task_id][5] or 1.0) + hours, via)
+
+    end, total = None, 0.0
+    for task_id, (hours, _) in best.items():
+        if hours > total:
+            end, total = task_id, hours
+    path = []
+    while end is not None:
+        path.append(end)
+        end = best[end][1]
+    return path[::-1], total
+
+
+def analyse(tasks: Sequence[CompactTask], now: float, limits: Tuple[int, int, int] = (5, 3, 5)) -> dict:
+    """Pure analysis over compact tasks; returns task ids, not documents."""
+    impact_limit, batch_limit, suggestion_limit = limits
+
+    high_impact = [task[0] for task in tasks if impact_score(task, now) >= HIGH_IMPACT_THRESHOLD]
+
+    groups: Dict[Tuple[Optional[str], str], List[str]] = {}
+    for task in tasks:
+        groups.setdefault((task[3], task[2]), []).append(task[0])
+    batches = [ids for ids in groups.values() if len(ids) > 1]
+
+    path, path_hours = critical_path(tasks)
+    return {
+        "high_impact": high_impact[:impact_limit],
+        "batches": batches[:batch_limit],
+        "suggestions": suggest_dependencies(tasks, suggestion_limit),
+        "critical_path": path,
+        "critical_path_hours": path_hours,
+        "pending_count": len(tasks),
+        "high_priority_count": sum(1 for task in tasks if task[2] == "high"),
+        "overdue_count": sum(1 for task in tasks if task[4] is not None and task[4] < now),
+    }
+
+
+class AnalysisRunner:
+    """Runs pure analysis functions in a process pool with a stale-result fallback."""
+
+    def __init__(self, workers: int = ANALYSIS_WORKERS, timeout: float = ANALYSIS_TIMEOUT_SECONDS,
+                 inline_below: int = ANALYSIS_INLINE_BELOW):
+        self.workers = workers
+        self.timeout = timeout
+        self.inline_below = inline_below
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._last: Dict[str, Any] = {}
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    async def run(self, key: str, fn: Callable, items: Sequence, *args) -> Tuple[Any, bool]:
+        """``fn(items, *args)`` off the event loop; returns ``(result, stale)``."""
+        if self.workers <= 0 or len(items) < self.inline_below:
+            result = fn(items, *args)
+            self._last[key] = result
+            return result, False
+
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        try:
+            result = await asyncio.wait_for(loop.run_in_executor(self._executor(), fn, items, *args), self.timeout)
+        except (asyncio.TimeoutError, BrokenProcessPool) as e:
+            # A timed-out call keeps its worker busy until it finishes; a broken pool is replaced
+            if isinstance(e, BrokenProcessPool):
+                self._pool = None
+            logger.warning("Analysis %s failed after %.1fs (%s)", key, time.perf_counter() - started,
+                           type(e).__name__)
+            if key not in self._last:
+                raise AnalysisUnavailable(key) from e
+            return self._last[key], True
+        self._last[key] = result
+        return result, False
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
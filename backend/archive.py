@@ -0,0 +1,106 @@
+"""Hot/cold tiering of finished tasks.
+
+Tasks completed or approved more than ``ARCHIVE_AFTER_DAYS`` ago are moved
+from ``tasks`` into ``archived_tasks`` in batches, so the indexes and scans
+behind active-task queries only cover live work. Templates and recurring
+tasks stay where they are, since new instances are created from them.
+
+Each batch upserts the tasks into the archive before deleting them from
+``tasks``; the delete repeats the archival conditions, so a task reopened in
+between stays hot and its archived copy is dropped again. Rerunning after a
+crash therefore just continues. ``find_task`` reads through to the archive
+and ``restore_task`` moves a task back. The ``archive_tasks`` job runs on
+startup and whenever ``POST /api/tasks/archive`` is called, e.g. from cron.
+"""
+import os
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import sync
+import tags
+from storage import ReplaceOne
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '30'))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', '500'))
+
+ARCHIVED = "archived_tasks"
+FINISHED_STATUSES = ["completed", "approved"]
+
+
+def archivable(cutoff: datetime) -> dict:
+    return {
+        "status": {"$in": FINISHED_STATUSES},
+        "completed_at": {"$lt": cutoff},
+        "is_template": {"$ne": True},
+        "recurrence_type": {"$in": ["none", None]},
+    }
+
+
+async def archive_finished_tasks(db, older_than_days: int = ARCHIVE_AFTER_DAYS,
+                                 batch_size: int = ARCHIVE_BATCH_SIZE,
+                                 report: Optional[Callable[..., Awaitable[None]]] = None) -> dict:
+    """Move tasks finished more than ``older_than_days`` ago into the archive."""
+    query = archivable(datetime.utcnow() - timedelta(days=older_than_days))
+    archived = 0
+    while True:
+        batch = await db.tasks.find(query, {"_id": 0}).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        ids = [task["id"] for task in batch]
+        now = datetime.utcnow()
+        await db[ARCHIVED].bulk_write([
+            ReplaceOne({"id": task["id"]}, {**task, "archived_at": now}, upsert=True) for task in batch
+        ], ordered=False)
+        await db.tasks.delete_many({"id": {"$in": ids}, **query})
+        # Tasks changed since the batch was read are still hot; drop their archived copies
+        reopened = set(await db.tasks.distinct("id", {"id": {"$in": ids}}))
+        if reopened:
+            await db[ARCHIVED].delete_many({"id": {"$in": list(reopened)}})
+        moved = [task for task in batch if task["id"] not in reopened]
+        # Tag counts describe live tasks, matching what a rebuild would produce
+        await tags.record_tag_changes(db, [(task, None) for task in moved])
+        await sync.record_deletions(db, "tasks", [task["id"] for task in moved], reason="archived")
+        archived += len(moved)
+        if report:
+            await report(archived=archived)
+    return {"archived": archived}
+
+
+async def find_task(db, task_id: str) -> Optional[dict]:
+    """A task by id from the hot collection, falling back to the archive."""
+    task = await db.tasks.find_one({"id": task_id}, {"_id": 0})
+    if task is None:
+        task = await db[ARCHIVED].find_one({"id": task_id}, {"_id": 0})
+    return task
+
+
+async def find_tasks(db, task_ids: List[str], projection: Optional[dict] = None) -> Dict[str, dict]:
+    """Tasks by id with one ``$in`` query per tier, archive only for ids not found hot."""
+    projection = {**(projection or {}), "_id": 0}
+    if len(projection) > 1 and any(projection.values()):
+        projection["id"] = 1
+    wanted = list(dict.fromkeys(task_ids))
+    found = {task["id"]: task for task in await db.tasks.find({"id": {"$in": wanted}}, projection).to_list(None)}
+    rest = [task_id for task_id in wanted if task_id not in found]
+    if rest:
+        for task in await db[ARCHIVED].find({"id": {"$in": rest}}, projection).to_list(None):
+            found[task["id"]] = task
+    return found
+
+
+async def restore_task(db, task_id: str) -> Optional[dict]:
+    """Move an archived task back into ``tasks``; returns it, or None when it is not archived."""
+    task = await db[ARCHIVED].find_one({"id": task_id}, {"_id": 0, "archived_at": 0})
+    if task is None:
+        return None
+    # A fresh updated_at lets delta sync clients pick the task up again
+    task["updated_at"] = datetime.utcnow()
+    await db.tasks.replace_one({"id": task_id}, task, upsert=True)
+    await db[ARCHIVED].delete_one({"id": task_id})
+    await tags.record_tag_changes(db, [(None, task)])
+    return task
+
+
+async def archived_count(db) -> int:
+    # Only finished tasks are archived, and restoring removes them
+    return await db[ARCHIVED].count_documents({})
@@ -0,0 +1,98 @@
+"""Background cascade for project deletion.
+
+Deleting a project only marks it deleted; ``run_project_cascade`` then
+removes its tasks, live and archived, in batches together with their time
+entries, comments, dependency edges in other tasks and tag counts. It runs
+as a ``project_cascade`` job (see ``jobs``); each batch deletes the dependents
+before the tasks themselves and every step is idempotent, so a cascade
+interrupted by a crash is simply run again from the remaining tasks when
+the job is retried or its lease expires.
+"""
+import os
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+import archive
+import sync
+import time_entries
+
+CASCADE_BATCH_SIZE = int(os.environ.get('CASCADE_BATCH_SIZE', '500'))
+
+
+async def mark_project_deleted(db, project_id: str) -> dict:
+    now = datetime.utcnow()
+    deletion = {
+        "state": "pending",
+        "total_tasks": (await db.tasks.count_documents({"project_id": project_id})
+                        + await db[archive.ARCHIVED].count_documents({"project_id": project_id})),
+        "processed_tasks": 0,
+        "started_at": now,
+        "updated_at": now,
+        "completed_at": None,
+    }
+    await db.projects.update_one(
+        {"id": project_id},
+        {"$set": {"deleted": True, "deleted_at": now, "updated_at": now, "deletion": deletion}}
+    )
+    return deletion
+
+
+async def delete_task_batch(db, task_ids: list):
+    """Remove tasks and everything referencing them; safe to repeat."""
+    await time_entries.delete_for_tasks(db, task_ids)
+    comment_ids = await db.comments.distinct("id", {"task_id": {"$in": task_ids}})
+    await db.comments.delete_many({"task_id": {"$in": task_ids}})
+    await db.tasks.update_many(
+        {"dependencies": {"$in": task_ids}},
+        {"$pull": {"dependencies": {"$in": task_ids}}, "$set": {"updated_at": datetime.utcnow()}}
+    )
+    await db.tasks.delete_many({"id": {"$in": task_ids}})
+    await db[archive.ARCHIVED].delete_many({"id": {"$in": task_ids}})
+    # Tombstones go last so a retried batch records them again rather than not at all
+    await sync.record_deletions(db, "comments", comment_ids)
+    await sync.record_deletions(db, "tasks", task_ids)
+
+
+async def run_project_cascade(db, project_id: str, batch_size: int = CASCADE_BATCH_SIZE,
+                              report: Optional[Callable[..., Awaitable[None]]] = None) -> dict:
+    """Delete the project's tasks batch by batch; ``report`` receives progress after each batch."""
+    deleted = 0
+    await db.projects.update_one({"id": project_id}, {"$set": {"deletion.state": "running"}})
+    while True:
+        batch = await db.tasks.find({"project_id": project_id}, {"_id": 0, "id": 1}).limit(batch_size).to_list(batch_size)
+        if not batch:
+            batch = await db[archive.ARCHIVED].find(
+                {"project_id": project_id}, {"_id": 0, "id": 1}
+            ).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        task_ids = [task["id"] for task in batch]
+        await delete_task_batch(db, task_ids)
+        deleted += len(task_ids)
+        await db.projects.update_one(
+            {"id": project_id},
+            {"$inc": {"deletion.processed_tasks": len(task_ids)}, "$set": {"deletion.updated_at": datetime.utcnow()}}
+        )
+        if report:
+            await report(deleted_tasks=deleted)
+    await db.tag_counts.delete_many({"project_id": project_id})
+    now = datetime.utcnow()
+    await db.projects.update_one(
+        {"id": project_id},
+        {"$set": {"deletion.state": "completed", "deletion.updated_at": now, "deletion.completed_at": now}}
+    )
+    return {"project_id": project_id, "deleted_tasks": deleted}
+
+
+async def resume_project_cascades(db, queue):
+    """Enqueue cascades for deleted projects whose cleanup never finished.
+
+    Covers a crash between marking the project and enqueueing its job; the
+    dedupe key makes this a no-op for cascades that already have a job.
+    """
+    pending = await db.projects.find(
+        {"deleted": True, "deletion.state": {"$ne": "completed"}}, {"_id": 0, "id": 1}
+    ).to_list(None)
+    for project in pending:
+        await queue.enqueue("project_cascade", {"project_id": project["id"]},
+                            dedupe_key=f"project_cascade:{project['id']}")
@@ -0,0 +1,315 @@
+"""Response compression and the precompressed response cache.
+
+Task lists, GTD analysis, bootstrap and exports are large, repetitive JSON.
+``CompressionMiddleware`` negotiates ``Accept-Encoding`` (zstd, br, gzip, in
+that order of preference at equal q) and compresses responses of
+``COMPRESSION_MIN_BYTES`` or more whose type is JSON, NDJSON or text. zstd
+and brotli are offered only when the optional ``zstandard`` and ``brotli``
+packages are installed. Streamed responses (NDJSON exports) are compressed
+chunk by chunk and flushed after each one, so lines reach the client as
+they are produced.
+
+Hot ``GET`` responses under ``RESPONSE_CACHE_PATHS`` are also kept in a
+``ResponseCache`` keyed by path and query string. An entry stores the
+encoded body once and each compressed variant the first time a client asks
+for it, so repeated requests cost neither the handler nor the compressor.
+Entries are dropped after any write through this process (see
+``Storage.watch``) and expire after ``RESPONSE_CACHE_TTL_SECONDS``, which
+bounds how stale a worker can be after writes made by other workers.
+"""
+import gzip
+import os
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; br is then not offered
+    brotli = None
+try:
+    import zstandard
+except ImportError:  # zstandard is optional; zstd is then not offered
+    zstandard = None
+
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', '1024'))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6'))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '5'))
+COMPRESSION_ZSTD_LEVEL = int(os.environ.get('COMPRESSION_ZSTD_LEVEL', '3'))
+
+RESPONSE_CACHE_PATHS = frozenset(filter(None, (
+    path.strip() for path in os.environ.get(
+        'RESPONSE_CACHE_PATHS',
+        '/api/tasks,/api/gtd/analysis,/api/stats/dashboard,/api/projects/summary,/api/bootstrap'
+    ).split(',')
+)))
+RESPONSE_CACHE_TTL_SECONDS = float(os.environ.get('RESPONSE_CACHE_TTL_SECONDS', '10'))
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+# Preferred first when the client weighs them equally
+ENCODINGS: List[str] = [name for name, module in (("zstd", zstandard), ("br", brotli), ("gzip", gzip)) if module]
+# Response headers that describe the body as sent, set again for each variant
+_BODY_HEADERS = (b"content-length", b"content-encoding")
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """The best encoding the client accepts, or None for identity."""
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name.strip():
+            accepted[name.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for encoding in ENCODINGS:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    started = time.process_time()
+    if encoding == "gzip":
+        compressed = gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL, mtime=0)
+    elif encoding == "br":
+        compressed = brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+    else:
+        compressed = zstandard.ZstdCompressor(level=COMPRESSION_ZSTD_LEVEL).compress(body)
+    _observe(encoding, len(body), len(compressed), time.process_time() - started)
+    return compressed
+
+
+class StreamCompressor:
+    """Incremental compression; each chunk is flushed so it can be decoded on arrival."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "gzip":
+            self._compressor = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+        elif encoding == "br":
+            self._compressor = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+        else:
+            self._compressor = zstandard.ZstdCompressor(level=COMPRESSION_ZSTD_LEVEL).compressobj()
+
+    def chunk(self, data: bytes) -> bytes:
+        started = time.process_time()
+        if self.encoding == "gzip":
+            compressed = self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        elif self.encoding == "br":
+            compressed = self._compressor.process(data) + self._compressor.flush()
+        else:
+            compressed = self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        _observe(self.encoding, len(data), len(compressed), time.process_time() - started)
+        return compressed
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def _observe(encoding: str, raw: int, compressed: int, cpu_seconds: float):
+    metrics.COMPRESSION_INPUT_BYTES.labels(encoding).inc(raw)
+    metrics.COMPRESSION_OUTPUT_BYTES.labels(encoding).inc(compressed)
+    metrics.COMPRESSION_CPU_SECONDS.labels(encoding).inc(cpu_seconds)
+
+
+def compressible(headers: List[Tuple[bytes, bytes]]) -> bool:
+    content_type = ""
+    for name, value in headers:
+        if name == b"content-encoding":
+            return False
+        if name == b"content-type":
+            content_type = value.decode("latin-1").lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def with_body_headers(headers: List[Tuple[bytes, bytes]], length: Optional[int],
+                      encoding: Optional[str]) -> List[Tuple[bytes, bytes]]:
+    vary = [value for name, value in headers if name == b"vary"]
+    headers = [(name, value) for name, value in headers if name not in _BODY_HEADERS and name != b"vary"]
+    headers.append((b"vary", b", ".join(vary + [b"Accept-Encoding"])))
+    if length is not None:
+        headers.append((b"content-length", str(length).encode()))
+    if encoding is not None:
+        headers.append((b"content-encoding", encoding.encode()))
+    return headers
+
+
+class CachedResponse:
+    __slots__ = ("status", "headers", "body", "route", "variants", "expires_at")
+
+    def __init__(self, status: int, headers, body: bytes, route, ttl: float):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.route = route
+        self.variants: Dict[str, bytes] = {}
+        self.expires_at = time.monotonic() + ttl
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(variant) for variant in self.variants.values())
+
+
+class ResponseCache:
+    """LRU of encoded GET responses with their compressed variants, bounded by total bytes."""
+
+    def __init__(self, paths=RESPONSE_CACHE_PATHS, ttl: float = RESPONSE_CACHE_TTL_SECONDS,
+                 max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.paths = paths
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.generation = 0
+        self.bytes = 0
+        self._entries: "OrderedDict[tuple, CachedResponse]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def covers(self, path: str) -> bool:
+        return path in self.paths
+
+    def get(self, key) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None or entry.expires_at <= time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            metrics.RESPONSE_CACHE_REQUESTS.labels("miss").inc()
+            return None
+        self._entries.move_to_end(key)
+        metrics.RESPONSE_CACHE_REQUESTS.labels("hit").inc()
+        return entry
+
+    def put(self, key, entry: CachedResponse, generation: int):
+        """Store ``entry`` unless something was written since ``generation`` was read."""
+        if generation != self.generation or entry.size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        self._grow(entry.size)
+
+    def variant(self, key, entry: CachedResponse, encoding: str) -> bytes:
+        """``entry.body`` compressed with ``encoding``, compressed at most once per entry."""
+        compressed = entry.variants.get(encoding)
+        if compressed is None:
+            compressed = entry.variants[encoding] = compress(entry.body, encoding)
+            if self._entries.get(key) is entry:
+                self._grow(len(compressed))
+        return compressed
+
+    def _grow(self, size: int):
+        self.bytes += size
+        while self.bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+        metrics.RESPONSE_CACHE_BYTES.set(self.bytes)
+
+    def _remove(self, key):
+        self.bytes -= self._entries.pop(key).size
+        metrics.RESPONSE_CACHE_BYTES.set(self.bytes)
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
+        self.bytes = 0
+        metrics.RESPONSE_CACHE_BYTES.set(0)
+
+    def on_change(self, event):
+        """``Storage.watch`` listener: any write may change a cached response."""
+        self.clear()
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses and serving cached ones."""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES, cache: Optional[ResponseCache] = None):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.cache = cache
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = b", ".join(value for name, value in scope["headers"] if name == b"accept-encoding")
+        encoding = negotiate(accept.decode("latin-1"))
+        cache = self.cache if self.cache is not None and scope["method"] == "GET" \
+            and self.cache.covers(scope["path"]) else None
+        key = (scope["path"], scope.get("query_string", b""))
+        if cache is not None:
+            entry = cache.get(key)
+            if entry is not None:
+                # Lets the metrics middleware label the hit with its route
+                scope["route"] = entry.route
+                await self._send_entry(send, key, entry, encoding)
+                return
+        generation = cache.generation if cache is not None else 0
+
+        start = None
+        stream: Optional[StreamCompressor] = None
+
+        async def send_compressed(message):
+            nonlocal start, stream
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if stream is not None and message["type"] == "http.response.body":
+                body = message.get("body", b"")
+                data = stream.chunk(body) if body else b""
+                if not message.get("more_body", False):
+                    data += stream.finish()
+                await send({**message, "body": data})
+                return
+            if start is None or message["type"] != "http.response.body":
+                await send(message)
+                return
+            body = message.get("body", b"")
+            response_start, start = start, None
+            headers = list(response_start.get("headers", []))
+            if message.get("more_body", False):
+                # Streamed: the length is unknown, so compress whenever the client allows it
+                if encoding and compressible(headers):
+                    stream = StreamCompressor(encoding)
+                    headers = with_body_headers(headers, None, encoding)
+                    body = stream.chunk(body)
+                await send({**response_start, "headers": headers})
+                await send({**message, "body": body})
+                return
+            if cache is not None and response_start["status"] == 200 and not _no_store(headers):
+                entry = CachedResponse(response_start["status"], headers, body, scope.get("route"), cache.ttl)
+                cache.put(key, entry, generation)
+                await self._send_entry(send, key, entry, encoding)
+                return
+            chosen = encoding if encoding and len(body) >= self.minimum_size and compressible(headers) else None
+            if chosen:
+                body = compress(body, chosen)
+                headers = with_body_headers(headers, len(body), chosen)
+            await send({**response_start, "headers": headers})
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+    async def _send_entry(self, send, key, entry: CachedResponse, encoding: Optional[str]):
+        body, chosen = entry.body, None
+        if encoding and len(entry.body) >= self.minimum_size and compressible(entry.headers):
+            body, chosen = self.cache.variant(key, entry, encoding), encoding
+        await send({"type": "http.response.start", "status": entry.status,
+                    "headers": with_body_headers(entry.headers, len(body), chosen)})
+        await send({"type": "http.response.body", "body": body})
+
+
+def _no_store(headers: List[Tuple[bytes, bytes]]) -> bool:
+    return any(name == b"cache-control" and b"no-store" in value for name, value in headers)
@@ -0,0 +1,217 @@
+"""Idempotency keys for POST endpoints that create things.
+
+A client that retries ``POST /api/tasks`` after a timeout cannot tell
+whether the first attempt went through, and a second execution creates a
+duplicate and increments the project's ``task_count`` again. Routes marked
+with ``idempotent`` accept an ``Idempotency-Key`` header: the first request
+with a key claims it in ``idempotency_keys`` and its response is stored
+there; a retry with the same key and the same request gets that response
+replayed (with ``Idempotent-Replayed: true``) instead of running again.
+
+- The same key with a different method, path or body is rejected with 422.
+- A retry while the first request is still running gets 409 with
+  ``Retry-After``. Claims of requests that died mid-flight are taken over
+  after ``IDEMPOTENCY_LOCK_SECONDS``.
+- Responses with a 5xx status are not stored; the claim is released so the
+  retry runs again.
+- Bodies over ``IDEMPOTENCY_MAX_BODY_BYTES``, or ones that fail to store,
+  are not kept: the key is still marked completed so the request never runs
+  twice, and a retry gets 409 saying the response is unavailable.
+- Keys expire after ``IDEMPOTENCY_TTL`` through a TTL index. Expired keys
+  that the TTL monitor has not removed yet are treated as unused.
+"""
+import hashlib
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional, Pattern, Tuple
+
+from fastapi.responses import JSONResponse
+from pymongo.errors import DuplicateKeyError
+
+IDEMPOTENCY_TTL = timedelta(hours=24)  # The TTL of idempotency_keys in storage.INDEXES
+IDEMPOTENCY_LOCK_SECONDS = float(os.environ.get('IDEMPOTENCY_LOCK_SECONDS', '60'))
+IDEMPOTENCY_RETRY_AFTER_SECONDS = int(os.environ.get('IDEMPOTENCY_RETRY_AFTER_SECONDS', '1'))
+IDEMPOTENCY_MAX_BODY_BYTES = int(os.environ.get('IDEMPOTENCY_MAX_BODY_BYTES', str(1024 * 1024)))
+MAX_KEY_LENGTH = 255
+
+KEYS = "idempotency_keys"
+HEADER = b"idempotency-key"
+REPLAYED_HEADER = (b"idempotent-replayed", b"true")
+
+logger = logging.getLogger(__name__)
+
+
+def idempotent(function):
+    """Route decorator: the route honours ``Idempotency-Key`` (see ``IdempotencyMiddleware``)."""
+    function.idempotent = True
+    return function
+
+
+def fingerprint(method: str, path: str, query: bytes, body: bytes) -> str:
+    digest = hashlib.sha256()
+    for part in (method.encode(), path.encode(), query, body):
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+async def claim(db, key: str, request_fingerprint: str) -> Tuple[Optional[str], Optional[dict]]:
+    """Claim ``key``: ``(claim_id, None)``, or ``(None, record)`` when taken (record None if just released)."""
+    now = datetime.utcnow()
+    claimed = {
+        "fingerprint": request_fingerprint,
+        "state": "in_progress",
+        "claim_id": str(uuid.uuid4()),
+        "locked_until": now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+        "created_at": now,
+        "response": None,
+    }
+    for attempt in range(2):
+        try:
+            await db[KEYS].insert_one({"key": key, **claimed})
+            return claimed["claim_id"], None
+        except DuplicateKeyError:
+            existing = await db[KEYS].find_one({"key": key}, {"_id": 0})
+        # None means it was released in between; one more attempt is enough since releases are rare
+        if existing is not None:
+            break
+    if existing is None:
+        return None, None
+    expired = existing["created_at"] <= now - IDEMPOTENCY_TTL
+    abandoned = existing["state"] == "in_progress" and existing["locked_until"] <= now
+    if not (expired or abandoned):
+        return None, existing
+    # Take over only if nobody else did since it was read
+    taken = await db[KEYS].find_one_and_update({"key": key, "claim_id": existing["claim_id"]}, {"$set": claimed})
+    if taken is None:
+        return None, await db[KEYS].find_one({"key": key}, {"_id": 0})
+    return claimed["claim_id"], None
+
+
+async def complete(db, key: str, claim_id: str, status: int, headers: List[List[str]], body: Optional[bytes]):
+    """Mark the claim completed; ``body`` None records that the response was not kept."""
+    await db[KEYS].update_one(
+        {"key": key, "claim_id": claim_id},
+        {"$set": {"state": "completed", "response": {"status": status, "headers": headers, "body": body}}},
+    )
+
+
+async def release(db, key: str, claim_id: str):
+    await db[KEYS].delete_one({"key": key, "claim_id": claim_id})
+
+
+def _error(status: int, detail: str, headers: Optional[dict] = None) -> JSONResponse:
+    return JSONResponse({"detail": detail}, status_code=status, headers=headers)
+
+
+class IdempotencyMiddleware:
+    """ASGI middleware storing and replaying responses of ``idempotent`` routes."""
+
+    def __init__(self, app, get_storage):
+        self.app = app
+        self.get_storage = get_storage
+        self._patterns: Optional[List[Pattern]] = None
+
+    def _covers(self, scope) -> bool:
+        if self._patterns is None:
+            self._patterns = [
+                route.path_regex for route in scope["app"].routes
+                if getattr(getattr(route, "endpoint", None), "idempotent", False) and "POST" in route.methods
+            ]
+        return any(pattern.match(scope["path"]) for pattern in self._patterns)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+        keys = [value for name, value in scope["headers"] if name == HEADER]
+        if not keys or not self._covers(scope):
+            await self.app(scope, receive, send)
+            return
+        key = keys[0].decode("latin-1").strip()
+        if not key or len(key) > MAX_KEY_LENGTH:
+            await _error(400, f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters")(scope, receive, send)
+            return
+
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks)
+
+        db = self.get_storage()
+        request_fingerprint = fingerprint(scope["method"], scope["path"], scope.get("query_string", b""), body)
+        claim_id, existing = await claim(db, key, request_fingerprint)
+        if claim_id is None:
+            if existing is not None and existing["fingerprint"] != request_fingerprint:
+                response = _error(422, "Idempotency-Key was already used for a different request")
+            elif existing is None or existing["state"] != "completed":
+                response = _error(409, "A request with this Idempotency-Key is still in progress",
+                                  {"Retry-After": str(IDEMPOTENCY_RETRY_AFTER_SECONDS)})
+            elif existing["response"]["body"] is None:
+                response = _error(409, "The request with this Idempotency-Key completed; its response was not kept")
+            else:
+                await self._replay(send, existing["response"])
+                return
+            await response(scope, receive, send)
+            return
+
+        replayed = False
+
+        async def receive_body():
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        status, headers, sent, size = 500, [], [], 0
+
+        async def record(message):
+            nonlocal status, headers, sent, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = [[name.decode("latin-1"), value.decode("latin-1")] for name, value in message["headers"]]
+            elif message["type"] == "http.response.body" and sent is not None:
+                chunk = message.get("body", b"")
+                size += len(chunk)
+                if size > IDEMPOTENCY_MAX_BODY_BYTES:
+                    sent = None  # Too large to keep; stop buffering
+                else:
+                    sent.append(chunk)
+            await send(message)
+
+        try:
+            await self.app(scope, receive_body, record)
+        except BaseException:
+            await release(db, key, claim_id)
+            raise
+        if status >= 500:
+            await release(db, key, claim_id)
+            return
+        body = b"".join(sent) if sent is not None else None
+        try:
+            await complete(db, key, claim_id, status, headers, body)
+        except Exception:
+            if body is None:
+                # Left in progress; a retry after the lock window runs the request again
+                logger.exception("Could not complete Idempotency-Key %r", key)
+                return
+            logger.exception("Could not store the response for Idempotency-Key %r; keeping the key only", key)
+            try:
+                await complete(db, key, claim_id, status, headers, None)
+            except Exception:
+                logger.exception("Could not complete Idempotency-Key %r", key)
+
+    @staticmethod
+    async def _replay(send, response: dict):
+        headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in response["headers"]]
+        await send({"type": "http.response.start", "status": response["status"],
+                    "headers": headers + [REPLAYED_HEADER]})
+        await send({"type": "http.response.body", "body": bytes(response["body"])})
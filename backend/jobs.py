@@ -0,0 +1,241 @@
+"""Durable background jobs backed by the ``jobs`` collection.
+
+Handlers are registered per job kind with ``JobQueue.handler``; ``enqueue``
+stores a job and wakes the local workers. Each worker claims a due job
+atomically with ``find_one_and_update`` and holds a lease it renews while
+the handler runs, so several API processes can share the queue and jobs
+whose worker died are picked up again once the lease expires; a worker
+that finds its lease taken over cancels its handler. Failed jobs are
+retried with exponential backoff up to ``max_attempts``.
+"""
+import asyncio
+import logging
+import os
+import socket
+import traceback
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', '60'))
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', '1'))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '5'))
+JOB_RETRY_BASE_SECONDS = float(os.environ.get('JOB_RETRY_BASE_SECONDS', '2'))
+JOB_RETRY_MAX_SECONDS = 300.0
+
+FINISHED_STATES = ("succeeded", "failed")
+UNFINISHED_STATES = ("queued", "running")  # Unique per dedupe_key, see storage.INDEXES
+
+
+def retry_delay(attempts: int) -> float:
+    return min(JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1), JOB_RETRY_MAX_SECONDS)
+
+
+class LeaseLost(Exception):
+    """Another worker took over the job after our lease expired."""
+
+
+class JobContext:
+    """Handed to job handlers for progress reporting and lease renewal."""
+
+    def __init__(self, queue: "JobQueue", job: dict):
+        self.queue = queue
+        self.job = job
+
+    @property
+    def id(self) -> str:
+        return self.job["id"]
+
+    async def report(self, **progress):
+        """Store progress and extend the lease; raises ``LeaseLost`` if it expired."""
+        await self.queue._renew(self.job, {f"progress.{key}": value for key, value in progress.items()})
+
+
+Handler = Callable[[JobContext, dict], Awaitable[Optional[dict]]]
+
+
+class JobQueue:
+    def __init__(self, get_storage, concurrency: int = JOB_WORKERS, lease_seconds: float = JOB_LEASE_SECONDS,
+                 poll_seconds: float = JOB_POLL_SECONDS):
+        self.get_storage = get_storage
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.handlers: Dict[str, Handler] = {}
+        self._workers: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def handler(self, kind: str):
+        def register(fn: Handler) -> Handler:
+            self.handlers[kind] = fn
+            return fn
+        return register
+
+    async def enqueue(self, kind: str, payload: Optional[dict] = None, max_attempts: int = JOB_MAX_ATTEMPTS,
+                      delay_seconds: float = 0, dedupe_key: Optional[str] = None) -> dict:
+        """Store a job; with ``dedupe_key`` an unfinished job with the same key is returned instead."""
+        if kind not in self.handlers:
+            raise ValueError(f"No handler registered for job kind '{kind}'")
+        db = self.get_storage()
+        unfinished = {"dedupe_key": dedupe_key, "status": {"$in": list(UNFINISHED_STATES)}}
+        if dedupe_key:
+            existing = await db.jobs.find_one(unfinished, {"_id": 0})
+            if existing:
+                return existing
+        now = datetime.utcnow()
+        job = {
+            "id": str(uuid.uuid4()),
+            "kind": kind,
+            "payload": payload or {},
+            "status": "queued",
+            "attempts": 0,
+            "max_attempts": max_attempts,
+            "run_at": now + timedelta(seconds=delay_seconds),
+            "dedupe_key": dedupe_key,
+            "lease_owner": None,
+            "lease_expires_at": None,
+            "progress": {},
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+            "started_at": None,
+            "finished_at": None,
+        }
+        try:
+            await db.jobs.insert_one(job)
+        except DuplicateKeyError:
+            # Another process enqueued the same key since the lookup
+            existing = await db.jobs.find_one(unfinished, {"_id": 0}) if dedupe_key else None
+            if existing is None:
+                raise
+            return existing
+        job.pop("_id", None)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await self.get_storage().jobs.find_one({"id": job_id}, {"_id": 0})
+
+    # Worker pool
+
+    async def start(self):
+        if self._workers or self.concurrency <= 0:
+            return
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.create_task(self._worker(n)) for n in range(self.concurrency)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _worker(self, number: int):
+        while True:
+            try:
+                job = await self._claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Job worker %s failed to claim a job", number)
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _claim(self) -> Optional[dict]:
+        now = datetime.utcnow()
+        return await self.get_storage().jobs.find_one_and_update(
+            {
+                "kind": {"$in": list(self.handlers)},
+                "$or": [
+                    {"status": "queued", "run_at": {"$lte": now}},
+                    {"status": "running", "lease_expires_at": {"$lt": now}},
+                ],
+            },
+            {
+                "$set": {
+                    "status": "running",
+                    "lease_owner": self.worker_id,
+                    "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+                    "started_at": now,
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            projection={"_id": 0},
+            sort=[("run_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _renew(self, job: dict, fields: Optional[dict] = None):
+        now = datetime.utcnow()
+        result = await self.get_storage().jobs.update_one(
+            {"id": job["id"], "lease_owner": self.worker_id, "status": "running"},
+            {"$set": {"lease_expires_at": now + timedelta(seconds=self.lease_seconds), "updated_at": now,
+                      **(fields or {})}},
+        )
+        if not result.matched_count:
+            raise LeaseLost(job["id"])
+
+    async def _heartbeat(self, job: dict, work: asyncio.Task):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await self._renew(job)
+            except LeaseLost:
+                # Another worker runs the job now; stop ours instead of running it twice
+                work.cancel()
+                return
+
+    async def _finish(self, job: dict, fields: dict):
+        fields["updated_at"] = datetime.utcnow()
+        fields["lease_owner"] = None
+        fields["lease_expires_at"] = None
+        await self.get_storage().jobs.update_one(
+            {"id": job["id"], "lease_owner": self.worker_id}, {"$set": fields}
+        )
+
+    async def _run(self, job: dict):
+        work = asyncio.create_task(self.handlers[job["kind"]](JobContext(self, job), job["payload"]))
+        heartbeat = asyncio.create_task(self._heartbeat(job, work))
+        try:
+            result = await work
+        except asyncio.CancelledError:
+            if not (heartbeat.done() and not heartbeat.cancelled() and heartbeat.exception() is None):
+                # Shutting down: the lease expires and another worker resumes the job
+                raise
+            logger.warning("Lost lease on job %s; cancelled its handler", job["id"])
+        except LeaseLost:
+            logger.warning("Lost lease on job %s; another worker took it over", job["id"])
+        except Exception as e:
+            error = {"message": str(e) or type(e).__name__, "traceback": traceback.format_exc(limit=10)}
+            if job["attempts"] < job["max_attempts"]:
+                delay = retry_delay(job["attempts"])
+                logger.warning("Job %s (%s) failed, retrying in %.0fs: %s", job["id"], job["kind"], delay, e)
+                await self._finish(job, {
+                    "status": "queued",
+                    "run_at": datetime.utcnow() + timedelta(seconds=delay),
+                    "error": error,
+                })
+            else:
+                logger.error("Job %s (%s) failed permanently: %s", job["id"], job["kind"], e)
+                await self._finish(job, {"status": "failed", "error": error, "finished_at": datetime.utcnow()})
+        else:
+            await self._finish(job, {"status": "succeeded", "result": result, "finished_at": datetime.utcnow()})
+        finally:
+            heartbeat.cancel()
@@ -0,0 +1,219 @@
+"""Request and MongoDB instrumentation exposed in Prometheus format.
+
+``record_request`` (installed as HTTP middleware) times every request and
+attributes the MongoDB commands issued while serving it, which
+``CommandMetrics`` observes through pymongo's command monitoring. Motor runs
+commands on executor threads with the caller's context copied, so the
+per-request ``RequestStats`` is found through a context variable.
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from pymongo import monitoring
+
+logger = logging.getLogger("gtd.requests")
+
+# Requests slower than this are logged as structured JSON; 0 disables the log
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', '0'))
+
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+DOCUMENT_BUCKETS = (0, 1, 10, 50, 100, 500, 1000, 5000, 10000)
+BYTE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Request latency by route", ["method", "route"]
+)
+REQUESTS = Counter(
+    "http_requests_total", "Requests by route and status code", ["method", "route", "status"]
+)
+REQUEST_DB_COMMANDS = Histogram(
+    "http_request_db_commands", "MongoDB commands issued per request", ["method", "route"],
+    buckets=COUNT_BUCKETS,
+)
+REQUEST_DB_SECONDS = Histogram(
+    "http_request_db_seconds", "Time spent in MongoDB commands per request", ["method", "route"]
+)
+REQUEST_DB_DOCUMENTS = Histogram(
+    "http_request_db_documents", "Documents returned by MongoDB per request", ["method", "route"],
+    buckets=DOCUMENT_BUCKETS,
+)
+RESPONSE_BYTES = Histogram(
+    "http_response_bytes", "Response payload size", ["method", "route"], buckets=BYTE_BUCKETS
+)
+DB_COMMAND_LATENCY = Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency", ["command"]
+)
+DB_COMMAND_FAILURES = Counter(
+    "mongodb_command_failures_total", "Failed MongoDB commands", ["command"]
+)
+
+# Write-behind buffers (see write_behind.py)
+WRITE_BEHIND_FLUSH_LAG = Histogram(
+    "write_behind_flush_lag_seconds", "Age of the oldest buffered change when it was flushed", ["buffer"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30),
+)
+WRITE_BEHIND_FLUSH_SIZE = Histogram(
+    "write_behind_flush_documents", "Documents written per flush", ["buffer"], buckets=DOCUMENT_BUCKETS
+)
+WRITE_BEHIND_COALESCED = Counter(
+    "write_behind_coalesced_total", "Buffered changes merged into an already pending write", ["buffer"]
+)
+WRITE_BEHIND_FAILURES = Counter(
+    "write_behind_flush_failures_total", "Flushes that failed and were requeued", ["buffer"]
+)
+WRITE_BEHIND_PENDING = Gauge(
+    "write_behind_pending_documents", "Documents with buffered changes", ["buffer"]
+)
+
+# Single-flight coalescing (see singleflight.py)
+SINGLE_FLIGHT_CALLS = Counter(
+    "single_flight_calls_total", "Computations started for coalesced routes", ["route"]
+)
+SINGLE_FLIGHT_COALESCED = Counter(
+    "single_flight_coalesced_total", "Requests that joined an in-flight computation", ["route"]
+)
+SINGLE_FLIGHT_WAITING = Gauge(
+    "single_flight_waiting_requests", "Requests awaiting a coalesced computation", ["route"]
+)
+
+# Admission control (see admission.py); the "in_flight" limiter is the global shedding bound
+ADMISSION_ACTIVE = Gauge(
+    "admission_active_requests", "Requests holding an admission slot", ["limiter"]
+)
+ADMISSION_QUEUED = Gauge(
+    "admission_queued_requests", "Requests waiting for an admission slot", ["limiter"]
+)
+ADMISSION_WAIT = Histogram(
+    "admission_wait_seconds", "Time spent queued before admission", ["limiter"],
+    buckets=(0, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5),
+)
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_total", "Requests answered 503 by admission control", ["limiter", "reason"]
+)
+
+# Response compression and the response cache (see compression.py)
+COMPRESSION_INPUT_BYTES = Counter(
+    "compression_input_bytes_total", "Response bytes before compression", ["encoding"]
+)
+COMPRESSION_OUTPUT_BYTES = Counter(
+    "compression_output_bytes_total", "Response bytes after compression", ["encoding"]
+)
+COMPRESSION_CPU_SECONDS = Counter(
+    "compression_cpu_seconds_total", "CPU time spent compressing responses", ["encoding"]
+)
+RESPONSE_CACHE_REQUESTS = Counter(
+    "response_cache_requests_total", "Cacheable requests by cache result", ["result"]
+)
+RESPONSE_CACHE_BYTES = Gauge(
+    "response_cache_bytes", "Bytes held by cached responses and their compressed variants"
+)
+
+
+class RequestStats:
+    """Database work attributed to a single request."""
+
+    __slots__ = ("commands", "db_seconds", "documents", "_lock")
+
+    def __init__(self):
+        self.commands = 0
+        self.db_seconds = 0.0
+        self.documents = 0
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float, documents: int):
+        with self._lock:
+            self.commands += 1
+            self.db_seconds += seconds
+            self.documents += documents
+
+
+current_request: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar(
+    "current_request", default=None
+)
+
+
+def _returned_documents(reply) -> int:
+    cursor = reply.get("cursor") if isinstance(reply, dict) else None
+    if isinstance(cursor, dict):
+        batch = cursor.get("firstBatch", cursor.get("nextBatch", []))
+        return len(batch)
+    return 0
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """pymongo command listener feeding the MongoDB histograms."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        seconds = event.duration_micros / 1e6
+        DB_COMMAND_LATENCY.labels(event.command_name).observe(seconds)
+        stats = current_request.get()
+        if stats is not None:
+            stats.add(seconds, _returned_documents(event.reply))
+
+    def failed(self, event):
+        seconds = event.duration_micros / 1e6
+        DB_COMMAND_LATENCY.labels(event.command_name).observe(seconds)
+        DB_COMMAND_FAILURES.labels(event.command_name).inc()
+        stats = current_request.get()
+        if stats is not None:
+            stats.add(seconds, 0)
+
+
+command_listener = CommandMetrics()
+
+
+def route_label(request) -> str:
+    """The route template, so ``/api/tasks/{task_id}`` is one series."""
+    route = request.scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+async def record_request(request, call_next):
+    stats = RequestStats()
+    token = current_request.set(stats)
+    started = time.perf_counter()
+    status = 500
+    response = None
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - started
+        current_request.reset(token)
+        method, route = request.method, route_label(request)
+        REQUEST_LATENCY.labels(method, route).observe(elapsed)
+        REQUESTS.labels(method, route, str(status)).inc()
+        REQUEST_DB_COMMANDS.labels(method, route).observe(stats.commands)
+        REQUEST_DB_SECONDS.labels(method, route).observe(stats.db_seconds)
+        REQUEST_DB_DOCUMENTS.labels(method, route).observe(stats.documents)
+        length = response.headers.get("content-length") if response is not None else None
+        if length is not None:
+            RESPONSE_BYTES.labels(method, route).observe(int(length))
+        if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+            logger.warning(json.dumps({
+                "event": "slow_request",
+                "method": method,
+                "route": route,
+                "path": request.url.path,
+                "status": status,
+                "duration_ms": round(elapsed * 1000, 2),
+                "db_commands": stats.commands,
+                "db_ms": round(stats.db_seconds * 1000, 2),
+                "db_documents": stats.documents,
+                "response_bytes": int(length) if length is not None else None,
+            }))
+
+
+def render_metrics():
+    """Prometheus exposition body and content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Data migrations, run from the command line or as background jobs.
+
+    python backend/migrations.py list
+    python backend/migrations.py time-entries-timeseries --batch-size 500
+
+Every migration is idempotent and works in batches, so it can be stopped
+and rerun at any point. A finished run is recorded in the ``migrations``
+collection; on startup only unrecorded migrations are enqueued, so booting
+costs one indexed read rather than a scan per migration.
+"""
+import argparse
+import asyncio
+import json
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable, NamedTuple
+
+ROOT_DIR = Path(__file__).parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from dotenv import load_dotenv  # noqa: E402
+
+import archive  # noqa: E402
+import schema  # noqa: E402
+import time_entries  # noqa: E402
+from storage import create_storage  # noqa: E402
+
+BATCH_SIZE = 1000
+
+
+class Migration(NamedTuple):
+    description: str
+    # async (db, batch_size, report=None) -> summary dict
+    run: Callable[..., Awaitable[dict]]
+    # () -> whether the migration applies to this deployment; disabled ones are not enqueued on startup
+    enabled: Callable[[], bool] = lambda: True
+
+
+APPLIED = "migrations"
+
+
+async def _time_entries_timeseries(db, batch_size, report=None):
+    await time_entries.ensure_storage(db)
+    return await time_entries.migrate_to_timeseries(db, batch_size=batch_size, report=report)
+
+
+# Archival may move tasks before this migration reaches them, so the archive is migrated too
+TIME_SUMMARY_COLLECTIONS = ("tasks", archive.ARCHIVED)
+
+
+async def _task_time_summary(db, batch_size, report=None):
+    summary = {"tasks": 0, "copied_entries": 0}
+    for collection in TIME_SUMMARY_COLLECTIONS:
+        result = await time_entries.embed_rollups(db, batch_size=batch_size, report=report, collection=collection)
+        summary = {key: summary[key] + result[key] for key in summary}
+    return summary
+
+
+MIGRATIONS = {
+    "time-entries-timeseries": Migration(
+        "Move finished time entries into the time-series history (needs TIME_ENTRIES_TIMESERIES=1)",
+        _time_entries_timeseries, lambda: time_entries.TIME_ENTRIES_TIMESERIES,
+    ),
+    "task-time-summary": Migration(
+        "Replace embedded Task.time_entries arrays with a time_summary rollup, archived tasks included",
+        _task_time_summary,
+    ),
+    "datetime-fields": Migration(
+        "Convert date fields stored as strings to BSON dates and stamp schema_version",
+        schema.migrate_dates,
+    ),
+}
+
+
+async def pending(db) -> list:
+    """Names of enabled migrations that have not been recorded as applied."""
+    applied = {record["name"] for record in await db[APPLIED].find({}, {"_id": 0, "name": 1}).to_list(None)}
+    return [name for name, migration in MIGRATIONS.items() if migration.enabled() and name not in applied]
+
+
+async def apply(db, name: str, batch_size: int = BATCH_SIZE, report=None) -> dict:
+    """Run a migration and record it as applied once it finishes."""
+    result = await MIGRATIONS[name].run(db, batch_size, report=report)
+    await db[APPLIED].update_one(
+        {"name": name}, {"$set": {"applied_at": datetime.utcnow(), "result": result}}, upsert=True
+    )
+    return result
+
+
+async def run(name: str, batch_size: int) -> dict:
+    db = create_storage()
+    try:
+        return await apply(db, name, batch_size)
+    finally:
+        db.close()
+
+
+def main(argv=None):
+    load_dotenv(ROOT_DIR / '.env')
+    parser = argparse.ArgumentParser(description="Run a data migration")
+    parser.add_argument("migration", choices=sorted(MIGRATIONS) + ["list"])
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+    if args.migration == "list":
+        for name, migration in sorted(MIGRATIONS.items()):
+            print(f"{name:28} {migration.description}")
+        return
+    print(json.dumps(asyncio.run(run(args.migration, args.batch_size)), indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
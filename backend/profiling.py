@@ -0,0 +1,107 @@
+"""Opt-in cProfile capture for individual requests.
+
+With ``PROFILING_ENABLED=1`` a request is profiled when it carries the
+``X-Profile: 1`` header or is picked by ``PROFILE_SAMPLE_RATE``. The
+profile is stored in the ``request_profiles`` collection so any worker can
+serve it back through the admin endpoints. When profiling is disabled the
+middleware is not installed at all.
+
+On-demand profiles and the admin endpoints require ``PROFILE_ADMIN_TOKEN``
+in the ``X-Admin-Token`` header; without a configured token they are off.
+
+cProfile hooks the whole event-loop thread, so a profile also contains
+whatever other requests ran concurrently; only one request is profiled at
+a time to keep profiles readable.
+"""
+import asyncio
+import cProfile
+import hmac
+import io
+import marshal
+import os
+import pstats
+import random
+import time
+import uuid
+from datetime import datetime
+
+from bson import Binary
+
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '').lower() in ('1', 'true', 'yes')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_ADMIN_TOKEN = os.environ.get('PROFILE_ADMIN_TOKEN', '')
+PROFILE_TOP_FUNCTIONS = int(os.environ.get('PROFILE_TOP_FUNCTIONS', '40'))
+PROFILE_HEADER = "x-profile"
+ADMIN_TOKEN_HEADER = "x-admin-token"
+
+_profile_lock = asyncio.Lock()
+
+
+def is_authorised(request) -> bool:
+    token = request.headers.get(ADMIN_TOKEN_HEADER, "")
+    return bool(PROFILE_ADMIN_TOKEN) and hmac.compare_digest(token.encode(), PROFILE_ADMIN_TOKEN.encode())
+
+
+def should_profile(request) -> bool:
+    if request.headers.get(PROFILE_HEADER) == "1":
+        return is_authorised(request)
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def summarise(profiler: cProfile.Profile, limit: int = PROFILE_TOP_FUNCTIONS) -> dict:
+    """Readable report and the top functions by cumulative time."""
+    output = io.StringIO()
+    stats = pstats.Stats(profiler, stream=output)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+    top = []
+    for (filename, line, function), (_, ncalls, tottime, cumtime, _) in sorted(
+        stats.stats.items(), key=lambda item: item[1][3], reverse=True
+    )[:limit]:
+        top.append({
+            "function": function,
+            "file": filename,
+            "line": line,
+            "ncalls": ncalls,
+            "tottime_ms": round(tottime * 1000, 3),
+            "cumtime_ms": round(cumtime * 1000, 3),
+        })
+    return {"report": output.getvalue(), "top_functions": top}
+
+
+def profile_middleware(get_storage):
+    """HTTP middleware storing profiles through ``get_storage()``."""
+
+    async def profile_request(request, call_next):
+        if not should_profile(request) or _profile_lock.locked():
+            return await call_next(request)
+        async with _profile_lock:
+            profiler = cProfile.Profile()
+            started = time.perf_counter()
+            profiler.enable()
+            try:
+                response = await call_next(request)
+            finally:
+                profiler.disable()
+            elapsed = time.perf_counter() - started
+
+        profiler.create_stats()
+        profile_id = str(uuid.uuid4())
+        route = request.scope.get("route")
+        document = {
+            "id": profile_id,
+            "method": request.method,
+            "path": request.url.path,
+            "query": request.url.query,
+            "route": getattr(route, "path", None),
+            "status": response.status_code,
+            "duration_ms": round(elapsed * 1000, 3),
+            "trigger": "header" if request.headers.get(PROFILE_HEADER) == "1" else "sample",
+            "created_at": datetime.utcnow(),
+            "raw": Binary(marshal.dumps(profiler.stats)),
+            **summarise(profiler),
+        }
+        await get_storage().request_profiles.insert_one(document)
+        response.headers["X-Profile-Id"] = profile_id
+        return response
+
+    return profile_request
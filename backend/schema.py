@@ -0,0 +1,146 @@
+"""Canonical field types for stored documents.
+
+Date fields are stored as BSON dates (naive UTC datetimes), so range
+filters such as ``{"deadline": {"$lt": now}}`` compare like with like and
+can use the indexes. Older code paths wrote some of them as ISO strings.
+
+``guard`` is registered as a storage write guard on startup: it converts
+date fields in every written document or ``$set``-style operand, rejects
+values that are not dates with ``InvalidDate``, and stamps inserted and
+replaced documents with ``SCHEMA_VERSION``. ``migrate_dates`` brings
+existing documents to the same shape, batch by batch.
+"""
+from datetime import date, datetime, timezone
+from typing import Awaitable, Callable, Dict, FrozenSet, Optional
+
+from pymongo import ASCENDING
+
+from storage import UpdateOne
+
+SCHEMA_VERSION = 1
+MIGRATION_BATCH_SIZE = 1000
+INVALID_SAMPLES = 20
+
+_TASK_DATES = frozenset({
+    "deadline", "next_due_date", "created_at", "updated_at", "completed_at", "started_at",
+    "time_summary.last_entry_at",
+})
+DATE_FIELDS: Dict[str, FrozenSet[str]] = {
+    "tasks": _TASK_DATES,
+    "archived_tasks": _TASK_DATES | {"archived_at"},
+    "projects": frozenset({
+        "deadline", "created_at", "updated_at", "deleted_at",
+        "deletion.started_at", "deletion.updated_at", "deletion.completed_at",
+    }),
+    "time_entries": frozenset({"start_time", "end_time"}),
+    "comments": frozenset({"created_at", "updated_at"}),
+    "task_templates": frozenset({"created_at", "updated_at"}),
+}
+# Parents of nested date fields, so sub-documents written whole are checked too
+_PARENTS = {
+    collection: {field.rsplit(".", 1)[0] for field in fields if "." in field}
+    for collection, fields in DATE_FIELDS.items()
+}
+
+
+class InvalidDate(ValueError):
+    def __init__(self, collection: str, field: str, value):
+        super().__init__(f"{collection}.{field} is not a date: {value!r}")
+        self.collection = collection
+        self.field = field
+        self.value = value
+
+
+def to_datetime(value) -> Optional[datetime]:
+    """``value`` as a naive UTC datetime; raises ``ValueError`` when it is not date-like."""
+    if value is None or isinstance(value, datetime):
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    if isinstance(value, str):
+        return to_datetime(datetime.fromisoformat(value.strip().replace('Z', '+00:00')))
+    raise ValueError(f"not a date: {value!r}")
+
+
+def _canonicalise(collection: str, fields: dict, prefix: str = ""):
+    dates = DATE_FIELDS[collection]
+    for key, value in fields.items():
+        path = prefix + key
+        if path in dates:
+            if value is not None and not (isinstance(value, datetime) and value.tzinfo is None):
+                try:
+                    fields[key] = to_datetime(value)
+                except ValueError:
+                    raise InvalidDate(collection, path, value) from None
+        elif path in _PARENTS[collection] and isinstance(value, dict):
+            _canonicalise(collection, value, path + ".")
+
+
+def guard(collection: str, fields: dict, whole: bool):
+    if collection not in DATE_FIELDS:
+        return
+    _canonicalise(collection, fields)
+    if whole:
+        fields["schema_version"] = SCHEMA_VERSION
+
+
+def _projection(collection: str) -> dict:
+    return {"_id": 1, "id": 1, **{field.split(".")[0]: 1 for field in DATE_FIELDS[collection]}}
+
+
+def _lookup(document: dict, path: str):
+    for part in path.split("."):
+        if not isinstance(document, dict) or part not in document:
+            return None
+        document = document[part]
+    return document
+
+
+async def migrate_dates(db, batch_size: int = MIGRATION_BATCH_SIZE,
+                        report: Optional[Callable[..., Awaitable[None]]] = None) -> dict:
+    """Convert date fields of documents below ``SCHEMA_VERSION`` and stamp the version.
+
+    Values that cannot be read as dates are set to null, kept under
+    ``schema_invalid`` on the document and sampled in the result, so the
+    scan always terminates and nothing is silently lost.
+    """
+    summary = {}
+    for collection in DATE_FIELDS:
+        counts = summary[collection] = {"scanned": 0, "converted": 0, "invalid": 0, "invalid_samples": []}
+        last_id = None
+        while True:
+            query = {"schema_version": {"$ne": SCHEMA_VERSION}}
+            if last_id is not None:
+                query["_id"] = {"$gt": last_id}
+            batch = await db[collection].find(query, _projection(collection)).sort(
+                "_id", ASCENDING
+            ).limit(batch_size).to_list(batch_size)
+            if not batch:
+                break
+            requests = []
+            for document in batch:
+                changes, invalid = {"schema_version": SCHEMA_VERSION}, {}
+                for field in DATE_FIELDS[collection]:
+                    value = _lookup(document, field)
+                    if value is None or (isinstance(value, datetime) and value.tzinfo is None):
+                        continue
+                    try:
+                        changes[field] = to_datetime(value)
+                        counts["converted"] += 1
+                    except ValueError:
+                        changes[field] = None
+                        invalid[field] = value
+                if invalid:
+                    changes.update({f"schema_invalid.{field}": value for field, value in invalid.items()})
+                    counts["invalid"] += len(invalid)
+                    if len(counts["invalid_samples"]) < INVALID_SAMPLES:
+                        counts["invalid_samples"].append({"id": document.get("id"), "fields": invalid})
+                requests.append(UpdateOne({"_id": document["_id"]}, {"$set": changes}))
+            await db[collection].bulk_write(requests, ordered=False)
+            counts["scanned"] += len(batch)
+            last_id = batch[-1]["_id"]
+            if report:
+                await report(collection=collection, **{k: v for k, v in counts.items() if k != "invalid_samples"})
+    return summary
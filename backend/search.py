@@ -0,0 +1,132 @@
+"""Full-text search across tasks, comments and templates.
+
+Each collection has a text index (see ``storage.INDEXES``); results from
+the three are ranked by text score, merged and paginated. Comments are
+filtered by project and status through the task they belong to; only the
+``SEARCH_MAX_FILTER_TASKS`` most recently updated tasks in that scope are
+considered. Each collection supplies a full window of ``page * page_size``
+hits for the merge, so pages stop at ``SEARCH_MAX_PAGE``.
+"""
+import asyncio
+import html
+import os
+import re
+from typing import List, Optional
+
+from storage import parse_text_search, stem
+
+SEARCH_TYPES = ("task", "comment", "template")
+SEARCH_MAX_PAGE = 50
+SEARCH_MAX_FILTER_TASKS = int(os.environ.get('SEARCH_MAX_FILTER_TASKS', '5000'))
+SNIPPET_CONTEXT = 60
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+TEXT_SCORE = {"$meta": "textScore"}
+
+
+def highlight(text: Optional[str], terms: List[str], context: int = SNIPPET_CONTEXT) -> Optional[str]:
+    """HTML-escaped snippet around the first match with matches wrapped in ``<mark>``."""
+    if not text:
+        return None
+    wanted = set(terms)
+    matches = [m for m in _WORD.finditer(text) if stem(m.group().lower()) in wanted]
+    if not matches:
+        return None
+    start = max(0, matches[0].start() - context)
+    end = min(len(text), matches[0].end() + context)
+    parts, cursor = [], start
+    for match in matches:
+        if match.start() < start or match.end() > end:
+            continue
+        parts.append(html.escape(text[cursor:match.start()]))
+        parts.append(f"<mark>{html.escape(match.group())}</mark>")
+        cursor = match.end()
+    parts.append(html.escape(text[cursor:end]))
+    return ("…" if start > 0 else "") + "".join(parts) + ("…" if end < len(text) else "")
+
+
+def _highlights(document: dict, fields: List[str], terms: List[str]) -> dict:
+    found = {}
+    for field in fields:
+        value = document.get(field)
+        if isinstance(value, list):
+            marked = [highlight(item, terms, context=len(item)) for item in value if isinstance(item, str)]
+            marked = [item for item in marked if item]
+            if marked:
+                found[field] = marked
+        else:
+            snippet = highlight(value, terms)
+            if snippet:
+                found[field] = snippet
+    return found
+
+
+async def _ranked(collection, filter: dict, projection: dict, limit: int):
+    cursor = collection.find(filter, {**projection, "_id": 0, "score": TEXT_SCORE})
+    hits = await cursor.sort([("score", TEXT_SCORE)]).limit(limit).to_list(limit)
+    total = await collection.count_documents(filter)
+    return hits, total
+
+
+async def run_search(db, query: str, project_id: Optional[str] = None, statuses: Optional[List[str]] = None,
+                     types: Optional[List[str]] = None, page: int = 1, page_size: int = 20) -> dict:
+    types = [t for t in (types or SEARCH_TYPES) if t in SEARCH_TYPES]
+    terms, _, _ = parse_text_search(query)
+    text = {"$text": {"$search": query}}
+    filtered = bool(project_id or statuses)
+    # Ranked results are merged across collections, so each must supply a full window
+    window = page * page_size
+
+    task_filter = {"is_template": {"$ne": True}}
+    if project_id:
+        task_filter["project_id"] = project_id
+    if statuses:
+        task_filter["status"] = {"$in": statuses}
+
+    searches = {}
+    if "task" in types:
+        searches["task"] = _ranked(db.tasks, {**text, **task_filter}, {
+            "id": 1, "title": 1, "description": 1, "tags": 1, "project_id": 1, "status": 1,
+            "priority": 1, "deadline": 1,
+        }, window)
+    if "comment" in types:
+        comment_filter = dict(text)
+        if filtered:
+            scope = await db.tasks.find(task_filter, {"_id": 0, "id": 1}).sort(
+                "updated_at", -1
+            ).limit(SEARCH_MAX_FILTER_TASKS).to_list(SEARCH_MAX_FILTER_TASKS)
+            comment_filter["task_id"] = {"$in": [task["id"] for task in scope]}
+        searches["comment"] = _ranked(db.comments, comment_filter, {
+            "id": 1, "task_id": 1, "author": 1, "content": 1, "created_at": 1,
+        }, window)
+    if "template" in types and not filtered:
+        # Templates have no project or status, so they only appear in unfiltered searches
+        searches["template"] = _ranked(db.task_templates, text, {
+            "id": 1, "name": 1, "priority": 1, "task_type": 1,
+        }, window)
+
+    outcomes = dict(zip(searches, await asyncio.gather(*searches.values())))
+
+    results = []
+    for kind, (hits, _) in outcomes.items():
+        for hit in hits:
+            if kind == "task":
+                hit["highlights"] = _highlights(hit, ["title", "description", "tags"], terms)
+            elif kind == "comment":
+                hit["highlights"] = _highlights(hit, ["content"], terms)
+            else:
+                hit["highlights"] = _highlights(hit, ["name"], terms)
+            hit["type"] = kind
+            results.append(hit)
+    results.sort(key=lambda hit: hit["score"], reverse=True)
+
+    counts = {kind: total for kind, (_, total) in outcomes.items()}
+    start = (page - 1) * page_size
+    return {
+        "query": query,
+        "page": page,
+        "page_size": page_size,
+        "total": sum(counts.values()),
+        "counts": counts,
+        "results": results[start:start + page_size],
+    }
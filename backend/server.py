@@ -1,12 +1,17 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import sys
+import asyncio
+import json
 import logging
+import re
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Optional
 import uuid
 from datetime import datetime, timedelta
 from enum import Enum
@@ -14,10 +19,50 @@ from enum import Enum
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Allow sibling modules to be imported when run as `backend.server`
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+import admission
+import analysis
+import archive
+import cascade
+import compression
+import idempotency
+import jobs
+import metrics
+import migrations
+import profiling
+import schema
+import search
+import singleflight
+import snapshot
+import sync
+import tags
+import task_query
+import templating
+import time_entries
+import write_behind
+from storage import create_storage
+
+# Storage backend: MongoDB by default, STORAGE_BACKEND=memory runs fully in-process
+db = create_storage(event_listeners=[metrics.command_listener])
+
+# Durable background jobs; handlers are registered next to their routes below
+job_queue = jobs.JobQueue(lambda: db)
+
+# CPU-bound analysis runs in worker processes, off the event loop
+analysis_runner = analysis.AnalysisRunner()
+
+# actual_hours increments from stopped timers, optionally coalesced (TIME_WRITE_BEHIND_MS)
+# Buffered hour updates are stamped when flushed so delta sync sees them whatever the window
+task_hours = write_behind.IncrementBuffer("task_hours", lambda: db, "tasks", stamp="updated_at")
+
+# Columnar view of open tasks for analytics, kept current from storage change events
+task_snapshot = snapshot.TaskSnapshot(lambda: db)
+
+# Hot GET responses with their compressed variants, dropped on every write
+response_cache = compression.ResponseCache()
 
 # Create the main app without a prefix
 app = FastAPI(title="GTD Task Manager API", version="2.0.0")
@@ -70,13 +115,22 @@ class TaskBase(BaseModel):
 class TaskCreate(TaskBase):
     pass
 
+class TimeSummary(BaseModel):
+    entry_count: int = 0
+    total_minutes: int = 0
+    last_entry_at: Optional[datetime] = None
+
 class Task(TaskBase):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     completed_at: Optional[datetime] = None
     started_at: Optional[datetime] = None
-    time_entries: List[dict] = []  # Track time spent on task
+    time_summary: TimeSummary = Field(default_factory=TimeSummary)  # Rollup of finished time entries
+
+class TaskDetail(Task):
+    time_entries: Optional[List[dict]] = None  # Only with include=time_entries
+    dependency_tasks: Optional[List[dict]] = None  # Only with expand=dependencies
 
 class TaskUpdate(BaseModel):
     title: Optional[str] = None
@@ -90,6 +144,25 @@ class TaskUpdate(BaseModel):
     tags: Optional[List[str]] = None
     dependencies: Optional[List[str]] = None
 
+class TaskBulkFilter(BaseModel):
+    project_id: Optional[str] = None
+    status: Optional[List[TaskStatus]] = None
+    priority: Optional[List[Priority]] = None
+    tag: Optional[List[str]] = None
+    tag_mode: str = Field("any", pattern="^(any|all)$")
+    deadline_from: Optional[datetime] = None
+    deadline_to: Optional[datetime] = None
+    task_type: Optional[str] = None
+
+class TaskBatchGet(BaseModel):
+    ids: List[str] = Field(..., max_length=int(os.environ.get('BATCH_GET_LIMIT', '500')))
+    fields: Optional[List[str]] = None  # Projection; id is always returned
+
+class TaskBulkUpdate(BaseModel):
+    ids: Optional[List[str]] = None  # Either explicit ids or a filter selects the tasks
+    filter: Optional[TaskBulkFilter] = None
+    patch: TaskUpdate
+
 # Time Tracking Models
 class TimeEntry(BaseModel):
     task_id: str
@@ -124,6 +197,13 @@ class TaskTemplateCreate(BaseModel):
     task_type: str = "general"
     tags: List[str] = []
 
+class TemplateInstantiate(BaseModel):
+    count: int = Field(1, ge=1, le=500)
+    project_id: Optional[str] = None
+    start: int = 1  # Value of {n} for the first task
+    date: Optional[datetime] = None  # Value of {date}; defaults to today
+    variables: Dict[str, str] = {}  # Custom placeholders
+
 # Comment Models
 class Comment(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -167,6 +247,9 @@ class GTDAnalysis(BaseModel):
     batched_tasks: List[List[Task]]
     suggested_dependencies: List[dict]
     focus_recommendation: str
+    critical_path: List[Task] = []  # Longest chain of open dependencies by estimated hours
+    critical_path_hours: float = 0.0
+    stale: bool = False  # True when a cached result was served because the analysis timed out
 
 # Notification Models
 class Notification(BaseModel):
@@ -180,6 +263,7 @@ class Notification(BaseModel):
 
 # Task Routes
 @api_router.post("/tasks", response_model=Task)
+@idempotency.idempotent
 async def create_task(task: TaskCreate):
     task_dict = task.dict()
     task_obj = Task(**task_dict)
@@ -193,29 +277,196 @@ async def create_task(task: TaskCreate):
     if task.project_id:
         await db.projects.update_one(
             {"id": task.project_id},
-            {"$inc": {"task_count": 1}}
+            {"$inc": {"task_count": 1}, "$set": {"updated_at": datetime.utcnow()}}
         )
     
-    await db.tasks.insert_one(task_obj.dict())
+    task_doc = task_obj.dict()
+    await db.tasks.insert_one(task_doc)
+    await tags.record_tag_changes(db, [(None, task_doc)])
     return task_obj
 
-@api_router.get("/tasks", response_model=List[Task])
-async def get_tasks(project_id: Optional[str] = None, include_templates: bool = False):
-    query = {}
-    if project_id:
-        query["project_id"] = project_id
-    if not include_templates:
-        query["is_template"] = {"$ne": True}
+@api_router.get("/tasks", response_model=List[TaskDetail])
+async def get_tasks(
+    response: Response,
+    project_id: Optional[str] = None,
+    include_templates: bool = False,
+    status: Optional[List[TaskStatus]] = Query(None),
+    priority: Optional[List[Priority]] = Query(None),
+    tag: Optional[List[str]] = Query(None),
+    tag_mode: str = Query("any", pattern="^(any|all)$"),
+    deadline_from: Optional[datetime] = None,
+    deadline_to: Optional[datetime] = None,
+    task_type: Optional[str] = None,
+    has_dependencies: Optional[bool] = None,
+    sort: Optional[str] = Query(None, description="deadline, created_at or updated_at; prefix with - for descending"),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=1000),
+    include: Optional[List[str]] = Query(None, description="time_entries to join each task's entries"),
+    expand: Optional[List[str]] = Query(None, description="dependencies to resolve dependency ids to tasks")
+):
+    """List tasks with index-backed filters; the total match count is in X-Total-Count"""
+    try:
+        query, order = task_query.build_task_query(
+            project_id=project_id,
+            statuses=[s.value for s in status] if status else None,
+            priorities=[p.value for p in priority] if priority else None,
+            tags=tag,
+            tag_mode=tag_mode,
+            deadline_from=deadline_from,
+            deadline_to=deadline_to,
+            task_type=task_type,
+            has_dependencies=has_dependencies,
+            include_templates=include_templates,
+            sort=sort
+        )
+    except task_query.UnsupportedQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    tasks = await db.tasks.find(query).to_list(1000)
-    return [Task(**task) for task in tasks]
+    cursor = db.tasks.find(query)
+    if order:
+        cursor = cursor.sort(*order)
+    tasks, total = await asyncio.gather(
+        cursor.skip(offset).limit(limit).to_list(limit),
+        db.tasks.count_documents(query)
+    )
+    response.headers["X-Total-Count"] = str(total)
+    details = [TaskDetail(**task) for task in tasks]
+    await add_task_details(details, include, expand)
+    return details
 
-@api_router.get("/tasks/{task_id}", response_model=Task)
-async def get_task(task_id: str):
-    task = await db.tasks.find_one({"id": task_id})
+# Fields of dependency tasks returned by expand=dependencies
+DEPENDENCY_PROJECTION = {"id": 1, "title": 1, "status": 1, "priority": 1, "deadline": 1, "project_id": 1}
+
+async def add_task_details(details: List[TaskDetail], include: Optional[List[str]], expand: Optional[List[str]]):
+    """Join optional related data for a page of tasks, one query per kind rather than per task"""
+    if include and "time_entries" in include:
+        entries = await time_entries.entries_for_tasks(db, [detail.id for detail in details])
+        for detail in details:
+            detail.time_entries = entries[detail.id]
+    if expand and "dependencies" in expand:
+        found = await archive.find_tasks(
+            db, [dep for detail in details for dep in detail.dependencies], DEPENDENCY_PROJECTION
+        )
+        for detail in details:
+            detail.dependency_tasks = [found[dep] for dep in detail.dependencies if dep in found]
+
+FIELD_NAME = re.compile(r"[A-Za-z_]\w*(\.\w+)*")
+
+@api_router.post("/tasks/batch-get")
+async def batch_get_tasks(batch: TaskBatchGet):
+    """Tasks for a list of ids in request order, with one $in query; unknown ids are listed in missing"""
+    if batch.fields and not all(FIELD_NAME.fullmatch(field) for field in batch.fields):
+        raise HTTPException(status_code=400, detail="Invalid field name")
+    projection = {field: 1 for field in batch.fields} if batch.fields else None
+    found = await archive.find_tasks(db, batch.ids, projection)
+    ordered = list(dict.fromkeys(batch.ids))
+    return {
+        "tasks": [found[task_id] for task_id in ordered if task_id in found],
+        "missing": [task_id for task_id in ordered if task_id not in found]
+    }
+
+BULK_UPDATE_LIMIT = int(os.environ.get('BULK_UPDATE_LIMIT', '1000'))
+
+@api_router.post("/tasks/bulk-update")
+async def bulk_update_tasks(bulk: TaskBulkUpdate):
+    """Apply one patch (e.g. a status transition) to tasks selected by ids or a filter"""
+    if (bulk.ids is None) == (bulk.filter is None):
+        raise HTTPException(status_code=400, detail="Provide either ids or filter")
+    patch = bulk.patch.dict(exclude_unset=True)
+    if not patch:
+        raise HTTPException(status_code=400, detail="Patch is empty")
+    
+    if bulk.ids is not None:
+        if len(bulk.ids) > BULK_UPDATE_LIMIT:
+            raise HTTPException(status_code=400, detail=f"At most {BULK_UPDATE_LIMIT} ids per request")
+        query = {"id": {"$in": bulk.ids}}
+    else:
+        # tag_mode only qualifies tag; empty values select nothing either
+        selected = [value for value in bulk.filter.dict(exclude={"tag_mode"}).values() if value not in (None, [])]
+        if not selected:
+            raise HTTPException(status_code=400, detail="Filter must select something")
+        try:
+            query, _ = task_query.build_task_query(
+                project_id=bulk.filter.project_id,
+                statuses=[s.value for s in bulk.filter.status] if bulk.filter.status else None,
+                priorities=[p.value for p in bulk.filter.priority] if bulk.filter.priority else None,
+                tags=bulk.filter.tag,
+                tag_mode=bulk.filter.tag_mode,
+                deadline_from=bulk.filter.deadline_from,
+                deadline_to=bulk.filter.deadline_to,
+                task_type=bulk.filter.task_type
+            )
+        except task_query.UnsupportedQuery as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    # Only the fields needed for started_at and tag counts are read back
+    tasks = await db.tasks.find(
+        query, {"_id": 0, "id": 1, "status": 1, "project_id": 1, "tags": 1, "is_template": 1}
+    ).to_list(BULK_UPDATE_LIMIT + 1)
+    if len(tasks) > BULK_UPDATE_LIMIT:
+        raise HTTPException(status_code=400, detail=f"Filter matches more than {BULK_UPDATE_LIMIT} tasks; narrow it")
+    
+    now = datetime.utcnow()
+    patch["updated_at"] = now
+    if bulk.patch.status in [TaskStatus.completed, TaskStatus.approved]:
+        patch["completed_at"] = now
+    
+    # Tasks entering in_progress get started_at, so they are updated separately
+    starting = []
+    if bulk.patch.status == TaskStatus.in_progress:
+        starting = [task["id"] for task in tasks if task.get("status") != "in_progress"]
+    started = set(starting)
+    rest = [task["id"] for task in tasks if task["id"] not in started]
+    
+    modified = 0
+    if starting:
+        result = await db.tasks.update_many({"id": {"$in": starting}}, {"$set": {**patch, "started_at": now}})
+        modified += result.modified_count
+    if rest:
+        result = await db.tasks.update_many({"id": {"$in": rest}}, {"$set": patch})
+        modified += result.modified_count
+    
+    if "tags" in patch:
+        await tags.record_tag_changes(db, [(task, {**task, "tags": patch["tags"]}) for task in tasks])
+    
+    found = {task["id"] for task in tasks}
+    return {
+        "matched": len(tasks),
+        "modified": modified,
+        "missing": [task_id for task_id in bulk.ids if task_id not in found] if bulk.ids is not None else []
+    }
+
+EXPORT_CHUNK_TASKS = 200
+
+@api_router.get("/tasks/export")
+@admission.limited("export")
+async def export_tasks(include_archived: bool = False, include_templates: bool = False):
+    """All tasks as NDJSON, one task per line, streamed from the cursor in chunks"""
+    query = {} if include_templates else {"is_template": {"$ne": True}}
+    collections = [db.tasks] + ([db[archive.ARCHIVED]] if include_archived else [])
+    
+    async def lines():
+        chunk = []
+        for collection in collections:
+            async for task in collection.find(query, {"_id": 0}):
+                chunk.append(json.dumps(jsonable_encoder(task), separators=(",", ":")))
+                if len(chunk) == EXPORT_CHUNK_TASKS:
+                    yield "\n".join(chunk) + "\n"
+                    chunk = []
+        if chunk:
+            yield "\n".join(chunk) + "\n"
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@api_router.get("/tasks/{task_id}", response_model=TaskDetail)
+async def get_task(task_id: str, include: Optional[List[str]] = Query(None), expand: Optional[List[str]] = Query(None)):
+    # Tasks finished long ago live in the archive; fetching by id reads through to it
+    task = await archive.find_task(db, task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
-    return Task(**task)
+    detail = TaskDetail(**task)
+    await add_task_details([detail], include, expand)
+    return detail
 
 @api_router.put("/tasks/{task_id}", response_model=Task)
 async def update_task(task_id: str, task_update: TaskUpdate):
@@ -237,11 +488,13 @@ async def update_task(task_id: str, task_update: TaskUpdate):
     await db.tasks.update_one({"id": task_id}, {"$set": update_data})
     
     updated_task = await db.tasks.find_one({"id": task_id})
+    if "tags" in update_data:
+        await tags.record_tag_changes(db, [(task, updated_task)])
     return Task(**updated_task)
 
 @api_router.delete("/tasks/{task_id}")
 async def delete_task(task_id: str):
-    task = await db.tasks.find_one({"id": task_id})
+    task = await archive.find_task(db, task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
@@ -249,20 +502,49 @@ async def delete_task(task_id: str):
     if task.get("project_id"):
         await db.projects.update_one(
             {"id": task["project_id"]},
-            {"$inc": {"task_count": -1}}
+            {"$inc": {"task_count": -1}, "$set": {"updated_at": datetime.utcnow()}}
         )
     
     # Remove dependencies pointing to this task
     await db.tasks.update_many(
         {"dependencies": task_id},
-        {"$pull": {"dependencies": task_id}}
+        {"$pull": {"dependencies": task_id}, "$set": {"updated_at": datetime.utcnow()}}
     )
     
     await db.tasks.delete_one({"id": task_id})
+    await db[archive.ARCHIVED].delete_one({"id": task_id})
+    await sync.record_deletions(db, "tasks", [task_id])
+    if "archived_at" not in task:
+        await tags.record_tag_changes(db, [(task, None)])
     return {"message": "Task deleted successfully"}
 
+@job_queue.handler("archive_tasks")
+async def run_task_archival(job: jobs.JobContext, payload: dict):
+    return await archive.archive_finished_tasks(
+        db, older_than_days=payload.get("older_than_days", archive.ARCHIVE_AFTER_DAYS), report=job.report
+    )
+
+@api_router.post("/tasks/archive")
+@admission.limited("archive_tasks")
+async def archive_tasks(older_than_days: int = Query(archive.ARCHIVE_AFTER_DAYS, ge=0), background: bool = False):
+    """Move tasks finished more than older_than_days ago into the archive, inline or as a background job"""
+    if background:
+        job = await job_queue.enqueue("archive_tasks", {"older_than_days": older_than_days}, dedupe_key="archive_tasks")
+        return {"message": "Task archival queued", "job_id": job["id"]}
+    result = await archive.archive_finished_tasks(db, older_than_days=older_than_days)
+    return {"message": f"Archived {result['archived']} tasks", **result}
+
+@api_router.post("/tasks/{task_id}/restore", response_model=Task)
+async def restore_task(task_id: str):
+    """Move an archived task back into the live tasks"""
+    task = await archive.restore_task(db, task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Archived task not found")
+    return Task(**task)
+
 # Time Tracking Routes
 @api_router.post("/time-tracking/start/{task_id}")
+@idempotency.idempotent
 async def start_time_tracking(task_id: str):
     task = await db.tasks.find_one({"id": task_id})
     if not task:
@@ -276,6 +558,7 @@ async def start_time_tracking(task_id: str):
     time_entry = {
         "id": str(uuid.uuid4()),
         "task_id": task_id,
+        "project_id": task.get("project_id"),
         "start_time": datetime.utcnow(),
         "end_time": None,
         "description": ""
@@ -301,28 +584,47 @@ async def stop_time_tracking(task_id: str):
     end_time = datetime.utcnow()
     duration_minutes = int((end_time - active_entry["start_time"]).total_seconds() / 60)
     
-    await db.time_entries.update_one(
-        {"id": active_entry["id"]},
-        {"$set": {"end_time": end_time, "duration_minutes": duration_minutes}}
-    )
+    await time_entries.complete_entry(db, active_entry, end_time, duration_minutes)
     
-    # Update task actual hours
+    # Update task actual hours and time summary; the entry above is durable even when this write is buffered
     duration_hours = duration_minutes / 60
-    await db.tasks.update_one(
-        {"id": task_id},
-        {"$inc": {"actual_hours": duration_hours}, "$set": {"updated_at": datetime.utcnow()}}
+    summary_inc, summary_max = time_entries.summary_increment(duration_minutes, end_time)
+    await task_hours.add(
+        task_id,
+        inc={"actual_hours": duration_hours, **summary_inc},
+        max={"updated_at": end_time, **summary_max}
     )
     
     return {"message": "Time tracking stopped", "duration_minutes": duration_minutes}
 
 @api_router.get("/time-tracking/{task_id}")
 async def get_time_entries(task_id: str):
-    entries = await db.time_entries.find({"task_id": task_id}).to_list(100)
-    return entries
+    return await time_entries.entries_for_task(db, task_id)
+
+@api_router.get("/reports/time")
+@admission.limited("time_report")
+async def get_time_report(
+    start: datetime,
+    end: datetime,
+    group_by: str = Query("day", pattern="^(day|task|project)$"),
+    project_id: Optional[str] = None
+):
+    """Tracked minutes of finished time entries started in [start, end), grouped by day, task or project"""
+    return await time_entries.time_report(db, start, end, group_by=group_by, project_id=project_id)
+
+@job_queue.handler("migration")
+async def run_migration(job: jobs.JobContext, payload: dict):
+    return await migrations.apply(db, payload["name"], payload.get("batch_size", migrations.BATCH_SIZE),
+                                  report=job.report)
 
 # Task Template Routes
 @api_router.post("/templates", response_model=TaskTemplate)
 async def create_template(template: TaskTemplateCreate):
+    try:
+        templating.compile_template(template.title_template)
+        templating.compile_template(template.description_template)
+    except templating.InvalidTemplate as e:
+        raise HTTPException(status_code=400, detail=str(e))
     template_dict = template.dict()
     template_obj = TaskTemplate(**template_dict)
     await db.task_templates.insert_one(template_obj.dict())
@@ -333,33 +635,56 @@ async def get_templates():
     templates = await db.task_templates.find().to_list(100)
     return [TaskTemplate(**template) for template in templates]
 
-@api_router.post("/templates/{template_id}/create-task")
-async def create_task_from_template(template_id: str, project_id: Optional[str] = None):
+def render_template_task(template: dict, project_id: Optional[str], variables: dict) -> Task:
+    return Task(
+        title=templating.render(template["title_template"], variables),
+        description=templating.render(template["description_template"], variables),
+        priority=template["priority"],
+        estimated_hours=template.get("estimated_hours"),
+        task_type=template["task_type"],
+        tags=template["tags"],
+        template_id=template["id"],
+        project_id=project_id
+    )
+
+async def instantiate_template(template_id: str, request: TemplateInstantiate) -> List[Task]:
+    """Render and insert ``request.count`` tasks with one write per collection"""
     template = await db.task_templates.find_one({"id": template_id})
     if not template:
         raise HTTPException(status_code=404, detail="Template not found")
     
-    task_data = {
-        "title": template["title_template"],
-        "description": template["description_template"],
-        "priority": template["priority"],
-        "estimated_hours": template.get("estimated_hours"),
-        "task_type": template["task_type"],
-        "tags": template["tags"],
-        "template_id": template_id,
-        "project_id": project_id
-    }
-    
-    task_obj = Task(**task_data)
+    base = {**request.variables, "template": template["name"], "count": request.count,
+            "date": request.date or datetime.utcnow()}
+    try:
+        task_objs = [
+            render_template_task(template, request.project_id, {**base, "n": request.start + offset})
+            for offset in range(request.count)
+        ]
+    except templating.InvalidTemplate as e:
+        # Saved before specs were checked
+        raise HTTPException(status_code=400, detail=str(e))
+    task_docs = [task_obj.dict() for task_obj in task_objs]
     
-    if project_id:
+    await db.tasks.insert_many(task_docs)
+    if request.project_id:
         await db.projects.update_one(
-            {"id": project_id},
-            {"$inc": {"task_count": 1}}
+            {"id": request.project_id},
+            {"$inc": {"task_count": len(task_docs)}, "$set": {"updated_at": datetime.utcnow()}}
         )
-    
-    await db.tasks.insert_one(task_obj.dict())
-    return task_obj
+    await tags.record_tag_changes(db, [(None, task_doc) for task_doc in task_docs])
+    return task_objs
+
+@api_router.post("/templates/{template_id}/create-task")
+@idempotency.idempotent
+async def create_task_from_template(template_id: str, project_id: Optional[str] = None):
+    task_objs = await instantiate_template(template_id, TemplateInstantiate(project_id=project_id))
+    return task_objs[0]
+
+@api_router.post("/templates/{template_id}/instantiate")
+async def instantiate_template_tasks(template_id: str, request: TemplateInstantiate):
+    """Create several tasks from a template, rendering {n}, {date}, {count} and custom placeholders"""
+    task_objs = await instantiate_template(template_id, request)
+    return {"created_tasks": task_objs, "message": f"Successfully created {len(task_objs)} tasks"}
 
 # Comment Routes
 @api_router.post("/comments", response_model=Comment)
@@ -373,6 +698,46 @@ async def get_task_comments(task_id: str):
     comments = await db.comments.find({"task_id": task_id}).sort("created_at", -1).to_list(100)
     return [Comment(**comment) for comment in comments]
 
+# Search Routes
+@api_router.get("/search")
+@admission.limited("search")
+async def search_workspace(
+    q: str = Query(..., min_length=1),
+    project_id: Optional[str] = None,
+    status: Optional[List[TaskStatus]] = Query(None),
+    type: Optional[List[str]] = Query(None),
+    page: int = Query(1, ge=1, le=search.SEARCH_MAX_PAGE),
+    page_size: int = Query(20, ge=1, le=100)
+):
+    """Ranked full-text search over task text and tags, comments and template names"""
+    return await search.run_search(
+        db, q,
+        project_id=project_id,
+        statuses=[s.value for s in status] if status else None,
+        types=type,
+        page=page,
+        page_size=page_size
+    )
+
+# Tag Routes
+@api_router.get("/tags")
+async def get_tags(project_id: Optional[str] = None, limit: int = Query(100, ge=1, le=1000)):
+    """Tags with task counts, overall (with a per-project breakdown) or for one project"""
+    return await tags.list_tags(db, project_id=project_id, limit=limit)
+
+@job_queue.handler("tags_rebuild")
+async def run_tags_rebuild(job: jobs.JobContext, payload: dict):
+    return {"entries": await tags.rebuild_tag_counts(db)}
+
+@api_router.post("/tags/rebuild")
+async def rebuild_tags(background: bool = False):
+    """Recompute tag counts from the tasks collection, inline or as a background job"""
+    if background:
+        job = await job_queue.enqueue("tags_rebuild", dedupe_key="tags_rebuild")
+        return {"message": "Tag rebuild queued", "job_id": job["id"]}
+    entries = await tags.rebuild_tag_counts(db)
+    return {"message": f"Rebuilt {entries} tag count entries"}
+
 # Recurring Tasks Helper
 def calculate_next_due_date(current_date: datetime, recurrence_type: RecurrenceType, interval: int) -> datetime:
     if recurrence_type == RecurrenceType.daily:
@@ -390,16 +755,15 @@ def calculate_next_due_date(current_date: datetime, recurrence_type: RecurrenceT
         return current_date.replace(year=year, month=month)
     return current_date
 
-@api_router.post("/recurring-tasks/process")
-async def process_recurring_tasks():
-    """Check for recurring tasks that need new instances created"""
+async def create_recurring_instances() -> int:
+    """Create new instances of recurring tasks whose next_due_date has passed"""
     now = datetime.utcnow()
     
     # Find recurring tasks where next_due_date has passed
     recurring_tasks = await db.tasks.find({
         "recurrence_type": {"$ne": "none"},
         "next_due_date": {"$lte": now}
-    }).to_list(100)
+    }, {"_id": 0}).to_list(100)
     
     created_count = 0
     
@@ -411,40 +775,60 @@ async def process_recurring_tasks():
         new_task_data["completed_at"] = None
         new_task_data["started_at"] = None
         new_task_data["actual_hours"] = 0.0
-        new_task_data["time_entries"] = []
+        new_task_data.pop("time_entries", None)
+        new_task_data["time_summary"] = time_entries.empty_summary()
         new_task_data["created_at"] = now
         new_task_data["updated_at"] = now
+        # The instance is a one-off; only the original schedules further instances
+        new_task_data["recurrence_type"] = RecurrenceType.none.value
+        new_task_data["next_due_date"] = None
         
         # Calculate new deadline
         if task.get("deadline"):
             interval = task.get("recurrence_interval", 1)
             new_deadline = calculate_next_due_date(
-                datetime.fromisoformat(task["deadline"].replace('Z', '+00:00')),
+                schema.to_datetime(task["deadline"]),
                 RecurrenceType(task["recurrence_type"]),
                 interval
             )
             new_task_data["deadline"] = new_deadline
         
         await db.tasks.insert_one(new_task_data)
+        await tags.record_tag_changes(db, [(None, new_task_data)])
         
         # Update original task's next_due_date
         next_due = calculate_next_due_date(
-            datetime.fromisoformat(task["next_due_date"].replace('Z', '+00:00')),
+            schema.to_datetime(task["next_due_date"]),
             RecurrenceType(task["recurrence_type"]),
             task.get("recurrence_interval", 1)
         )
         
         await db.tasks.update_one(
             {"id": task["id"]},
-            {"$set": {"next_due_date": next_due}}
+            {"$set": {"next_due_date": next_due, "updated_at": now}}
         )
         
         created_count += 1
     
+    return created_count
+
+@job_queue.handler("recurring_tasks")
+async def run_recurring_tasks(job: jobs.JobContext, payload: dict):
+    return {"created": await create_recurring_instances()}
+
+@api_router.post("/recurring-tasks/process")
+@admission.limited("recurring_tasks")
+async def process_recurring_tasks(background: bool = False):
+    """Check for recurring tasks that need new instances created"""
+    if background:
+        job = await job_queue.enqueue("recurring_tasks", dedupe_key="recurring_tasks")
+        return {"message": "Recurring task processing queued", "job_id": job["id"]}
+    created_count = await create_recurring_instances()
     return {"message": f"Created {created_count} recurring task instances"}
 
 # Notification Routes
 @api_router.get("/notifications")
+@singleflight.coalesce("notifications")
 async def get_notifications():
     """Get upcoming deadlines and overdue tasks as notifications"""
     now = datetime.utcnow()
@@ -452,35 +836,31 @@ async def get_notifications():
     
     notifications = []
     
+    await task_snapshot.refresh()
+    
     # Overdue tasks
-    overdue_tasks = await db.tasks.find({
-        "deadline": {"$lt": now},
-        "status": {"$nin": ["completed", "approved"]}
-    }).to_list(50)
+    overdue_tasks = task_snapshot.rows(task_snapshot.due_between(None, now)[:50])
     
     for task in overdue_tasks:
         notifications.append({
             "id": str(uuid.uuid4()),
             "title": "Overdue Task",
-            "message": f"'{task['title']}' is overdue!",
+            "message": f"'{task.title}' is overdue!",
             "type": "error",
-            "task_id": task["id"],
+            "task_id": task.id,
             "created_at": now
         })
     
     # Tasks due tomorrow
-    due_tomorrow = await db.tasks.find({
-        "deadline": {"$gte": now, "$lt": tomorrow},
-        "status": {"$nin": ["completed", "approved"]}
-    }).to_list(50)
+    due_tomorrow = task_snapshot.rows(task_snapshot.due_between(now, tomorrow)[:50])
     
     for task in due_tomorrow:
         notifications.append({
             "id": str(uuid.uuid4()),
             "title": "Due Tomorrow",
-            "message": f"'{task['title']}' is due tomorrow",
+            "message": f"'{task.title}' is due tomorrow",
             "type": "warning",
-            "task_id": task["id"],
+            "task_id": task.id,
             "created_at": now
         })
     
@@ -496,19 +876,48 @@ async def create_project(project: ProjectCreate):
 
 @api_router.get("/projects", response_model=List[Project])
 async def get_projects():
-    projects = await db.projects.find().to_list(1000)
+    projects = await db.projects.find({"deleted": {"$ne": True}}).to_list(1000)
     return [Project(**project) for project in projects]
 
+@api_router.get("/projects/summary")
+@singleflight.coalesce("projects_summary")
+@admission.limited("projects_summary")
+async def get_projects_summary():
+    """Task counts by status for every project, from one aggregation per task collection"""
+    pipeline = [
+        {"$match": {"project_id": {"$ne": None}, "is_template": {"$ne": True}}},
+        {"$group": {"_id": {"project_id": "$project_id", "status": "$status"}, "count": {"$sum": 1}}},
+    ]
+    projects, live, archived = await asyncio.gather(
+        db.projects.find({"deleted": {"$ne": True}}, {"_id": 0, "id": 1, "title": 1, "status": 1, "color": 1}).to_list(1000),
+        db.tasks.aggregate(pipeline).to_list(None),
+        db[archive.ARCHIVED].aggregate(pipeline).to_list(None)
+    )
+    summaries = {
+        project["id"]: {**project, "total": 0, "archived": 0, "by_status": {status.value: 0 for status in TaskStatus}}
+        for project in projects
+    }
+    for rows, is_archived in ((live, False), (archived, True)):
+        for row in rows:
+            summary = summaries.get(row["_id"]["project_id"])
+            if summary is None:
+                continue  # Deleted project whose cascade is still running
+            summary["by_status"][row["_id"]["status"]] = summary["by_status"].get(row["_id"]["status"], 0) + row["count"]
+            summary["total"] += row["count"]
+            if is_archived:
+                summary["archived"] += row["count"]
+    return list(summaries.values())
+
 @api_router.get("/projects/{project_id}", response_model=Project)
 async def get_project(project_id: str):
-    project = await db.projects.find_one({"id": project_id})
+    project = await db.projects.find_one({"id": project_id, "deleted": {"$ne": True}})
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     return Project(**project)
 
 @api_router.put("/projects/{project_id}", response_model=Project)
 async def update_project(project_id: str, project_update: ProjectUpdate):
-    project = await db.projects.find_one({"id": project_id})
+    project = await db.projects.find_one({"id": project_id, "deleted": {"$ne": True}})
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
@@ -520,95 +929,63 @@ async def update_project(project_id: str, project_update: ProjectUpdate):
     updated_project = await db.projects.find_one({"id": project_id})
     return Project(**updated_project)
 
-@api_router.delete("/projects/{project_id}")
+@api_router.delete("/projects/{project_id}", status_code=202)
 async def delete_project(project_id: str):
-    project = await db.projects.find_one({"id": project_id})
+    """Hide the project now and remove its tasks and their data in the background"""
+    project = await db.projects.find_one({"id": project_id, "deleted": {"$ne": True}})
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    # Also delete all tasks belonging to this project
-    await db.tasks.delete_many({"project_id": project_id})
-    await db.projects.delete_one({"id": project_id})
-    return {"message": "Project and associated tasks deleted successfully"}
+    deletion = await cascade.mark_project_deleted(db, project_id)
+    job = await job_queue.enqueue("project_cascade", {"project_id": project_id},
+                                  dedupe_key=f"project_cascade:{project_id}")
+    return {"message": "Project deleted; associated tasks are being removed", "deletion": deletion, "job_id": job["id"]}
+
+@job_queue.handler("project_cascade")
+async def run_project_cascade_job(job: jobs.JobContext, payload: dict):
+    return await cascade.run_project_cascade(db, payload["project_id"], report=job.report)
+
+@api_router.get("/projects/{project_id}/deletion")
+async def get_project_deletion(project_id: str):
+    """Progress of a project's deletion cascade"""
+    project = await db.projects.find_one({"id": project_id, "deleted": True}, {"_id": 0, "deletion": 1})
+    if not project:
+        raise HTTPException(status_code=404, detail="No deletion found for this project")
+    deletion = project["deletion"]
+    deletion["remaining_tasks"] = (await db.tasks.count_documents({"project_id": project_id})
+                                   + await db[archive.ARCHIVED].count_documents({"project_id": project_id}))
+    return deletion
 
 # GTD Analysis Routes (enhanced)
 @api_router.get("/gtd/analysis", response_model=GTDAnalysis)
+@singleflight.coalesce("gtd_analysis")
+@admission.limited("gtd_analysis")
 async def get_gtd_analysis():
-    # Get all active tasks
-    tasks = await db.tasks.find({"status": {"$nin": ["completed", "approved"]}, "is_template": {"$ne": True}}).to_list(1000)
-    task_objects = [Task(**task) for task in tasks]
-    
-    # Identify high-impact tasks with enhanced algorithm
-    high_impact_tasks = []
-    for task in task_objects:
-        score = 0
-        if task.priority == Priority.high:
-            score += 3
-        elif task.priority == Priority.medium:
-            score += 2
-        else:
-            score += 1
-            
-        if task.deadline:
-            days_until_deadline = (task.deadline - datetime.utcnow()).days
-            if days_until_deadline <= 1:
-                score += 4  # Very urgent
-            elif days_until_deadline <= 3:
-                score += 3
-            elif days_until_deadline <= 7:
-                score += 2
-            else:
-                score += 1
-        
-        # Factor in dependencies
-        if task.dependencies:
-            score += len(task.dependencies) * 0.5
-        
-        if score >= 4:  # High impact threshold
-            high_impact_tasks.append(task)
-    
-    # Enhanced task batching
-    batched_tasks = []
-    task_groups = {}
-    
-    for task in task_objects:
-        key = f"{task.task_type}_{task.priority}"
-        if key not in task_groups:
-            task_groups[key] = []
-        task_groups[key].append(task)
-    
-    for group in task_groups.values():
-        if len(group) > 1:
-            batched_tasks.append(group)
-    
-    # Enhanced dependency suggestions
-    suggested_dependencies = []
-    keywords_map = {
-        "contract": ["nda", "agreement", "review"],
-        "presentation": ["slides", "document", "prepare"],
-        "meeting": ["agenda", "invite", "prepare"],
-        "launch": ["test", "review", "deploy"],
-        "document": ["draft", "review", "approve"]
-    }
+    # Active tasks come from the snapshot; only the tasks in the response are fetched
+    await task_snapshot.refresh()
     
-    for task in task_objects:
-        for keyword, dependencies in keywords_map.items():
-            if keyword.lower() in task.title.lower():
-                for dep in dependencies:
-                    matching_tasks = [t for t in task_objects if dep.lower() in t.title.lower() and t.id != task.id]
-                    if matching_tasks:
-                        suggested_dependencies.append({
-                            "main_task": task.title,
-                            "main_task_id": task.id,
-                            "suggested_dependency": matching_tasks[0].title,
-                            "suggested_dependency_id": matching_tasks[0].id,
-                            "reason": f"Tasks involving '{keyword}' often require '{dep}'"
-                        })
-    
-    # Enhanced focus recommendation
-    pending_count = len(task_objects)
-    high_priority_count = len([t for t in task_objects if t.priority == Priority.high])
-    overdue_count = len([t for t in task_objects if t.deadline and t.deadline < datetime.utcnow()])
+    # Scoring, batching, suggestions and the critical path run in the analysis process pool
+    try:
+        result, stale = await analysis_runner.run(
+            "gtd", analysis.analyse, task_snapshot.compact_tasks(), analysis.epoch_seconds(datetime.utcnow())
+        )
+    except analysis.AnalysisUnavailable:
+        raise HTTPException(status_code=503, detail="Analysis is temporarily unavailable",
+                            headers={"Retry-After": "5"})
+    
+    wanted = set(result["high_impact"]) | set(result["critical_path"])
+    wanted.update(task_id for batch in result["batches"] for task_id in batch)
+    tasks = await db.tasks.find(
+        {"id": {"$in": list(wanted)}, "status": {"$nin": ["completed", "approved"]}}, {"_id": 0}
+    ).to_list(None)
+    by_id = {task["id"]: task for task in tasks}
+    def resolve(ids):
+        # A stale result may name tasks that have since been completed or deleted
+        return [Task(**by_id[task_id]) for task_id in ids if task_id in by_id]
+    
+    overdue_count = result["overdue_count"]
+    high_priority_count = result["high_priority_count"]
+    pending_count = result["pending_count"]
     
     if overdue_count > 0:
         focus_recommendation = f"🚨 You have {overdue_count} overdue task{'s' if overdue_count > 1 else ''}. Address these immediately to get back on track."
@@ -620,16 +997,21 @@ async def get_gtd_analysis():
         focus_recommendation = "✨ Great job managing your workload! Focus on your high-impact tasks for maximum productivity."
     
     return GTDAnalysis(
-        high_impact_tasks=high_impact_tasks[:5],
-        batched_tasks=batched_tasks[:3],
-        suggested_dependencies=suggested_dependencies[:5],
-        focus_recommendation=focus_recommendation
+        high_impact_tasks=resolve(result["high_impact"]),
+        batched_tasks=[resolve(batch) for batch in result["batches"]],
+        suggested_dependencies=result["suggestions"],
+        focus_recommendation=focus_recommendation,
+        critical_path=resolve(result["critical_path"]),
+        critical_path_hours=result["critical_path_hours"],
+        stale=stale
     )
 
 @api_router.post("/tasks/batch-create")
+@idempotency.idempotent
 async def batch_create_tasks(tasks: List[TaskCreate]):
     """Create multiple tasks at once for batching scenarios"""
     created_tasks = []
+    created_docs = []
     
     for task in tasks:
         task_dict = task.dict()
@@ -638,12 +1020,15 @@ async def batch_create_tasks(tasks: List[TaskCreate]):
         if task.project_id:
             await db.projects.update_one(
                 {"id": task.project_id},
-                {"$inc": {"task_count": 1}}
+                {"$inc": {"task_count": 1}, "$set": {"updated_at": datetime.utcnow()}}
             )
         
-        await db.tasks.insert_one(task_obj.dict())
+        task_doc = task_obj.dict()
+        await db.tasks.insert_one(task_doc)
         created_tasks.append(task_obj)
+        created_docs.append(task_doc)
     
+    await tags.record_tag_changes(db, [(None, doc) for doc in created_docs])
     return {"created_tasks": created_tasks, "message": f"Successfully created {len(created_tasks)} tasks"}
 
 # Pomodoro Timer Routes
@@ -668,36 +1053,110 @@ async def start_pomodoro(task_id: str):
         "status": "active"
     }
 
+# Fields of synced documents, as the list endpoints return them
+SYNC_PROJECTIONS = {
+    name: {field: 1 for field in model.model_fields}
+    for name, model in (("tasks", Task), ("projects", Project), ("comments", Comment), ("templates", TaskTemplate))
+}
+
+# Bootstrap Routes
+async def bootstrap_projects_summary() -> Optional[List[dict]]:
+    # Left out under load like the analysis; the client falls back to each project's task_count
+    try:
+        return await get_projects_summary()
+    except HTTPException:
+        return None
+
+async def bootstrap_analysis() -> Optional[dict]:
+    # The client already holds every task from the sync page, so analysis tasks are sent as ids
+    try:
+        result = await get_gtd_analysis()
+    except HTTPException:
+        return None
+    def ids(tasks):
+        return [task.id for task in tasks]
+    return {
+        "high_impact_task_ids": ids(result.high_impact_tasks),
+        "batched_task_ids": [ids(batch) for batch in result.batched_tasks],
+        "suggested_dependencies": result.suggested_dependencies,
+        "focus_recommendation": result.focus_recommendation,
+        "critical_path_ids": ids(result.critical_path),
+        "critical_path_hours": result.critical_path_hours,
+        "stale": result.stale,
+    }
+
+@api_router.get("/bootstrap")
+async def get_bootstrap():
+    """Everything the frontend needs on load, gathered concurrently into one response.
+
+    ``sync`` is the first page of a full /sync (tasks, projects, comments, templates and the
+    token to continue from); the rest mirrors the dashboard, notification, GTD analysis and
+    project summary endpoints. ``analysis`` and ``projects_summary`` are null when those
+    endpoints are overloaded.
+    """
+    replica, summary, stats, notifications, gtd = await asyncio.gather(
+        sync.changes_since(db, None, projections=SYNC_PROJECTIONS),
+        bootstrap_projects_summary(),
+        get_dashboard_stats(),
+        get_notifications(),
+        bootstrap_analysis()
+    )
+    return {
+        "sync": replica,
+        "projects_summary": summary,
+        "stats": stats,
+        "notifications": notifications,
+        "analysis": gtd,
+    }
+
+# Sync Routes
+@api_router.get("/sync")
+async def get_sync(since: Optional[str] = None):
+    """Tasks, projects, comments and templates changed or deleted since a token from an earlier call.
+
+    Without a token everything current is returned. Follow has_more with the returned token
+    until it is false; a 410 means the token is too old and the client must start over.
+    """
+    try:
+        return await sync.changes_since(db, since, projections=SYNC_PROJECTIONS)
+    except sync.InvalidToken as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except sync.TokenExpired:
+        raise HTTPException(status_code=410, detail="Sync token expired; resync without a token")
+
 # Statistics Routes
+@api_router.get("/stats/snapshot")
+async def get_snapshot_stats():
+    """Size and freshness of this worker's analytics snapshot"""
+    await task_snapshot.refresh()
+    return task_snapshot.stats()
+
 @api_router.get("/stats/dashboard")
+@singleflight.coalesce("dashboard_stats")
 async def get_dashboard_stats():
     """Get comprehensive dashboard statistics including time tracking"""
-    total_tasks = await db.tasks.count_documents({"is_template": {"$ne": True}})
-    completed_tasks = await db.tasks.count_documents({"status": {"$in": ["completed", "approved"]}, "is_template": {"$ne": True}})
-    pending_tasks = await db.tasks.count_documents({"status": {"$in": ["todo", "in_progress"]}, "is_template": {"$ne": True}})
+    archived_tasks = await archive.archived_count(db)
+    total_tasks = await db.tasks.count_documents({"is_template": {"$ne": True}}) + archived_tasks
+    completed_tasks = await db.tasks.count_documents({"status": {"$in": ["completed", "approved"]}, "is_template": {"$ne": True}}) + archived_tasks
     
-    # Overdue tasks
-    overdue_tasks = await db.tasks.count_documents({
-        "deadline": {"$lt": datetime.utcnow()},
-        "status": {"$nin": ["completed", "approved"]},
-        "is_template": {"$ne": True}
-    })
+    # Open task counts come from the snapshot
+    await task_snapshot.refresh()
+    pending_tasks = len(task_snapshot)
+    overdue_tasks = task_snapshot.count_overdue(datetime.utcnow())
     
     # Time tracking stats
-    total_time_entries = await db.time_entries.count_documents({})
-    total_tracked_time = 0
-    
-    time_entries = await db.time_entries.find({"duration_minutes": {"$exists": True}}).to_list(1000)
-    for entry in time_entries:
-        total_tracked_time += entry.get("duration_minutes", 0)
+    time_totals = await time_entries.totals(db)
+    total_time_entries = time_totals["entries"]
+    total_tracked_time = time_totals["minutes"]
     
-    total_projects = await db.projects.count_documents({})
-    active_projects = await db.projects.count_documents({"status": "active"})
+    total_projects = await db.projects.count_documents({"deleted": {"$ne": True}})
+    active_projects = await db.projects.count_documents({"status": "active", "deleted": {"$ne": True}})
     
     return {
         "tasks": {
             "total": total_tasks,
             "completed": completed_tasks,
+            "archived": archived_tasks,
             "pending": pending_tasks,
             "overdue": overdue_tasks,
             "completion_rate": round((completed_tasks / total_tasks * 100) if total_tasks > 0 else 0, 1)
@@ -713,15 +1172,89 @@ async def get_dashboard_stats():
         }
     }
 
+# Profiling Routes
+def require_profile_admin(request: Request):
+    # Without a configured token the admin endpoints do not exist
+    if not profiling.PROFILE_ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not profiling.is_authorised(request):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@api_router.get("/admin/profiles")
+async def list_profiles(request: Request, limit: int = 20):
+    """List captured request profiles, newest first"""
+    require_profile_admin(request)
+    profiles = await db.request_profiles.find(
+        {}, {"_id": 0, "raw": 0, "report": 0, "top_functions": 0}
+    ).sort("created_at", -1).to_list(min(limit, 100))
+    return profiles
+
+@api_router.get("/admin/profiles/{profile_id}")
+async def get_profile(profile_id: str, request: Request):
+    require_profile_admin(request)
+    profile = await db.request_profiles.find_one({"id": profile_id}, {"_id": 0, "raw": 0})
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+@api_router.get("/admin/profiles/{profile_id}/raw")
+async def download_profile(profile_id: str, request: Request):
+    """Profile in pstats dump format, loadable with pstats or snakeviz"""
+    require_profile_admin(request)
+    profile = await db.request_profiles.find_one({"id": profile_id}, {"raw": 1})
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return Response(
+        content=bytes(profile["raw"]),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="{profile_id}.prof"'}
+    )
+
+# Background Job Routes
+@api_router.get("/jobs")
+async def list_jobs(kind: Optional[str] = None, status: Optional[str] = None, limit: int = Query(50, ge=1, le=500)):
+    """Most recent background jobs, optionally filtered by kind and status"""
+    query = {}
+    if kind:
+        query["kind"] = kind
+    if status:
+        query["status"] = status
+    return await db.jobs.find(query, {"_id": 0}).sort("created_at", -1).to_list(limit)
+
+@api_router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status, progress and result of a background job"""
+    job = await job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 # Include the router in the main app
 app.include_router(api_router)
 
+# Retried POSTs carrying an Idempotency-Key replay the first response instead of running again
+app.add_middleware(idempotency.IdempotencyMiddleware, get_storage=lambda: db)
+
+# Negotiated gzip/br/zstd compression, and cached GETs served precompressed
+app.add_middleware(compression.CompressionMiddleware, cache=response_cache)
+
+# Shed load before it reaches the routes; inside the metrics middleware so 503s are counted
+app.middleware("http")(admission.shed_requests(app))
+
+# Per-route latency and MongoDB command metrics
+app.middleware("http")(metrics.record_request)
+
+# Request profiling is only installed when enabled, so it costs nothing otherwise
+if profiling.PROFILING_ENABLED:
+    app.middleware("http")(profiling.profile_middleware(lambda: db))
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count"],
 )
 
 # Configure logging
@@ -731,9 +1264,40 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_db_indexes():
+    await time_entries.ensure_storage(db)
+    await db.create_indexes()
+
+@app.on_event("startup")
+async def watch_storage():
+    db.guard(schema.guard)
+    db.watch(task_snapshot.on_change)
+    db.watch(singleflight.on_change)
+    db.watch(response_cache.on_change)
+    response_cache.clear()
+    task_snapshot.invalidate()
+
+@app.on_event("startup")
+async def start_background_work():
+    await cascade.resume_project_cascades(db, job_queue)
+    await job_queue.enqueue("archive_tasks", dedupe_key="archive_tasks")
+    for name in await migrations.pending(db):
+        await job_queue.enqueue("migration", {"name": name}, dedupe_key=f"migration:{name}")
+    await job_queue.start()
+    await task_hours.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
+    await job_queue.stop()
+    await task_hours.stop()
+    analysis_runner.shutdown()
+    db.close()
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    body, content_type = metrics.render_metrics()
+    return Response(content=body, media_type=content_type)
 
 @app.get("/")
 async def root():
@@ -0,0 +1,93 @@
+"""Single-flight coalescing of concurrent identical reads.
+
+When many dashboards open at once, each request for ``/api/gtd/analysis``
+or ``/api/stats/dashboard`` would repeat the same computation. Routes
+decorated with ``coalesce`` instead share one in-flight call per argument
+set: the first request starts it and concurrent requests with equal
+arguments await its result (or exception). Nothing is kept once the call
+finishes, so this is not a cache.
+
+The call runs as its own task and waiters are shielded from each other, so
+a client disconnecting does not cancel the work for the rest. A write
+through the storage (see ``Storage.watch``) detaches in-flight calls, so
+requests arriving after a write start a fresh one and see it.
+
+``SINGLE_FLIGHT_ROUTES`` lists the route names that coalesce; coalesced
+and computed calls are counted per route in the ``single_flight_*``
+metrics.
+"""
+import asyncio
+import functools
+import os
+from typing import Any, Awaitable, Callable, Dict, List
+
+import metrics
+
+SINGLE_FLIGHT_ROUTES = frozenset(filter(None, (
+    name.strip() for name in os.environ.get(
+        'SINGLE_FLIGHT_ROUTES', 'gtd_analysis,dashboard_stats,notifications,projects_summary'
+    ).split(',')
+)))
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Any, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key, call: Callable[[], Awaitable]):
+        """The result of ``call()``, shared with concurrent callers passing an equal ``key``."""
+        flight = self._calls.get(key)
+        if flight is None:
+            flight = self._calls[key] = asyncio.ensure_future(call())
+            flight.add_done_callback(functools.partial(self._finished, key))
+            metrics.SINGLE_FLIGHT_CALLS.labels(self.name).inc()
+        else:
+            metrics.SINGLE_FLIGHT_COALESCED.labels(self.name).inc()
+        metrics.SINGLE_FLIGHT_WAITING.labels(self.name).inc()
+        try:
+            return await asyncio.shield(flight)
+        finally:
+            metrics.SINGLE_FLIGHT_WAITING.labels(self.name).dec()
+
+    def _finished(self, key, flight: asyncio.Future):
+        if self._calls.get(key) is flight:
+            del self._calls[key]
+        # Retrieve the exception so it is not reported as unhandled when every waiter left
+        if not flight.cancelled():
+            flight.exception()
+
+    def forget(self):
+        """Let later callers start a new call; current waiters still get the running one."""
+        self._calls.clear()
+
+
+_flights: List[SingleFlight] = []
+
+
+def coalesce(name: str):
+    """Route decorator sharing concurrent calls with equal arguments when ``name`` is enabled."""
+    def decorate(function):
+        if name not in SINGLE_FLIGHT_ROUTES:
+            return function
+        flight = SingleFlight(name)
+        _flights.append(flight)
+
+        @functools.wraps(function)
+        async def coalesced(*args, **kwargs):
+            # Route arguments are query values, so their repr identifies the request
+            key = repr((args, sorted(kwargs.items())))
+            return await flight.do(key, lambda: function(*args, **kwargs))
+
+        coalesced.flight = flight
+        return coalesced
+    return decorate
+
+
+def on_change(event):
+    """``Storage.watch`` listener: calls started before a write are not joined after it."""
+    for flight in _flights:
+        flight.forget()
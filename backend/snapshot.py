@@ -0,0 +1,243 @@
+"""Per-worker columnar snapshot of active tasks for analytics.
+
+Dashboard counts, notifications and the GTD analysis only need a handful
+of fields from open tasks. ``TaskSnapshot`` keeps those in parallel
+columns: enums as small int codes in ``array`` buffers, deadlines as epoch
+seconds, and interned strings for repeated values, so analytics read memory
+instead of refetching and validating full ``Task`` models.
+
+The snapshot watches storage ``ChangeEvent``s: task writes keyed by id
+mark those rows dirty and the next read refetches just them, while writes
+it cannot attribute to ids trigger a full reload. Writes made by other
+processes are not seen as events, so the snapshot is also reloaded when it
+is older than ``SNAPSHOT_MAX_AGE_SECONDS``.
+"""
+import asyncio
+import os
+import sys
+import time
+from array import array
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from analysis import CompactTask, epoch_seconds
+from storage import ChangeEvent
+
+SNAPSHOT_MAX_AGE_SECONDS = float(os.environ.get('SNAPSHOT_MAX_AGE_SECONDS', '30'))
+
+PRIORITIES = ("low", "medium", "high")
+_PRIORITY_CODES = {priority: code for code, priority in enumerate(PRIORITIES)}
+ACTIVE_STATUSES = ("todo", "in_progress")
+NO_DEADLINE = -2 ** 63  # smallest value an array('q') can hold
+NO_ESTIMATE = -1.0
+_NO_DEPENDENCIES: Tuple[str, ...] = ()
+
+ACTIVE_FILTER = {"status": {"$in": list(ACTIVE_STATUSES)}, "is_template": {"$ne": True}}
+PROJECTION = {
+    "_id": 0, "id": 1, "title": 1, "priority": 1, "status": 1, "deadline": 1, "project_id": 1,
+    "task_type": 1, "estimated_hours": 1, "dependencies": 1, "is_template": 1,
+}
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _deadline_seconds(value) -> int:
+    if isinstance(value, str):
+        # Older documents may still hold ISO strings
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return NO_DEADLINE
+    if not isinstance(value, datetime):
+        return NO_DEADLINE
+    return int(epoch_seconds(value))
+
+
+class TaskRow:
+    """One snapshot row, materialised on demand."""
+
+    __slots__ = ("id", "title", "priority", "status", "deadline", "project_id", "task_type",
+                 "estimated_hours", "dependencies")
+
+    def __init__(self, id, title, priority, status, deadline, project_id, task_type, estimated_hours,
+                 dependencies):
+        self.id = id
+        self.title = title
+        self.priority = priority
+        self.status = status
+        self.deadline = deadline
+        self.project_id = project_id
+        self.task_type = task_type
+        self.estimated_hours = estimated_hours
+        self.dependencies = dependencies
+
+
+class TaskSnapshot:
+    def __init__(self, get_storage, max_age: float = SNAPSHOT_MAX_AGE_SECONDS):
+        self.get_storage = get_storage
+        self.max_age = max_age
+        self._lock = asyncio.Lock()
+        self._clear()
+        self._dirty: Set[str] = set()
+        self._stale = True
+        self.loaded_at: Optional[float] = None
+
+    def _clear(self):
+        self.ids: List[str] = []
+        self.titles: List[str] = []
+        self.project_ids: List[Optional[str]] = []
+        self.task_types: List[Optional[str]] = []
+        self.dependencies: List[Tuple[str, ...]] = []
+        self.priority = array("b")
+        self.status = array("b")
+        self.deadline = array("q")
+        self.estimated_hours = array("d")
+        self._rows: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # Change tracking
+
+    def on_change(self, event: ChangeEvent):
+        if event.collection != "tasks":
+            return
+        if event.ids is None:
+            self._stale = True
+        else:
+            self._dirty.update(event.ids)
+
+    def invalidate(self):
+        self._stale = True
+
+    async def refresh(self):
+        """Bring the snapshot up to date; cheap when nothing changed."""
+        expired = self.loaded_at is None or time.monotonic() - self.loaded_at > self.max_age
+        if not (self._stale or self._dirty or expired):
+            return
+        async with self._lock:
+            db = self.get_storage()
+            if self._stale or self.loaded_at is None or time.monotonic() - self.loaded_at > self.max_age:
+                # Changes reported while the reload is in flight stay queued for the next refresh
+                self._stale = False
+                self._dirty.clear()
+                loaded_at = time.monotonic()
+                documents = await db.tasks.find(ACTIVE_FILTER, PROJECTION).to_list(None)
+                self._clear()
+                for document in documents:
+                    self._put(document)
+                self.loaded_at = loaded_at
+            elif self._dirty:
+                dirty, self._dirty = self._dirty, set()
+                documents = await db.tasks.find({"id": {"$in": list(dirty)}}, PROJECTION).to_list(None)
+                found = {document["id"]: document for document in documents}
+                for task_id in dirty:
+                    document = found.get(task_id)
+                    if document and document.get("status") in ACTIVE_STATUSES and not document.get("is_template"):
+                        self._put(document)
+                    else:
+                        self._remove(task_id)
+
+    # Row storage
+
+    def _put(self, document: dict):
+        values = (
+            document.get("title") or "",
+            _intern(document.get("project_id")),
+            _intern(document.get("task_type")),
+            tuple(document["dependencies"]) if document.get("dependencies") else _NO_DEPENDENCIES,
+            _PRIORITY_CODES.get(document.get("priority"), _PRIORITY_CODES["medium"]),
+            ACTIVE_STATUSES.index(document["status"]),
+            _deadline_seconds(document.get("deadline")),
+            document["estimated_hours"] if document.get("estimated_hours") is not None else NO_ESTIMATE,
+        )
+        columns = (self.titles, self.project_ids, self.task_types, self.dependencies,
+                   self.priority, self.status, self.deadline, self.estimated_hours)
+        row = self._rows.get(document["id"])
+        if row is None:
+            self._rows[document["id"]] = len(self.ids)
+            self.ids.append(document["id"])
+            for column, value in zip(columns, values):
+                column.append(value)
+        else:
+            for column, value in zip(columns, values):
+                column[row] = value
+
+    def _remove(self, task_id: str):
+        row = self._rows.pop(task_id, None)
+        if row is None:
+            return
+        # Move the last row into the gap so the columns stay dense
+        columns = (self.ids, self.titles, self.project_ids, self.task_types, self.dependencies,
+                   self.priority, self.status, self.deadline, self.estimated_hours)
+        last = len(self.ids) - 1
+        if row != last:
+            for column in columns:
+                column[row] = column[last]
+            self._rows[self.ids[row]] = row
+        for column in columns:
+            column.pop()
+
+    # Queries
+
+    def row(self, index: int) -> TaskRow:
+        deadline = self.deadline[index]
+        estimate = self.estimated_hours[index]
+        return TaskRow(
+            self.ids[index], self.titles[index], PRIORITIES[self.priority[index]],
+            ACTIVE_STATUSES[self.status[index]],
+            datetime.utcfromtimestamp(deadline) if deadline != NO_DEADLINE else None,
+            self.project_ids[index], self.task_types[index],
+            estimate if estimate != NO_ESTIMATE else None, self.dependencies[index],
+        )
+
+    def rows(self, indexes: Optional[List[int]] = None) -> Iterator[TaskRow]:
+        for index in range(len(self.ids)) if indexes is None else indexes:
+            yield self.row(index)
+
+    def due_between(self, start: Optional[datetime], end: datetime) -> List[int]:
+        """Rows with a deadline in ``[start, end)``; no lower bound when ``start`` is None."""
+        low = int(epoch_seconds(start)) if start else NO_DEADLINE + 1
+        high = epoch_seconds(end)
+        return [index for index, deadline in enumerate(self.deadline) if low <= deadline < high]
+
+    def count_overdue(self, now: datetime) -> int:
+        return len(self.due_between(None, now))
+
+    def compact_tasks(self) -> List[CompactTask]:
+        """Rows in the tuple form the analysis functions take."""
+        return [
+            (self.ids[i], self.titles[i], PRIORITIES[self.priority[i]], self.task_types[i],
+             float(self.deadline[i]) if self.deadline[i] != NO_DEADLINE else None,
+             float(self.estimated_hours[i]) if self.estimated_hours[i] != NO_ESTIMATE else None,
+             self.dependencies[i])
+            for i in range(len(self.ids))
+        ]
+
+    # Footprint
+
+    def memory_bytes(self) -> int:
+        """Approximate size of the columns and the objects only they reference."""
+        total = sum(sys.getsizeof(column) for column in (
+            self.ids, self.titles, self.project_ids, self.task_types, self.dependencies,
+            self.priority, self.status, self.deadline, self.estimated_hours, self._rows,
+        ))
+        total += sum(sys.getsizeof(value) for value in self.ids)
+        total += sum(sys.getsizeof(value) for value in self.titles)
+        total += sum(sys.getsizeof(deps) for deps in self.dependencies if deps)
+        # Interned project ids and task types are shared, so count each once
+        total += sum(sys.getsizeof(value) for value in set(self.project_ids) | set(self.task_types) if value)
+        return total
+
+    def stats(self) -> dict:
+        rows = len(self.ids)
+        size = self.memory_bytes()
+        return {
+            "rows": rows,
+            "memory_bytes": size,
+            "bytes_per_100k_tasks": round(size / rows * 100_000) if rows else 0,
+            "age_seconds": round(time.monotonic() - self.loaded_at, 1) if self.loaded_at else None,
+            "pending_changes": len(self._dirty),
+        }
@@ -0,0 +1,1474 @@
+"""Storage backends for the GTD Task Manager API.
+
+Route handlers talk to a ``Storage`` object exposing one collection per
+attribute (``db.tasks``, ``db.projects``, ...), mirroring the subset of the
+Motor API the app uses. ``MotorStorage`` delegates to MongoDB, while
+``MemoryStorage`` is an indexed in-process engine with the same query
+semantics, used to run the whole API without a server for tests and
+benchmarks.
+
+Both backends report successful writes to listeners registered with
+``Storage.watch`` as ``ChangeEvent``s, which in-process caches use to
+refresh incrementally. Events only cover writes made through this process.
+Write guards registered with ``Storage.guard`` see every document and
+``$set``-style update operand before it is written, so they can enforce
+canonical field types (see ``schema``).
+"""
+import itertools
+import math
+import os
+import re
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+from bson import ObjectId
+import pymongo
+from pymongo import ASCENDING, DESCENDING, TEXT, ReturnDocument
+from pymongo.errors import CollectionInvalid, DuplicateKeyError, OperationFailure
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+IndexKeys = List[Tuple[str, Any]]
+
+# Indexes created on startup for every backend
+INDEXES: Dict[str, List[Tuple[IndexKeys, dict]]] = {
+    "tasks": [
+        ([("id", ASCENDING)], {"unique": True}),
+        ([("dependencies", ASCENDING)], {}),
+        # Listing indexes; task_query only accepts filter/sort shapes these cover
+        ([("project_id", ASCENDING), ("status", ASCENDING), ("deadline", ASCENDING)], {}),
+        ([("project_id", ASCENDING), ("deadline", ASCENDING)], {}),
+        ([("project_id", ASCENDING), ("created_at", ASCENDING)], {}),
+        ([("status", ASCENDING), ("deadline", ASCENDING)], {}),
+        ([("priority", ASCENDING), ("deadline", ASCENDING)], {}),
+        ([("tags", ASCENDING), ("deadline", ASCENDING)], {}),
+        ([("task_type", ASCENDING), ("deadline", ASCENDING)], {}),
+        ([("deadline", ASCENDING)], {}),
+        ([("created_at", ASCENDING)], {}),
+        # Delta sync pages by (change time, id)
+        ([("updated_at", ASCENDING), ("id", ASCENDING)], {}),
+        # Archival scan for finished tasks
+        ([("status", ASCENDING), ("completed_at", ASCENDING)], {}),
+        ([("title", TEXT), ("description", TEXT), ("tags", TEXT)],
+         {"name": "tasks_text", "weights": {"title": 10, "tags": 5, "description": 1}}),
+    ],
+    "archived_tasks": [
+        ([("id", ASCENDING)], {"unique": True}),
+        ([("project_id", ASCENDING), ("completed_at", ASCENDING)], {}),
+    ],
+    "projects": [
+        ([("id", ASCENDING)], {"unique": True}),
+        ([("updated_at", ASCENDING), ("id", ASCENDING)], {}),
+    ],
+    "time_entries": [
+        ([("id", ASCENDING)], {"unique": True}),
+        ([("task_id", ASCENDING), ("end_time", ASCENDING)], {}),
+    ],
+    "task_templates": [
+        ([("id", ASCENDING)], {"unique": True}),
+        ([("created_at", ASCENDING), ("id", ASCENDING)], {}),
+        ([("name", TEXT)], {"name": "task_templates_text"}),
+    ],
+    "comments": [
+        ([("task_id", ASCENDING), ("created_at", DESCENDING)], {}),
+        ([("created_at", ASCENDING), ("id", ASCENDING)], {}),
+        ([("content", TEXT)], {"name": "comments_text"}),
+    ],
+    "tag_counts": [
+        ([("project_id", ASCENDING), ("tag", ASCENDING)], {"unique": True}),
+        ([("tag", ASCENDING)], {}),
+    ],
+    "request_profiles": [
+        ([("id", ASCENDING)], {"unique": True}),
+        ([("created_at", ASCENDING)], {"expireAfterSeconds": 7 * 24 * 3600}),
+    ],
+    "jobs": [
+        ([("id", ASCENDING)], {"unique": True}),
+        # Workers claim due jobs in run_at order
+        ([("status", ASCENDING), ("run_at", ASCENDING)], {}),
+        # At most one unfinished job per dedupe key, even when two processes enqueue at once
+        ([("dedupe_key", ASCENDING)], {"unique": True, "partialFilterExpression": {
+            "dedupe_key": {"$type": "string"}, "status": {"$in": ["queued", "running"]}}}),
+        # Finished jobs are kept for a week; unfinished ones have no finished_at
+        ([("finished_at", ASCENDING)], {"expireAfterSeconds": 7 * 24 * 3600}),
+    ],
+    "sync_tombstones": [
+        # Delta sync reads deletions by time; tokens older than the TTL must resync fully
+        ([("deleted_at", ASCENDING)], {"expireAfterSeconds": 30 * 24 * 3600}),
+    ],
+    "migrations": [
+        ([("name", ASCENDING)], {"unique": True}),
+    ],
+    "idempotency_keys": [
+        ([("key", ASCENDING)], {"unique": True}),
+        # Stored responses are replayed for a day, matching idempotency.IDEMPOTENCY_TTL
+        ([("created_at", ASCENDING)], {"expireAfterSeconds": 24 * 3600}),
+    ],
+}
+
+
+class ChangeEvent(NamedTuple):
+    collection: str
+    operation: str  # insert, update, replace or delete
+    # The "id" values of the written documents; None when the write was not keyed by id
+    ids: Optional[Tuple[Any, ...]]
+
+
+ChangeListener = Callable[[ChangeEvent], None]
+# (collection name, fields, whole document) -> None; may rewrite values in place or raise
+WriteGuard = Callable[[str, dict, bool], None]
+_GUARDED_OPERATORS = ("$set", "$setOnInsert", "$max", "$min")
+
+
+def filter_ids(filter: Optional[dict]) -> Optional[Tuple[Any, ...]]:
+    """The ids a filter is restricted to by an ``id`` equality or ``$in``, if any."""
+    value = (filter or {}).get("id", MISSING)
+    if value is MISSING:
+        return None
+    if isinstance(value, dict):
+        return tuple(value["$in"]) if list(value) == ["$in"] else None
+    return (value,)
+
+
+# Write operations for Collection.bulk_write, independent of the driver's classes
+
+class InsertOne(NamedTuple):
+    document: dict
+
+
+class UpdateOne(NamedTuple):
+    filter: dict
+    update: dict
+    upsert: bool = False
+
+
+class UpdateMany(NamedTuple):
+    filter: dict
+    update: dict
+    upsert: bool = False
+
+
+class ReplaceOne(NamedTuple):
+    filter: dict
+    replacement: dict
+    upsert: bool = False
+
+
+class DeleteOne(NamedTuple):
+    filter: dict
+
+
+class DeleteMany(NamedTuple):
+    filter: dict
+
+
+WriteOperation = Union[InsertOne, UpdateOne, UpdateMany, ReplaceOne, DeleteOne, DeleteMany]
+
+# Operation -> (pymongo class, change event operation)
+_BULK_OPERATIONS = {
+    InsertOne: (pymongo.InsertOne, "insert"),
+    UpdateOne: (pymongo.UpdateOne, "update"),
+    UpdateMany: (pymongo.UpdateMany, "update"),
+    ReplaceOne: (pymongo.ReplaceOne, "replace"),
+    DeleteOne: (pymongo.DeleteOne, "delete"),
+    DeleteMany: (pymongo.DeleteMany, "delete"),
+}
+
+
+class Cursor(ABC):
+    """Chainable query cursor, as returned by ``Collection.find``."""
+
+    @abstractmethod
+    def sort(self, key_or_list, direction=None) -> "Cursor":
+        ...
+
+    @abstractmethod
+    def skip(self, skip: int) -> "Cursor":
+        ...
+
+    @abstractmethod
+    def limit(self, limit: int) -> "Cursor":
+        ...
+
+    @abstractmethod
+    async def to_list(self, length: Optional[int]) -> List[dict]:
+        ...
+
+
+class Collection(ABC):
+    """The collection operations available to route handlers."""
+
+    name: str
+    _listeners: List[ChangeListener]
+    _guards: List[WriteGuard]
+
+    def _guard_document(self, document: dict):
+        for guard in self._guards:
+            guard(self.name, document, True)
+
+    def _guard_update(self, update: dict):
+        if not self._guards or not isinstance(update, dict):
+            return
+        if not any(key.startswith("$") for key in update):
+            self._guard_document(update)
+            return
+        for op in _GUARDED_OPERATORS:
+            if op in update:
+                for guard in self._guards:
+                    guard(self.name, update[op], False)
+
+    def _changed(self, operation: str, count: int, filter: Optional[dict] = None,
+                 documents: Optional[List[dict]] = None):
+        if not self._listeners or not count:
+            return
+        if documents is not None:
+            ids = tuple(document.get("id") for document in documents)
+            ids = None if None in ids else ids
+        else:
+            ids = filter_ids(filter)
+        event = ChangeEvent(self.name, operation, ids)
+        for listener in self._listeners:
+            listener(event)
+
+    @abstractmethod
+    async def find_one(self, filter: Optional[dict] = None, projection: Optional[dict] = None) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def find(self, filter: Optional[dict] = None, projection: Optional[dict] = None, **kwargs) -> Cursor:
+        ...
+
+    @abstractmethod
+    async def insert_one(self, document: dict) -> InsertOneResult:
+        ...
+
+    @abstractmethod
+    async def insert_many(self, documents: Iterable[dict]) -> InsertManyResult:
+        ...
+
+    @abstractmethod
+    async def update_one(self, filter: dict, update: dict, upsert: bool = False) -> UpdateResult:
+        ...
+
+    @abstractmethod
+    async def update_many(self, filter: dict, update: dict, upsert: bool = False) -> UpdateResult:
+        ...
+
+    @abstractmethod
+    async def replace_one(self, filter: dict, replacement: dict, upsert: bool = False) -> UpdateResult:
+        ...
+
+    @abstractmethod
+    async def find_one_and_update(self, filter: dict, update: dict, projection: Optional[dict] = None,
+                                  sort: Optional[IndexKeys] = None, upsert: bool = False,
+                                  return_document: bool = ReturnDocument.BEFORE) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def bulk_write(self, requests: List[WriteOperation], ordered: bool = True) -> BulkWriteResult:
+        """Run write operations (``UpdateOne``, ``InsertOne``, ... from this module) in one batch."""
+        ...
+
+    @abstractmethod
+    async def delete_one(self, filter: dict) -> DeleteResult:
+        ...
+
+    @abstractmethod
+    async def delete_many(self, filter: dict) -> DeleteResult:
+        ...
+
+    @abstractmethod
+    async def count_documents(self, filter: dict) -> int:
+        ...
+
+    @abstractmethod
+    async def distinct(self, key: str, filter: Optional[dict] = None) -> list:
+        ...
+
+    @abstractmethod
+    def aggregate(self, pipeline: List[dict]):
+        """Run an aggregation pipeline; the result supports ``to_list``."""
+
+    @abstractmethod
+    async def create_index(self, keys: IndexKeys, **kwargs) -> str:
+        ...
+
+
+class Storage(ABC):
+    """A database handle; collections are reachable as attributes or items."""
+
+    @abstractmethod
+    def collection(self, name: str) -> Collection:
+        ...
+
+    def __getattr__(self, name: str) -> Collection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self.collection(name)
+
+    def __getitem__(self, name: str) -> Collection:
+        return self.collection(name)
+
+    def watch(self, listener: ChangeListener):
+        """Call ``listener`` with a ``ChangeEvent`` after every write through this handle."""
+        self._listeners.append(listener)
+
+    def guard(self, guard: WriteGuard):
+        """Pass every written document and update operand through ``guard`` first."""
+        if guard not in self._guards:
+            self._guards.append(guard)
+
+    async def create_timeseries(self, name: str, time_field: str, meta_field: str, granularity: str = "seconds"):
+        """Create ``name`` as a time-series collection unless it already exists."""
+        self.collection(name)
+
+    async def create_indexes(self):
+        for name, specs in INDEXES.items():
+            for keys, options in specs:
+                await self.collection(name).create_index(keys, **options)
+
+    def close(self):
+        pass
+
+
+# MongoDB backend
+
+class MotorCollection(Collection):
+    def __init__(self, collection, listeners: Optional[List[ChangeListener]] = None,
+                 guards: Optional[List[WriteGuard]] = None):
+        self._collection = collection
+        self.name = collection.name
+        self._listeners = listeners if listeners is not None else []
+        self._guards = guards if guards is not None else []
+
+    async def find_one(self, filter=None, projection=None):
+        return await self._collection.find_one(filter, projection)
+
+    def find(self, filter=None, projection=None, **kwargs):
+        return self._collection.find(filter, projection, **kwargs)
+
+    async def insert_one(self, document):
+        self._guard_document(document)
+        result = await self._collection.insert_one(document)
+        self._changed("insert", 1, documents=[document])
+        return result
+
+    async def insert_many(self, documents):
+        documents = list(documents)
+        for document in documents:
+            self._guard_document(document)
+        result = await self._collection.insert_many(documents)
+        self._changed("insert", len(documents), documents=documents)
+        return result
+
+    async def update_one(self, filter, update, upsert=False):
+        self._guard_update(update)
+        result = await self._collection.update_one(filter, update, upsert=upsert)
+        self._changed("update", result.matched_count or int(result.upserted_id is not None), filter)
+        return result
+
+    async def update_many(self, filter, update, upsert=False):
+        self._guard_update(update)
+        result = await self._collection.update_many(filter, update, upsert=upsert)
+        self._changed("update", result.matched_count or int(result.upserted_id is not None), filter)
+        return result
+
+    async def replace_one(self, filter, replacement, upsert=False):
+        self._guard_document(replacement)
+        result = await self._collection.replace_one(filter, replacement, upsert=upsert)
+        self._changed("replace", result.matched_count or int(result.upserted_id is not None), filter)
+        return result
+
+    async def find_one_and_update(self, filter, update, projection=None, sort=None, upsert=False,
+                                  return_document=ReturnDocument.BEFORE):
+        self._guard_update(update)
+        document = await self._collection.find_one_and_update(
+            filter, update, projection=projection, sort=sort, upsert=upsert, return_document=return_document
+        )
+        self._changed("update", int(document is not None or upsert), filter)
+        return document
+
+    async def bulk_write(self, requests, ordered=True):
+        requests = list(requests)
+        for request in requests:
+            if isinstance(request, InsertOne):
+                self._guard_document(request.document)
+            elif isinstance(request, ReplaceOne):
+                self._guard_document(request.replacement)
+            elif isinstance(request, (UpdateOne, UpdateMany)):
+                self._guard_update(request.update)
+        result = await self._collection.bulk_write(
+            [_BULK_OPERATIONS[type(request)][0](*request) for request in requests], ordered=ordered
+        )
+        for request in requests:
+            if isinstance(request, InsertOne):
+                self._changed("insert", 1, documents=[request.document])
+            else:
+                self._changed(_BULK_OPERATIONS[type(request)][1], 1, request.filter)
+        return result
+
+    async def delete_one(self, filter):
+        result = await self._collection.delete_one(filter)
+        self._changed("delete", result.deleted_count, filter)
+        return result
+
+    async def delete_many(self, filter):
+        result = await self._collection.delete_many(filter)
+        self._changed("delete", result.deleted_count, filter)
+        return result
+
+    async def count_documents(self, filter):
+        return await self._collection.count_documents(filter)
+
+    async def distinct(self, key, filter=None):
+        return await self._collection.distinct(key, filter)
+
+    def aggregate(self, pipeline):
+        return self._collection.aggregate(pipeline)
+
+    async def create_index(self, keys, **kwargs):
+        return await self._collection.create_index(keys, **kwargs)
+
+
+class MotorStorage(Storage):
+    def __init__(self, mongo_url: str, db_name: str, **client_kwargs):
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        self.client = AsyncIOMotorClient(mongo_url, **client_kwargs)
+        self.database = self.client[db_name]
+        self._collections: Dict[str, MotorCollection] = {}
+        self._listeners: List[ChangeListener] = []
+        self._guards: List[WriteGuard] = []
+
+    def collection(self, name):
+        if name not in self._collections:
+            self._collections[name] = MotorCollection(self.database[name], self._listeners, self._guards)
+        return self._collections[name]
+
+    async def create_timeseries(self, name, time_field, meta_field, granularity="seconds"):
+        try:
+            await self.database.create_collection(
+                name, timeseries={"timeField": time_field, "metaField": meta_field, "granularity": granularity}
+            )
+        except CollectionInvalid:
+            pass  # Already exists
+
+    def close(self):
+        self.client.close()
+
+
+# In-memory backend
+
+class _Missing:
+    def __repr__(self):
+        return "MISSING"
+
+
+MISSING = _Missing()
+
+# BSON comparison order of the types the app stores
+_TYPE_ORDER = [
+    (bool, 8),
+    ((int, float), 1),
+    (str, 2),
+    (dict, 3),
+    (list, 4),
+    (bytes, 5),
+    (ObjectId, 7),
+    (datetime, 9),
+]
+_COMPARABLE = {1, 2, 7, 8, 9}
+
+
+def _type_rank(value) -> int:
+    if value is None or value is MISSING:
+        return 0
+    for types, rank in _TYPE_ORDER:
+        if isinstance(value, types):
+            return rank
+    return 10
+
+
+def encode(value):
+    """Normalise a value the way a BSON round trip would."""
+    if isinstance(value, dict):
+        return {key: encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [encode(item) for item in value]
+    if isinstance(value, Enum):
+        return encode(value.value)
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.replace(microsecond=value.microsecond // 1000 * 1000)
+    return value
+
+
+def _clone(value):
+    if isinstance(value, dict):
+        return {key: _clone(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_clone(item) for item in value]
+    return value
+
+
+def _resolve(value, parts: List[str]) -> list:
+    """Values found at a dotted path, descending into arrays of sub-documents."""
+    if not parts:
+        return [value]
+    head, rest = parts[0], parts[1:]
+    if isinstance(value, dict):
+        return _resolve(value[head], rest) if head in value else [MISSING]
+    if isinstance(value, list):
+        if head.isdigit():
+            index = int(head)
+            return _resolve(value[index], rest) if index < len(value) else [MISSING]
+        found = [
+            item for element in value if isinstance(element, dict)
+            for item in _resolve(element, parts) if item is not MISSING
+        ]
+        return found or [MISSING]
+    return [MISSING]
+
+
+def get_path(document: dict, path: str) -> list:
+    return _resolve(document, path.split("."))
+
+
+def _expand(values: list) -> list:
+    """Candidate values for matching: arrays match as a whole or per element."""
+    expanded = []
+    for value in values:
+        expanded.append(value)
+        if isinstance(value, list):
+            expanded.extend(value)
+    return expanded
+
+
+def _equals(a, b) -> bool:
+    if (a is None or a is MISSING) and (b is None or b is MISSING):
+        return True
+    if isinstance(b, re.Pattern):
+        return isinstance(a, str) and b.search(a) is not None
+    if _type_rank(a) != _type_rank(b):
+        return False
+    return a == b
+
+
+def _compare(a, b) -> Optional[int]:
+    rank = _type_rank(a)
+    if rank != _type_rank(b) or rank not in _COMPARABLE:
+        return None
+    return (a > b) - (a < b)
+
+
+def _sort_key(value):
+    if value is MISSING:
+        value = None
+    rank = _type_rank(value)
+    if rank in _COMPARABLE:
+        return (rank, value)
+    if rank == 0:
+        return (rank, 0)
+    return (rank, repr(value))
+
+
+# $type aliases the memory backend can tell apart
+_TYPE_ALIASES = {"string": str, "bool": bool, "date": datetime, "array": list, "object": dict, "null": type(None)}
+
+
+def _match_operators(values: list, conditions: dict) -> bool:
+    candidates = _expand(values)
+    for op, arg in conditions.items():
+        if op == "$eq":
+            ok = any(_equals(v, arg) for v in candidates)
+        elif op == "$ne":
+            ok = not any(_equals(v, arg) for v in candidates)
+        elif op in ("$gt", "$gte", "$lt", "$lte"):
+            ok = False
+            for v in candidates:
+                result = _compare(v, arg)
+                if result is None:
+                    continue
+                if (op == "$gt" and result > 0) or (op == "$gte" and result >= 0) \
+                        or (op == "$lt" and result < 0) or (op == "$lte" and result <= 0):
+                    ok = True
+                    break
+        elif op == "$in":
+            ok = any(_equals(v, item) for v in candidates for item in arg)
+        elif op == "$nin":
+            ok = not any(_equals(v, item) for v in candidates for item in arg)
+        elif op == "$exists":
+            ok = any(v is not MISSING for v in values) == bool(arg)
+        elif op == "$type":
+            ok = any(v is not MISSING and isinstance(v, _TYPE_ALIASES[arg]) for v in candidates)
+        elif op == "$all":
+            ok = all(any(_equals(v, item) for v in candidates) for item in arg)
+        elif op == "$size":
+            ok = any(isinstance(v, list) and len(v) == arg for v in values)
+        elif op == "$regex":
+            flags = re.IGNORECASE if "i" in conditions.get("$options", "") else 0
+            pattern = arg if isinstance(arg, re.Pattern) else re.compile(arg, flags)
+            ok = any(isinstance(v, str) and pattern.search(v) for v in candidates)
+        elif op == "$options":
+            continue
+        elif op == "$not":
+            ok = not _match_operators(values, arg)
+        elif op == "$elemMatch":
+            ok = any(
+                isinstance(v, list) and any(_match_element(element, arg) for element in v)
+                for v in values
+            )
+        else:
+            raise ValueError(f"Unsupported query operator {op}")
+        if not ok:
+            return False
+    return True
+
+
+def _is_operator_dict(value) -> bool:
+    return isinstance(value, dict) and bool(value) and all(key.startswith("$") for key in value)
+
+
+def _match_element(element, condition) -> bool:
+    if _is_operator_dict(condition) and not any(key in ("$and", "$or", "$nor") for key in condition):
+        return _match_operators([element], condition)
+    return isinstance(element, dict) and matches(element, condition)
+
+
+def matches(document: dict, filter: Optional[dict]) -> bool:
+    """Whether ``document`` satisfies a MongoDB query document."""
+    if not filter:
+        return True
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(matches(document, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(document, sub) for sub in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(document, sub) for sub in condition):
+                return False
+        elif key.startswith("$"):
+            raise ValueError(f"Unsupported query operator {key}")
+        else:
+            values = get_path(document, key)
+            if _is_operator_dict(condition):
+                if not _match_operators(values, condition):
+                    return False
+            elif not any(_equals(v, condition) for v in _expand(values)):
+                return False
+    return True
+
+
+def _set_path(document: dict, path: str, value):
+    parts = path.split(".")
+    target = document
+    for part in parts[:-1]:
+        if isinstance(target, list):
+            target = target[int(part)]
+            continue
+        if not isinstance(target.get(part), (dict, list)):
+            target[part] = {}
+        target = target[part]
+    if isinstance(target, list):
+        target[int(parts[-1])] = value
+    else:
+        target[parts[-1]] = value
+
+
+def _unset_path(document: dict, path: str):
+    parts = path.split(".")
+    target = document
+    for part in parts[:-1]:
+        target = target.get(part) if isinstance(target, dict) else None
+        if target is None:
+            return
+    if isinstance(target, dict):
+        target.pop(parts[-1], None)
+
+
+def _get_single(document: dict, path: str):
+    value = get_path(document, path)[0]
+    return None if value is MISSING else value
+
+
+def apply_update(document: dict, update: dict, inserting: bool = False) -> dict:
+    """Apply a MongoDB update document in place and return the document."""
+    if not any(key.startswith("$") for key in update):
+        preserved = document.get("_id")
+        document.clear()
+        document.update(encode(update))
+        if preserved is not None:
+            document.setdefault("_id", preserved)
+        return document
+    for op, fields in update.items():
+        fields = encode(fields)
+        if op == "$set" or (op == "$setOnInsert" and inserting):
+            for path, value in fields.items():
+                _set_path(document, path, value)
+        elif op == "$setOnInsert":
+            continue
+        elif op == "$unset":
+            for path in fields:
+                _unset_path(document, path)
+        elif op == "$inc":
+            for path, amount in fields.items():
+                _set_path(document, path, (_get_single(document, path) or 0) + amount)
+        elif op in ("$min", "$max"):
+            for path, value in fields.items():
+                current = _get_single(document, path)
+                result = None if current is None else _compare(value, current)
+                if current is None or (result is not None and (result < 0 if op == "$min" else result > 0)):
+                    _set_path(document, path, value)
+        elif op in ("$push", "$addToSet"):
+            for path, value in fields.items():
+                items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                current = _get_single(document, path)
+                current = list(current) if isinstance(current, list) else []
+                for item in items:
+                    if op == "$push" or not any(_equals(existing, item) for existing in current):
+                        current.append(item)
+                _set_path(document, path, current)
+        elif op == "$pull":
+            for path, condition in fields.items():
+                current = _get_single(document, path)
+                if isinstance(current, list):
+                    if isinstance(condition, dict):
+                        kept = [item for item in current if not _match_element(item, condition)]
+                    else:
+                        kept = [item for item in current if not _equals(item, condition)]
+                    _set_path(document, path, kept)
+        else:
+            raise ValueError(f"Unsupported update operator {op}")
+    return document
+
+
+def _upsert_seed(filter: dict) -> dict:
+    seed = {}
+    for key, condition in (filter or {}).items():
+        if key.startswith("$"):
+            continue
+        if isinstance(condition, dict) and "$eq" in condition:
+            condition = condition["$eq"]
+        if not _is_operator_dict(condition):
+            _set_path(seed, key, encode(condition))
+    return seed
+
+
+def project(document: dict, projection: Optional[dict]) -> dict:
+    if not projection:
+        return document
+    include_id = bool(projection.get("_id", 1))
+    fields = {key: value for key, value in projection.items() if key != "_id"}
+    if fields and all(fields.values()):
+        result = {}
+        if include_id and "_id" in document:
+            result["_id"] = document["_id"]
+        for path in fields:
+            value = get_path(document, path)[0]
+            if value is not MISSING:
+                _set_path(result, path, value)
+        return result
+    result = dict(document)
+    for path in fields:
+        _unset_path(result, path)
+    if not include_id:
+        result.pop("_id", None)
+    return result
+
+
+# Aggregation
+
+def evaluate(expression, document: dict):
+    """Evaluate an aggregation expression against a document."""
+    if isinstance(expression, str) and expression.startswith("$"):
+        value = get_path(document, expression[1:])
+        value = value[0] if len(value) == 1 else [v for v in value if v is not MISSING]
+        return None if value is MISSING else value
+    if isinstance(expression, list):
+        return [evaluate(item, document) for item in expression]
+    if isinstance(expression, dict):
+        if len(expression) == 1:
+            op, args = next(iter(expression.items()))
+            if op.startswith("$"):
+                return _evaluate_operator(op, args, document)
+        return {key: evaluate(value, document) for key, value in expression.items()}
+    return expression
+
+
+def _evaluate_operator(op: str, args, document: dict):
+    if op == "$literal":
+        return args
+    if op == "$dateToString":
+        date = evaluate(args["date"], document)
+        return date.strftime(args.get("format", "%Y-%m-%dT%H:%M:%S.%LZ").replace("%L", "000")) if date else None
+    values = [evaluate(arg, document) for arg in (args if isinstance(args, list) else [args])]
+    if op == "$ifNull":
+        return next((value for value in values if value is not None), None)
+    if op == "$size":
+        return len(values[0] or [])
+    if op == "$cond":
+        if isinstance(args, dict):
+            values = [evaluate(args[key], document) for key in ("if", "then", "else")]
+        return values[1] if values[0] else values[2]
+    if op == "$eq":
+        return _equals(values[0], values[1])
+    if op == "$ne":
+        return not _equals(values[0], values[1])
+    if op in ("$gt", "$gte", "$lt", "$lte"):
+        result = _compare(values[0], values[1])
+        return result is not None and {"$gt": result > 0, "$gte": result >= 0,
+                                       "$lt": result < 0, "$lte": result <= 0}[op]
+    if op == "$in":
+        return any(_equals(values[0], item) for item in values[1] or [])
+    if op == "$and":
+        return all(values)
+    if op == "$or":
+        return any(values)
+    if op == "$add":
+        return sum(value or 0 for value in values)
+    if op == "$subtract":
+        return (values[0] or 0) - (values[1] or 0)
+    if op == "$multiply":
+        result = 1
+        for value in values:
+            result *= value or 0
+        return result
+    if op == "$divide":
+        return values[0] / values[1] if values[1] else None
+    if op == "$toLower":
+        return (values[0] or "").lower()
+    raise ValueError(f"Unsupported aggregation operator {op}")
+
+
+def _accumulate(op: str, values: list):
+    present = [value for value in values if value is not None]
+    if op == "$sum":
+        return sum(value for value in present if isinstance(value, (int, float)) and not isinstance(value, bool))
+    if op == "$avg":
+        numbers = [value for value in present if isinstance(value, (int, float))]
+        return sum(numbers) / len(numbers) if numbers else None
+    if op in ("$min", "$max"):
+        if not present:
+            return None
+        ordered = sorted(present, key=_sort_key)
+        return ordered[0] if op == "$min" else ordered[-1]
+    if op == "$first":
+        return values[0] if values else None
+    if op == "$last":
+        return values[-1] if values else None
+    if op == "$push":
+        return list(values)
+    if op == "$addToSet":
+        found = []
+        for value in values:
+            if not any(_equals(value, seen) for seen in found):
+                found.append(value)
+        return found
+    raise ValueError(f"Unsupported accumulator {op}")
+
+
+def run_pipeline(documents: List[dict], pipeline: List[dict]) -> List[dict]:
+    for stage in pipeline:
+        (name, spec), = stage.items()
+        if name == "$match":
+            spec = encode(spec)
+            documents = [doc for doc in documents if matches(doc, spec)]
+        elif name == "$unwind":
+            path = spec if isinstance(spec, str) else spec["path"]
+            keep_empty = isinstance(spec, dict) and spec.get("preserveNullAndEmptyArrays", False)
+            field = path[1:]
+            unwound = []
+            for doc in documents:
+                value = _get_single(doc, field)
+                if isinstance(value, list) and value:
+                    for item in value:
+                        copy_ = _clone(doc)
+                        _set_path(copy_, field, item)
+                        unwound.append(copy_)
+                elif value is not None and not isinstance(value, list):
+                    unwound.append(doc)
+                elif keep_empty:
+                    unwound.append(doc)
+            documents = unwound
+        elif name == "$group":
+            groups: Dict[Any, Tuple[Any, List[dict]]] = {}
+            for doc in documents:
+                key = evaluate(spec["_id"], doc)
+                groups.setdefault(_hashable(key), (key, []))[1].append(doc)
+            grouped = []
+            for key, members in groups.values():
+                result = {"_id": key}
+                for field, accumulator in spec.items():
+                    if field == "_id":
+                        continue
+                    (op, expression), = accumulator.items()
+                    result[field] = _accumulate(op, [evaluate(expression, doc) for doc in members])
+                grouped.append(result)
+            documents = grouped
+        elif name == "$sort":
+            for field, direction in reversed(list(spec.items())):
+                documents.sort(key=lambda doc: _sort_key(get_path(doc, field)[0]), reverse=direction == DESCENDING)
+        elif name == "$skip":
+            documents = documents[spec:]
+        elif name == "$limit":
+            documents = documents[:spec]
+        elif name == "$count":
+            documents = [{spec: len(documents)}] if documents else []
+        elif name == "$project":
+            computed = {key: value for key, value in spec.items() if not isinstance(value, (bool, int))}
+            included = [key for key, value in spec.items() if key not in computed and value and key != "_id"]
+            if not computed and not included:
+                documents = [project(doc, spec) for doc in documents]
+                continue
+            projected = []
+            for doc in documents:
+                result = {"_id": doc["_id"]} if spec.get("_id", 1) and "_id" in doc else {}
+                for key in included:
+                    value = get_path(doc, key)[0]
+                    if value is not MISSING:
+                        _set_path(result, key, value)
+                for key, expression in computed.items():
+                    _set_path(result, key, evaluate(expression, doc))
+                projected.append(result)
+            documents = projected
+        elif name == "$addFields" or name == "$set":
+            for doc in documents:
+                for key, expression in spec.items():
+                    _set_path(doc, key, evaluate(expression, doc))
+        else:
+            raise ValueError(f"Unsupported pipeline stage {name}")
+    return documents
+
+
+class MemoryAggregateCursor:
+    def __init__(self, documents: List[dict]):
+        self._documents = documents
+
+    async def to_list(self, length):
+        return self._documents if length is None else self._documents[:length]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in self._documents:
+            yield document
+
+
+def _normalise_keys(keys) -> IndexKeys:
+    if isinstance(keys, str):
+        return [(keys, ASCENDING)]
+    return [(field, direction) for field, direction in keys]
+
+
+def _hashable(value):
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return repr(value)
+
+
+# Text analysis shared by the in-memory text index and search highlighting
+STOP_WORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the this to was were will with"
+    .split()
+)
+_WORD = re.compile(r"\w+", re.UNICODE)
+_SUFFIXES = ("ing", "ed", "es", "s")
+
+
+def stem(word: str) -> str:
+    """Crude suffix stripping so "tasks", "tasked" and "task" share a term."""
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def text_terms(text: str) -> List[str]:
+    return [stem(word) for word in _WORD.findall(text.lower()) if word not in STOP_WORDS]
+
+
+def parse_text_search(search: str) -> Tuple[List[str], List[str], List[str]]:
+    """Split a ``$text`` search string into terms, quoted phrases and negated terms."""
+    phrases = re.findall(r'"([^"]+)"', search)
+    rest = re.sub(r'"[^"]*"', " ", search)
+    negated = [term for word in re.findall(r"-(\w+)", rest) for term in text_terms(word)]
+    rest = re.sub(r"-\w+", " ", rest)
+    terms = text_terms(rest) + [term for phrase in phrases for term in text_terms(phrase)]
+    return list(dict.fromkeys(terms)), phrases, negated
+
+
+class _TextIndex:
+    """Inverted index backing ``$text`` queries, weighted per field like MongoDB."""
+
+    def __init__(self, name: str, fields: List[str], weights: Optional[dict] = None):
+        self.name = name
+        self.fields = fields
+        self.weights = {field: (weights or {}).get(field, 1) for field in fields}
+        self.postings: Dict[str, Dict[Any, float]] = {}
+
+    def _field_text(self, document: dict, field: str) -> List[str]:
+        texts = []
+        for value in get_path(document, field):
+            for item in (value if isinstance(value, list) else [value]):
+                if isinstance(item, str):
+                    texts.append(item)
+        return texts
+
+    def _term_scores(self, document: dict) -> Dict[str, float]:
+        scores: Dict[str, float] = {}
+        for field in self.fields:
+            counts: Dict[str, int] = {}
+            for text in self._field_text(document, field):
+                for term in text_terms(text):
+                    counts[term] = counts.get(term, 0) + 1
+            for term, count in counts.items():
+                scores[term] = scores.get(term, 0.0) + self.weights[field] * (1 + math.log(count))
+        return scores
+
+    def add(self, document: dict):
+        for term, score in self._term_scores(document).items():
+            self.postings.setdefault(term, {})[document["_id"]] = score
+
+    def remove(self, document: dict):
+        for term in self._term_scores(document):
+            bucket = self.postings.get(term)
+            if bucket is not None:
+                bucket.pop(document["_id"], None)
+                if not bucket:
+                    del self.postings[term]
+
+    def search(self, search: str, documents: Dict[Any, dict]) -> Dict[Any, float]:
+        terms, phrases, negated = parse_text_search(search)
+        scores: Dict[Any, float] = {}
+        for term in terms:
+            for _id, score in self.postings.get(term, {}).items():
+                scores[_id] = scores.get(_id, 0.0) + score
+        for term in negated:
+            for _id in self.postings.get(term, {}):
+                scores.pop(_id, None)
+        for phrase in phrases:
+            needle = phrase.lower()
+            scores = {
+                _id: score for _id, score in scores.items()
+                if any(needle in text.lower() for field in self.fields
+                       for text in self._field_text(documents[_id], field))
+            }
+        return scores
+
+
+class _Index:
+    """A hash index over the first key of an index specification.
+
+    With ``partial`` the unique constraint only holds among documents matching it;
+    every document is still indexed for lookups.
+    """
+
+    def __init__(self, name: str, keys: IndexKeys, unique: bool = False, partial: Optional[dict] = None):
+        self.name = name
+        self.keys = keys
+        self.field = keys[0][0]
+        self.unique = unique
+        self.partial = partial
+        self.entries: Dict[Any, Dict[Any, None]] = {}
+
+    def values(self, document: dict) -> list:
+        found = [None if v is MISSING else v for v in get_path(document, self.field)]
+        values = []
+        for value in found:
+            if isinstance(value, list):
+                values.extend(value or [None])
+            else:
+                values.append(value)
+        return [_hashable(value) for value in values]
+
+    def constrains(self, document: dict) -> bool:
+        return self.unique and (self.partial is None or matches(document, self.partial))
+
+    def unique_key(self, document: dict) -> tuple:
+        return tuple(_hashable(_get_single(document, field)) for field, _ in self.keys)
+
+    def add(self, document: dict):
+        for value in self.values(document):
+            self.entries.setdefault(value, {})[document["_id"]] = None
+
+    def remove(self, document: dict):
+        for value in self.values(document):
+            bucket = self.entries.get(value)
+            if bucket is not None:
+                bucket.pop(document["_id"], None)
+                if not bucket:
+                    del self.entries[value]
+
+    def lookup(self, values: list) -> Dict[Any, None]:
+        if len(values) == 1:
+            return self.entries.get(_hashable(values[0]), {})
+        found: Dict[Any, None] = {}
+        for value in values:
+            found.update(self.entries.get(_hashable(value), {}))
+        return found
+
+
+class MemoryCursor(Cursor):
+    def __init__(self, collection: "MemoryCollection", filter, projection, sort=None, skip=0, limit=0):
+        self._collection = collection
+        self._filter = filter
+        self._projection = projection
+        self._sort: IndexKeys = []
+        self._skip = skip
+        self._limit = limit
+        if sort:
+            self.sort(sort)
+
+    def sort(self, key_or_list, direction=None):
+        if isinstance(key_or_list, str):
+            self._sort = [(key_or_list, direction or ASCENDING)]
+        else:
+            self._sort = list(key_or_list)
+        return self
+
+    def skip(self, skip):
+        self._skip = skip
+        return self
+
+    def limit(self, limit):
+        self._limit = limit
+        return self
+
+    def _documents(self) -> List[dict]:
+        documents, scores = self._collection._search(self._filter)
+        for field, direction in reversed(self._sort):
+            if isinstance(direction, dict):
+                documents.sort(key=lambda doc: scores.get(doc["_id"], 0.0) if scores else 0.0, reverse=True)
+            else:
+                documents.sort(key=lambda doc: _sort_key(get_path(doc, field)[0]), reverse=direction == DESCENDING)
+        if self._skip:
+            documents = documents[self._skip:]
+        if self._limit:
+            documents = documents[:self._limit]
+        projection = self._projection
+        meta_fields = [key for key, value in (projection or {}).items() if isinstance(value, dict)]
+        if meta_fields:
+            projection = {key: value for key, value in projection.items() if key not in meta_fields}
+        results = []
+        for doc in documents:
+            result = project(_clone(doc), projection)
+            for field in meta_fields:
+                result[field] = scores.get(doc["_id"], 0.0) if scores else 0.0
+            results.append(result)
+        return results
+
+    async def to_list(self, length):
+        documents = self._documents()
+        return documents if length is None else documents[:length]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in self._documents():
+            yield document
+
+
+class MemoryCollection(Collection):
+    def __init__(self, name: str, listeners: Optional[List[ChangeListener]] = None,
+                 guards: Optional[List[WriteGuard]] = None):
+        self.name = name
+        self._listeners = listeners if listeners is not None else []
+        self._guards = guards if guards is not None else []
+        self._documents: Dict[Any, dict] = {}
+        self._order: Dict[Any, int] = {}
+        self._counter = itertools.count()
+        self._indexes: Dict[str, _Index] = {}
+        self._text_index: Optional[_TextIndex] = None
+
+    # Query planning
+
+    def _candidates(self, filter: Optional[dict]) -> Optional[Dict[Any, None]]:
+        """Smallest set of ids an equality or ``$in`` on an indexed field allows."""
+        best = None
+        for index in self._indexes.values():
+            condition = (filter or {}).get(index.field, MISSING)
+            if condition is MISSING:
+                continue
+            if isinstance(condition, dict):
+                if set(condition) == {"$eq"}:
+                    values = [condition["$eq"]]
+                elif set(condition) == {"$in"}:
+                    values = list(condition["$in"])
+                elif set(condition) == {"$all"} and condition["$all"]:
+                    values = [condition["$all"][0]]
+                else:
+                    continue
+            elif isinstance(condition, (list, re.Pattern)):
+                continue
+            else:
+                values = [condition]
+            found = index.lookup([encode(value) for value in values])
+            if best is None or len(found) < len(best):
+                best = found
+        if best is None and filter and "_id" in filter and not isinstance(filter["_id"], dict):
+            best = {filter["_id"]: None} if filter["_id"] in self._documents else {}
+        return best
+
+    def _search(self, filter: Optional[dict]) -> Tuple[List[dict], Optional[Dict[Any, float]]]:
+        """Matching documents and, for ``$text`` queries, their text scores."""
+        filter = encode(filter or {})
+        scores = None
+        if "$text" in filter:
+            filter = dict(filter)
+            text = filter.pop("$text")
+            if self._text_index is None:
+                raise OperationFailure("text index required for $text query", code=27)
+            scores = self._text_index.search(text["$search"], self._documents)
+        candidates = self._candidates(filter)
+        if scores is not None:
+            candidates = scores if candidates is None else {_id: None for _id in candidates if _id in scores}
+        if candidates is None:
+            documents = self._documents.values()
+        else:
+            ids = sorted(candidates, key=self._order.__getitem__) if len(candidates) > 1 else candidates
+            documents = (self._documents[_id] for _id in ids)
+        return [doc for doc in documents if matches(doc, filter)], scores
+
+    def _query(self, filter: Optional[dict]) -> List[dict]:
+        return self._search(filter)[0]
+
+    # Index maintenance
+
+    def _index_add(self, document: dict):
+        for index in self._indexes.values():
+            if index.constrains(document):
+                key = index.unique_key(document)
+                for other_id in index.lookup([key[0]]):
+                    other = self._documents[other_id]
+                    if other_id != document["_id"] and index.constrains(other) and index.unique_key(other) == key:
+                        raise DuplicateKeyError(
+                            f"E11000 duplicate key error collection: {self.name} index: {index.name}"
+                        )
+        for index in self._indexes.values():
+            index.add(document)
+        if self._text_index is not None:
+            self._text_index.add(document)
+
+    def _index_remove(self, document: dict):
+        for index in self._indexes.values():
+            index.remove(document)
+        if self._text_index is not None:
+            self._text_index.remove(document)
+
+    def _store(self, document: dict):
+        if document["_id"] in self._documents:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: _id_")
+        self._index_add(document)
+        self._documents[document["_id"]] = document
+        self._order[document["_id"]] = next(self._counter)
+
+    def _discard(self, document: dict):
+        self._index_remove(document)
+        del self._documents[document["_id"]]
+        del self._order[document["_id"]]
+
+    def _modify(self, document: dict, update: dict) -> bool:
+        before = _clone(document)
+        self._index_remove(document)
+        apply_update(document, update)
+        try:
+            self._index_add(document)
+        except DuplicateKeyError:
+            document.clear()
+            document.update(before)
+            self._index_add(document)
+            raise
+        return document != before
+
+    # Collection API
+
+    async def find_one(self, filter=None, projection=None):
+        documents = self._query(filter)
+        return project(_clone(documents[0]), projection) if documents else None
+
+    def find(self, filter=None, projection=None, **kwargs):
+        return MemoryCursor(self, filter, projection, **kwargs)
+
+    async def insert_one(self, document):
+        self._guard_document(document)
+        document.setdefault("_id", ObjectId())
+        self._store(encode(document))
+        self._changed("insert", 1, documents=[document])
+        return InsertOneResult(document["_id"], True)
+
+    async def insert_many(self, documents):
+        documents = list(documents)
+        inserted = []
+        try:
+            for document in documents:
+                self._guard_document(document)
+                document.setdefault("_id", ObjectId())
+                self._store(encode(document))
+                inserted.append(document["_id"])
+        finally:
+            self._changed("insert", len(inserted), documents=documents[:len(inserted)])
+        return InsertManyResult(inserted, True)
+
+    def _upsert(self, filter: dict, update: dict) -> Any:
+        document = _upsert_seed(filter)
+        apply_update(document, update, inserting=True)
+        document.setdefault("_id", ObjectId())
+        self._store(document)
+        return document["_id"]
+
+    def _update_first(self, filter, update, upsert, operation):
+        self._guard_update(update)
+        documents = self._query(filter)[:1]
+        if not documents:
+            if upsert:
+                upserted = self._upsert(filter, update)
+                self._changed(operation, 1, filter)
+                return UpdateResult({"n": 1, "nModified": 0, "upserted": upserted}, True)
+            return UpdateResult({"n": 0, "nModified": 0}, True)
+        modified = self._modify(documents[0], update)
+        self._changed(operation, 1, filter)
+        return UpdateResult({"n": 1, "nModified": int(modified)}, True)
+
+    async def update_one(self, filter, update, upsert=False):
+        return self._update_first(filter, update, upsert, "update")
+
+    async def update_many(self, filter, update, upsert=False):
+        self._guard_update(update)
+        documents = self._query(filter)
+        if not documents and upsert:
+            upserted = self._upsert(filter, update)
+            self._changed("update", 1, filter)
+            return UpdateResult({"n": 1, "nModified": 0, "upserted": upserted}, True)
+        modified = sum(self._modify(document, update) for document in documents)
+        self._changed("update", len(documents), filter)
+        return UpdateResult({"n": len(documents), "nModified": modified}, True)
+
+    async def replace_one(self, filter, replacement, upsert=False):
+        return self._update_first(filter, {key: value for key, value in replacement.items() if key != "_id"},
+                                  upsert, "replace")
+
+    async def find_one_and_update(self, filter, update, projection=None, sort=None, upsert=False,
+                                  return_document=ReturnDocument.BEFORE):
+        self._guard_update(update)
+        documents = await MemoryCursor(self, filter, None, sort=sort, limit=1).to_list(1)
+        if not documents:
+            if not upsert:
+                return None
+            _id = self._upsert(filter, update)
+            self._changed("update", 1, filter)
+            return project(_clone(self._documents[_id]), projection) if return_document else None
+        document = self._documents[documents[0]["_id"]]
+        before = _clone(document)
+        self._modify(document, update)
+        self._changed("update", 1, filter)
+        return project(_clone(document) if return_document else before, projection)
+
+    async def bulk_write(self, requests, ordered=True):
+        # Unordered batches are applied in order too, which is one valid outcome
+        counts = {"nInserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "nUpserted": 0, "upserted": []}
+        for index, request in enumerate(requests):
+            if isinstance(request, InsertOne):
+                await self.insert_one(request.document)
+                counts["nInserted"] += 1
+            elif isinstance(request, (DeleteOne, DeleteMany)):
+                delete = self.delete_one if isinstance(request, DeleteOne) else self.delete_many
+                counts["nRemoved"] += (await delete(request.filter)).deleted_count
+            else:
+                if isinstance(request, ReplaceOne):
+                    result = await self.replace_one(request.filter, request.replacement, upsert=request.upsert)
+                elif isinstance(request, UpdateOne):
+                    result = await self.update_one(request.filter, request.update, upsert=request.upsert)
+                else:
+                    result = await self.update_many(request.filter, request.update, upsert=request.upsert)
+                if result.upserted_id is not None:
+                    counts["nUpserted"] += 1
+                    counts["upserted"].append({"index": index, "_id": result.upserted_id})
+                else:
+                    counts["nMatched"] += result.matched_count
+                    counts["nModified"] += result.modified_count
+        return BulkWriteResult(counts, True)
+
+    async def delete_one(self, filter):
+        documents = self._query(filter)[:1]
+        for document in documents:
+            self._discard(document)
+        self._changed("delete", len(documents), filter)
+        return DeleteResult({"n": len(documents)}, True)
+
+    async def delete_many(self, filter):
+        documents = self._query(filter)
+        for document in documents:
+            self._discard(document)
+        self._changed("delete", len(documents), filter)
+        return DeleteResult({"n": len(documents)}, True)
+
+    async def count_documents(self, filter):
+        return len(self._query(filter))
+
+    async def distinct(self, key, filter=None):
+        found = []
+        for document in self._query(filter):
+            for value in get_path(document, key):
+                for item in (value if isinstance(value, list) else [value]):
+                    if item is not MISSING and not any(_equals(item, seen) for seen in found):
+                        found.append(_clone(item))
+        return found
+
+    def aggregate(self, pipeline):
+        # A leading $match (including $text) is answered through the indexes
+        pipeline = list(pipeline)
+        first = pipeline.pop(0)["$match"] if pipeline and "$match" in pipeline[0] else None
+        documents = [_clone(doc) for doc in self._query(first)]
+        return MemoryAggregateCursor(run_pipeline(documents, pipeline))
+
+    async def create_index(self, keys, unique=False, name=None, weights=None, partialFilterExpression=None,
+                           **kwargs):
+        keys = _normalise_keys(keys)
+        name = name or "_".join(f"{field}_{direction}" for field, direction in keys)
+        if any(direction == "text" for _, direction in keys):
+            if self._text_index is None:
+                self._text_index = _TextIndex(name, [field for field, _ in keys], weights)
+                for document in self._documents.values():
+                    self._text_index.add(document)
+            return self._text_index.name
+        if name not in self._indexes:
+            index = _Index(name, keys, unique=unique, partial=partialFilterExpression)
+            for document in self._documents.values():
+                index.add(document)
+            self._indexes[name] = index
+        return name
+
+
+class MemoryStorage(Storage):
+    """Process-local storage with the query semantics of the MongoDB backend."""
+
+    def __init__(self):
+        self._collections: Dict[str, MemoryCollection] = {}
+        self._listeners: List[ChangeListener] = []
+        self._guards: List[WriteGuard] = []
+
+    def collection(self, name):
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(name, self._listeners, self._guards)
+        return self._collections[name]
+
+
+def create_storage(backend: Optional[str] = None, **client_kwargs) -> Storage:
+    """Build the storage backend selected by ``STORAGE_BACKEND``.
+
+    ``client_kwargs`` (e.g. ``event_listeners``) are passed to the Motor client.
+    """
+    backend = backend or os.environ.get('STORAGE_BACKEND', 'mongo')
+    if backend == "memory":
+        return MemoryStorage()
+    if backend == "mongo":
+        return MotorStorage(os.environ['MONGO_URL'], os.environ['DB_NAME'], **client_kwargs)
+    raise ValueError(f"Unknown storage backend: {backend}")
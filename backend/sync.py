@@ -0,0 +1,197 @@
+"""Delta sync for clients keeping a local replica.
+
+``GET /api/sync`` returns the tasks, projects, comments and templates
+changed since a token it issued earlier, plus the ids deleted since then,
+so a refresh costs as much as the changes rather than the dataset.
+
+Changes are found by each collection's change timestamp (``updated_at``,
+or ``created_at`` for the insert-only comments and templates) and deletes
+by ``sync_tombstones``, which delete paths fill through
+``record_deletions``; both are indexed. Archived tasks and deleted
+projects read as deletions too.
+
+A sync round reads each collection in ``(change timestamp, id)`` order,
+page by page; the token carries one such cursor per collection, so a page
+always moves forward even when many documents share a timestamp. The round
+ends when every collection is exhausted, and the deletions since the round
+began are returned with its last page. The next round starts from the time
+the round began, less ``SYNC_OVERLAP_SECONDS`` to cover writes that were
+stamped before but committed after the read (buffered ``actual_hours``
+updates are stamped when flushed, see ``write_behind``), so consecutive
+rounds may repeat a document and clients apply them idempotently. Tombstones expire after
+``TOMBSTONE_RETENTION``; tokens whose round starts from earlier than that
+get ``TokenExpired`` and the client starts over without one. Only the
+round's start is checked, never a page cursor, so a full sync of old data
+pages through normally.
+"""
+import base64
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+SYNC_PAGE_SIZE = int(os.environ.get('SYNC_PAGE_SIZE', '1000'))
+SYNC_OVERLAP_SECONDS = float(os.environ.get('SYNC_OVERLAP_SECONDS', '5'))
+TOMBSTONE_RETENTION = timedelta(days=30)  # The TTL of sync_tombstones in storage.INDEXES
+
+TOMBSTONES = "sync_tombstones"
+TOKEN_VERSION = 2
+
+# API name -> (collection, change timestamp field)
+SYNCED: Dict[str, Tuple[str, str]] = {
+    "tasks": ("tasks", "updated_at"),
+    "projects": ("projects", "updated_at"),
+    "comments": ("comments", "created_at"),
+    "templates": ("task_templates", "created_at"),
+}
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+class TokenExpired(Exception):
+    pass
+
+
+class SyncToken(NamedTuple):
+    # Changes since this time; None for a full sync
+    since: Optional[datetime]
+    # When the round's first page was read; None between rounds
+    started: Optional[datetime] = None
+    # API name -> (timestamp, id) of the last document returned, or None once exhausted
+    cursors: Dict[str, Optional[Tuple[Optional[datetime], str]]] = {}
+
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _micros(moment: Optional[datetime]) -> Optional[int]:
+    return None if moment is None else (moment - _EPOCH) // timedelta(microseconds=1)
+
+
+def _moment(micros: Optional[int]) -> Optional[datetime]:
+    return None if micros is None else _EPOCH + timedelta(microseconds=micros)
+
+
+def encode_token(token: SyncToken) -> str:
+    payload = {
+        "v": TOKEN_VERSION,
+        "since": _micros(token.since),
+        "started": _micros(token.started),
+        "cursors": {name: None if cursor is None else [_micros(cursor[0]), cursor[1]]
+                    for name, cursor in token.cursors.items()},
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_token(token: str) -> SyncToken:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        if payload["v"] != TOKEN_VERSION or not set(payload["cursors"]) <= set(SYNCED):
+            raise ValueError(payload["v"])
+        return SyncToken(
+            since=_moment(payload["since"]),
+            started=_moment(payload["started"]),
+            cursors={name: None if cursor is None else (_moment(cursor[0]), str(cursor[1]))
+                     for name, cursor in payload["cursors"].items()},
+        )
+    except (ValueError, TypeError, KeyError, AttributeError, IndexError) as e:
+        raise InvalidToken(f"Invalid sync token: {token}") from e
+
+
+async def record_deletions(db, collection: str, ids: List[str], reason: str = "deleted"):
+    if not ids:
+        return
+    now = datetime.utcnow()
+    await db[TOMBSTONES].insert_many([
+        {"collection": collection, "id": document_id, "reason": reason, "deleted_at": now}
+        for document_id in ids
+    ])
+
+
+def _after(field: str, cursor: Tuple[Optional[datetime], str]) -> dict:
+    moment, last_id = cursor
+    if moment is None:
+        # Documents without the timestamp sort first
+        return {"$or": [{field: {"$ne": None}}, {field: None, "id": {"$gt": last_id}}]}
+    return {"$or": [{field: {"$gt": moment}}, {field: moment, "id": {"$gt": last_id}}]}
+
+
+async def _deletions(db, since: datetime) -> Dict[str, List[str]]:
+    tombstones = await db[TOMBSTONES].find(
+        {"deleted_at": {"$gte": since}}, {"_id": 0}
+    ).sort("deleted_at", 1).to_list(None)
+    deleted = {}
+    for name, (collection, field) in SYNCED.items():
+        latest = {}
+        for tombstone in tombstones:
+            if tombstone["collection"] == collection:
+                latest[tombstone["id"]] = max(tombstone["deleted_at"], latest.get(tombstone["id"], since))
+        # An id deleted and then written again (a restored task) is current, not deleted
+        current = await db[collection].find(
+            {"id": {"$in": list(latest)}}, {"_id": 0, "id": 1, field: 1, "deleted": 1}
+        ).to_list(None) if latest else []
+        rewritten = {document["id"] for document in current
+                     if not document.get("deleted") and (document.get(field) or _EPOCH) >= latest[document["id"]]}
+        deleted[name] = [document_id for document_id in latest if document_id not in rewritten]
+    return deleted
+
+
+async def changes_since(db, token: Optional[str], page_size: int = SYNC_PAGE_SIZE,
+                        projections: Optional[Dict[str, dict]] = None) -> dict:
+    """One page of documents changed and ids deleted since ``token``; everything current when it is None.
+
+    ``projections`` maps API names to the fields returned for their documents; the
+    paging and deletion fields are always read.
+    """
+    state = decode_token(token) if token else SyncToken(since=None)
+    read_at = datetime.utcnow()
+    if state.since is not None and read_at - state.since > TOMBSTONE_RETENTION:
+        raise TokenExpired(token)
+    started = state.started or read_at
+
+    changes, deleted, cursors = {}, {}, {}
+    for name, (collection, field) in SYNCED.items():
+        changes[name], deleted[name] = [], []
+        cursor = state.cursors.get(name, ())
+        if cursor is None:
+            cursors[name] = None
+            continue
+        conditions = [{field: {"$gte": state.since}}] if state.since else []
+        if cursor:
+            conditions.append(_after(field, cursor))
+        query = conditions[0] if len(conditions) == 1 else {"$and": conditions} if conditions else {}
+        projection = {"_id": 0}
+        if projections and name in projections:
+            projection = {**projections[name], "_id": 0, "id": 1, field: 1, "deleted": 1}
+        documents = await db[collection].find(query, projection).sort(
+            [(field, 1), ("id", 1)]
+        ).limit(page_size + 1).to_list(page_size + 1)
+        if len(documents) > page_size:
+            documents = documents[:page_size]
+            cursors[name] = (documents[-1].get(field), documents[-1]["id"])
+        else:
+            cursors[name] = None
+        for document in documents:
+            # Deleted projects stay until their cascade finishes; replicas drop them right away
+            if document.get("deleted"):
+                deleted[name].append(document["id"])
+            else:
+                changes[name].append(document)
+
+    has_more = any(cursor is not None for cursor in cursors.values())
+    if has_more:
+        next_token = SyncToken(since=state.since, started=started, cursors=cursors)
+    else:
+        if state.since is not None:
+            for name, ids in (await _deletions(db, state.since)).items():
+                deleted[name].extend(ids)
+        next_token = SyncToken(since=started - timedelta(seconds=SYNC_OVERLAP_SECONDS))
+    return {
+        "token": encode_token(next_token),
+        "has_more": has_more,
+        "full": state.since is None,
+        "changes": changes,
+        "deleted": deleted,
+    }
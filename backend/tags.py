@@ -0,0 +1,77 @@
+"""Per-project tag counts maintained alongside task writes.
+
+``tag_counts`` holds one document per (project_id, tag) with the number of
+non-template tasks carrying that tag, so tag listings never scan tasks.
+Write paths pass the task documents before and after the change to
+``record_tag_changes``; ``rebuild_tag_counts`` recomputes the collection
+from the tasks if it ever drifts.
+"""
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+TagKey = Tuple[Optional[str], str]
+
+
+def _counted_tags(task: Optional[dict]) -> Counter:
+    if not task or task.get("is_template"):
+        return Counter()
+    return Counter((task.get("project_id"), tag) for tag in task.get("tags") or [])
+
+
+def tag_deltas(changes: Iterable[Tuple[Optional[dict], Optional[dict]]]) -> Dict[TagKey, int]:
+    """Net count change per (project_id, tag) for (before, after) task pairs."""
+    deltas: Counter = Counter()
+    for before, after in changes:
+        deltas.update(_counted_tags(after))
+        deltas.subtract(_counted_tags(before))
+    return {key: delta for key, delta in deltas.items() if delta}
+
+
+async def apply_tag_deltas(db, deltas: Dict[TagKey, int]):
+    for (project_id, tag), delta in deltas.items():
+        selector = {"project_id": project_id, "tag": tag}
+        try:
+            await db.tag_counts.update_one(selector, {"$inc": {"count": delta}}, upsert=True)
+        except DuplicateKeyError:
+            # A concurrent upsert created the document first
+            await db.tag_counts.update_one(selector, {"$inc": {"count": delta}})
+    if any(delta < 0 for delta in deltas.values()):
+        await db.tag_counts.delete_many({"count": {"$lte": 0}})
+
+
+async def record_tag_changes(db, changes: Iterable[Tuple[Optional[dict], Optional[dict]]]):
+    deltas = tag_deltas(changes)
+    if deltas:
+        await apply_tag_deltas(db, deltas)
+
+
+async def list_tags(db, project_id: Optional[str] = None, limit: int = 100) -> List[dict]:
+    if project_id:
+        counts = await db.tag_counts.find(
+            {"project_id": project_id}, {"_id": 0, "tag": 1, "count": 1}
+        ).sort([("count", -1), ("tag", 1)]).to_list(limit)
+        return counts
+    totals: Dict[str, dict] = {}
+    for entry in await db.tag_counts.find({}, {"_id": 0}).to_list(None):
+        total = totals.setdefault(entry["tag"], {"tag": entry["tag"], "count": 0, "projects": {}})
+        total["count"] += entry["count"]
+        total["projects"][entry["project_id"] or "none"] = entry["count"]
+    return sorted(totals.values(), key=lambda item: (-item["count"], item["tag"]))[:limit]
+
+
+async def rebuild_tag_counts(db) -> int:
+    """Recompute ``tag_counts`` from the tasks; returns the number of entries."""
+    grouped = await db.tasks.aggregate([
+        {"$match": {"is_template": {"$ne": True}, "tags.0": {"$exists": True}}},
+        {"$unwind": "$tags"},
+        {"$group": {"_id": {"project_id": "$project_id", "tag": "$tags"}, "count": {"$sum": 1}}},
+    ]).to_list(None)
+    await db.tag_counts.delete_many({})
+    if grouped:
+        await db.tag_counts.insert_many([
+            {"project_id": group["_id"].get("project_id"), "tag": group["_id"]["tag"], "count": group["count"]}
+            for group in grouped
+        ])
+    return len(grouped)
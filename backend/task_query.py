@@ -0,0 +1,130 @@
+"""Filtered task listing translated to index-friendly MongoDB queries.
+
+A query shape (equality fields, range fields, sort) is only accepted when
+one of the task indexes in ``storage.INDEXES`` can serve it: its equality
+fields must form a prefix of the index keys, followed by the sort field if
+one is requested, and at least one equality field must lead the index so
+the scan is bounded. Predicates that cannot use an index (``is_template``,
+``has_dependencies``) are applied to the rows the index selects.
+"""
+from datetime import datetime
+from typing import List, Optional, Set, Tuple
+
+from pymongo import ASCENDING, DESCENDING, TEXT
+
+from storage import INDEXES, IndexKeys
+
+EQUALITY_FIELDS = ("project_id", "status", "priority", "tags", "task_type")
+SORT_FIELDS = ("deadline", "created_at", "updated_at")
+
+
+class UnsupportedQuery(ValueError):
+    pass
+
+
+def _task_indexes() -> List[IndexKeys]:
+    return [
+        keys for keys, options in INDEXES["tasks"]
+        if keys[0][0] in EQUALITY_FIELDS + SORT_FIELDS
+        and not options.get("unique") and not any(direction == TEXT for _, direction in keys)
+    ]
+
+
+def covering_index(equality: Set[str], ranges: Set[str], sort_field: Optional[str]) -> Optional[IndexKeys]:
+    """The first task index able to serve the shape, if any."""
+    for keys in _task_indexes():
+        fields = [field for field, _ in keys]
+        prefix = 0
+        while prefix < len(fields) and fields[prefix] in equality:
+            prefix += 1
+        if equality and not prefix:
+            continue
+        rest = fields[prefix:]
+        if sort_field:
+            if rest and rest[0] == sort_field:
+                return keys
+        elif prefix or (rest and rest[0] in ranges):
+            return keys
+    return None
+
+
+def supported_shapes() -> List[str]:
+    """Human-readable list of the accepted filter/sort combinations."""
+    leading = sorted({keys[0][0] for keys in _task_indexes() if keys[0][0] not in SORT_FIELDS})
+    shapes = [f"unsorted filters including one of {{{', '.join(leading)}}}"]
+    for keys in _task_indexes():
+        fields = [field for field, _ in keys]
+        for split in range(len(fields)):
+            equality, sort_field = fields[:split], fields[split]
+            if sort_field in SORT_FIELDS:
+                shapes.append(f"filter on {{{', '.join(equality)}}} sorted by {sort_field}" if equality
+                              else f"sorted by {sort_field}")
+    return shapes[:1] + sorted(set(shapes[1:]))
+
+
+def parse_sort(sort: Optional[str]) -> Optional[Tuple[str, int]]:
+    if not sort:
+        return None
+    direction = DESCENDING if sort.startswith("-") else ASCENDING
+    field = sort.lstrip("+-")
+    if field not in SORT_FIELDS:
+        raise UnsupportedQuery(f"Unsupported sort field '{field}'; use one of {', '.join(SORT_FIELDS)}")
+    return field, direction
+
+
+def _one_or_in(values: List[str]):
+    return values[0] if len(values) == 1 else {"$in": values}
+
+
+def build_task_query(
+    project_id: Optional[str] = None,
+    statuses: Optional[List[str]] = None,
+    priorities: Optional[List[str]] = None,
+    tags: Optional[List[str]] = None,
+    tag_mode: str = "any",
+    deadline_from: Optional[datetime] = None,
+    deadline_to: Optional[datetime] = None,
+    task_type: Optional[str] = None,
+    has_dependencies: Optional[bool] = None,
+    include_templates: bool = False,
+    sort: Optional[str] = None,
+) -> Tuple[dict, Optional[Tuple[str, int]]]:
+    """MongoDB filter and sort for a task listing, or ``UnsupportedQuery``."""
+    query = {}
+    equality: Set[str] = set()
+    ranges: Set[str] = set()
+
+    if project_id:
+        query["project_id"] = project_id
+        equality.add("project_id")
+    if statuses:
+        query["status"] = _one_or_in(statuses)
+        equality.add("status")
+    if priorities:
+        query["priority"] = _one_or_in(priorities)
+        equality.add("priority")
+    if tags:
+        query["tags"] = {"$all": tags} if tag_mode == "all" else _one_or_in(tags)
+        equality.add("tags")
+    if task_type:
+        query["task_type"] = task_type
+        equality.add("task_type")
+    if deadline_from or deadline_to:
+        bounds = {}
+        if deadline_from:
+            bounds["$gte"] = deadline_from
+        if deadline_to:
+            bounds["$lte"] = deadline_to
+        query["deadline"] = bounds
+        ranges.add("deadline")
+    if has_dependencies is not None:
+        query["dependencies.0"] = {"$exists": has_dependencies}
+    if not include_templates:
+        query["is_template"] = {"$ne": True}
+
+    order = parse_sort(sort)
+    if (equality or ranges or order) and covering_index(equality, ranges, order[0] if order else None) is None:
+        raise UnsupportedQuery(
+            "No index supports this combination of filters and sort. Supported: " + "; ".join(supported_shapes())
+        )
+    return query, order
@@ -0,0 +1,76 @@
+"""Placeholder rendering for task templates.
+
+``title_template`` and ``description_template`` may contain placeholders
+such as ``{n}``, ``{date}`` or ``{date:%d %b}``, and any custom variable
+supplied when instantiating, with an optional format spec after a colon.
+Placeholders without a value are left as written, so templates with
+literal braces render unchanged. Parsed templates are cached by text, so
+rendering a batch parses each template once. Format specs whose width or
+precision exceeds ``MAX_FORMAT_WIDTH`` are rejected with ``InvalidTemplate``
+when the template is compiled, since rendering them allocates that much.
+"""
+import os
+import re
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Any, Dict, Tuple, Union
+
+TEMPLATE_CACHE_SIZE = int(os.environ.get('TEMPLATE_CACHE_SIZE', '256'))
+MAX_FORMAT_WIDTH = 100
+
+_PLACEHOLDER = re.compile(r"\{(\w+)(?::([^{}]*))?\}")
+# [[fill]align][sign][z][#][0][width][grouping][.precision][type]; strftime specs do not match
+_STANDARD_SPEC = re.compile(r"(?:.?[<>=^])?[+\- ]?z?#?0?(\d*)[_,]?(?:\.(\d*))?[bcdeEfFgGnosxX%]?", re.DOTALL)
+
+# Literal text, or (name, format spec, original text) for a placeholder
+Part = Union[str, Tuple[str, str, str]]
+
+
+class InvalidTemplate(ValueError):
+    pass
+
+
+def _check_spec(spec: str, original: str):
+    standard = _STANDARD_SPEC.fullmatch(spec)
+    if standard and any(int(size) > MAX_FORMAT_WIDTH for size in standard.groups() if size):
+        raise InvalidTemplate(f"Width and precision in {original} may be at most {MAX_FORMAT_WIDTH}")
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def compile_template(text: str) -> Tuple[Part, ...]:
+    parts = []
+    position = 0
+    for match in _PLACEHOLDER.finditer(text):
+        if match.start() > position:
+            parts.append(text[position:match.start()])
+        spec = match.group(2) or ""
+        _check_spec(spec, match.group())
+        parts.append((match.group(1), spec, match.group()))
+        position = match.end()
+    if position < len(text):
+        parts.append(text[position:])
+    return tuple(parts)
+
+
+def _format(value: Any, spec: str) -> str:
+    if isinstance(value, (date, datetime)):
+        return value.strftime(spec) if spec else value.isoformat()[:10]
+    try:
+        return format(value, spec)
+    except (TypeError, ValueError):
+        # A spec that does not fit the value type is ignored rather than failing the batch
+        return str(value)
+
+
+def render(text: str, variables: Dict[str, Any]) -> str:
+    parts = compile_template(text or "")
+    if len(parts) == 1 and isinstance(parts[0], str):
+        return parts[0]
+    rendered = []
+    for part in parts:
+        if isinstance(part, str):
+            rendered.append(part)
+        else:
+            name, spec, original = part
+            rendered.append(_format(variables[name], spec) if name in variables else original)
+    return "".join(rendered)
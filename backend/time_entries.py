@@ -0,0 +1,262 @@
+"""Time entry storage, optionally backed by a MongoDB time-series collection.
+
+Running timers always live in ``time_entries``, because they are updated
+when they stop. With ``TIME_ENTRIES_TIMESERIES=1``, stopping a timer moves
+the finished entry into ``time_entry_history``, a time-series collection
+(``timeField=start_time``, ``metaField=meta`` holding ``task_id`` and
+``project_id``). MongoDB buckets that history by task and time, so it takes
+less space and range reports read fewer blocks as it grows. Finished
+entries already in ``time_entries`` are moved by ``migrate_to_timeseries``,
+which runs as a job on startup.
+
+The helpers here read and aggregate both collections, so callers do not
+depend on the mode.
+"""
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING
+
+from storage import UpdateOne
+
+TIME_ENTRIES_TIMESERIES = os.environ.get('TIME_ENTRIES_TIMESERIES', '').lower() in ('1', 'true', 'yes')
+HISTORY = "time_entry_history"
+HISTORY_INDEXES = [
+    [("meta.task_id", ASCENDING), ("start_time", ASCENDING)],
+    [("meta.project_id", ASCENDING), ("start_time", ASCENDING)],
+]
+MIGRATION_BATCH_SIZE = 1000
+
+REPORT_GROUPS = {
+    "task": "$task_id",
+    "project": "$project_id",
+    "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$start_time"}},
+}
+
+
+async def ensure_storage(db):
+    """Create the time-series collection and its indexes when enabled."""
+    if not TIME_ENTRIES_TIMESERIES:
+        return
+    await db.create_timeseries(HISTORY, time_field="start_time", meta_field="meta", granularity="hours")
+    for keys in HISTORY_INDEXES:
+        await db[HISTORY].create_index(keys)
+
+
+def to_history(entry: dict) -> dict:
+    return {
+        "id": entry["id"],
+        "start_time": entry["start_time"],
+        "end_time": entry.get("end_time"),
+        "duration_minutes": entry.get("duration_minutes"),
+        "description": entry.get("description", ""),
+        "meta": {"task_id": entry["task_id"], "project_id": entry.get("project_id")},
+    }
+
+
+def from_history(entry: dict) -> dict:
+    meta = entry.get("meta") or {}
+    return {
+        "id": entry["id"],
+        "task_id": meta.get("task_id"),
+        "project_id": meta.get("project_id"),
+        "start_time": entry["start_time"],
+        "end_time": entry.get("end_time"),
+        "duration_minutes": entry.get("duration_minutes"),
+        "description": entry.get("description", ""),
+    }
+
+
+async def complete_entry(db, entry: dict, end_time: datetime, duration_minutes: int):
+    if not TIME_ENTRIES_TIMESERIES:
+        await db.time_entries.update_one(
+            {"id": entry["id"]},
+            {"$set": {"end_time": end_time, "duration_minutes": duration_minutes}}
+        )
+        return
+    # Finish the entry in place first: after a crash at any point the finished entry is either
+    # still in time_entries, where the migration moves it, or already in the history
+    finished = {"end_time": end_time, "duration_minutes": duration_minutes}
+    await db.time_entries.update_one({"id": entry["id"]}, {"$set": finished})
+    await db[HISTORY].insert_one(to_history({**entry, **finished}))
+    await db.time_entries.delete_one({"id": entry["id"]})
+
+
+async def entries_for_task(db, task_id: str, limit: int = 100) -> List[dict]:
+    entries = await db.time_entries.find({"task_id": task_id}, {"_id": 0}).to_list(limit)
+    if TIME_ENTRIES_TIMESERIES:
+        history = await db[HISTORY].find({"meta.task_id": task_id}, {"_id": 0}).sort(
+            "start_time", ASCENDING
+        ).to_list(limit)
+        entries = sorted(entries + [from_history(entry) for entry in history], key=lambda e: e["start_time"])
+    return entries[:limit]
+
+
+async def entries_for_tasks(db, task_ids: List[str], limit_per_task: int = 100) -> Dict[str, List[dict]]:
+    """Entries of several tasks in one query per collection, oldest first."""
+    grouped: Dict[str, List[dict]] = {task_id: [] for task_id in task_ids}
+    entries = await db.time_entries.find({"task_id": {"$in": task_ids}}, {"_id": 0}).to_list(None)
+    if TIME_ENTRIES_TIMESERIES:
+        history = await db[HISTORY].find({"meta.task_id": {"$in": task_ids}}, {"_id": 0}).to_list(None)
+        entries += [from_history(entry) for entry in history]
+    for entry in sorted(entries, key=lambda e: e["start_time"]):
+        grouped[entry["task_id"]].append(entry)
+    return {task_id: found[:limit_per_task] for task_id, found in grouped.items()}
+
+
+def empty_summary() -> dict:
+    return {"entry_count": 0, "total_minutes": 0, "last_entry_at": None}
+
+
+def summary_increment(duration_minutes: int, end_time: datetime) -> Tuple[dict, dict]:
+    """``$inc`` and ``$max`` fields that add one finished entry to a task's ``time_summary``."""
+    return (
+        {"time_summary.entry_count": 1, "time_summary.total_minutes": duration_minutes},
+        {"time_summary.last_entry_at": end_time},
+    )
+
+
+async def summaries(db, task_ids: List[str]) -> Dict[str, dict]:
+    """``time_summary`` rollups recomputed from the finished entries of the tasks."""
+    rows = await _aggregate_both(db, {"task_id": {"$in": task_ids}, "duration_minutes": {"$ne": None}}, {
+        "_id": "$task_id", "entry_count": {"$sum": 1}, "total_minutes": {"$sum": "$duration_minutes"},
+        "last_entry_at": {"$max": "$end_time"},
+    })
+    found = {row.pop("_id"): row for row in rows}
+    return {task_id: {**empty_summary(), **found.get(task_id, {})} for task_id in task_ids}
+
+
+async def delete_for_tasks(db, task_ids: List[str]):
+    await db.time_entries.delete_many({"task_id": {"$in": task_ids}})
+    if TIME_ENTRIES_TIMESERIES:
+        # Filters on the metaField are what time-series deletes support
+        await db[HISTORY].delete_many({"meta.task_id": {"$in": task_ids}})
+
+
+def _flat(stage_match: dict, history: bool) -> List[dict]:
+    if not history:
+        return [{"$match": stage_match}]
+    return [
+        {"$match": {("meta." + key if key in ("task_id", "project_id") else key): value
+                    for key, value in stage_match.items()}},
+        {"$project": {"task_id": "$meta.task_id", "project_id": "$meta.project_id", "start_time": 1,
+                      "end_time": 1, "duration_minutes": 1}},
+    ]
+
+
+async def _aggregate_both(db, match: dict, group: dict) -> List[dict]:
+    """``$group`` over both collections; ``$sum`` fields are added up and ``$max`` fields maximised."""
+    sources = [(db.time_entries, False)]
+    if TIME_ENTRIES_TIMESERIES:
+        sources.append((db[HISTORY], True))
+    maxima = {key for key, spec in group.items() if isinstance(spec, dict) and "$max" in spec}
+    merged: Dict[object, dict] = {}
+    for collection, history in sources:
+        for row in await collection.aggregate(_flat(match, history) + [{"$group": group}]).to_list(None):
+            current = merged.setdefault(row.pop("_id"), {})
+            for key, value in row.items():
+                if key in maxima:
+                    current[key] = max(filter(lambda v: v is not None, [current.get(key), value]), default=None)
+                else:
+                    current[key] = current.get(key, 0) + (value or 0)
+    return [{"_id": key, **values} for key, values in merged.items()]
+
+
+async def totals(db) -> dict:
+    """Entry count and tracked minutes across all entries."""
+    rows = await _aggregate_both(db, {}, {
+        "_id": None, "entries": {"$sum": 1}, "minutes": {"$sum": {"$ifNull": ["$duration_minutes", 0]}},
+    })
+    return {"entries": rows[0]["entries"], "minutes": rows[0]["minutes"]} if rows else {"entries": 0, "minutes": 0}
+
+
+async def time_report(db, start: datetime, end: datetime, group_by: str = "day",
+                 project_id: Optional[str] = None) -> List[dict]:
+    """Tracked minutes of finished entries that started in ``[start, end)``, grouped."""
+    match = {"start_time": {"$gte": start, "$lt": end}, "duration_minutes": {"$ne": None}}
+    if project_id:
+        match["project_id"] = project_id
+    rows = await _aggregate_both(db, match, {
+        "_id": REPORT_GROUPS[group_by], "entries": {"$sum": 1}, "minutes": {"$sum": "$duration_minutes"},
+    })
+    return sorted(({group_by: row["_id"], "entries": row["entries"], "minutes": row["minutes"]} for row in rows),
+                  key=lambda row: (row[group_by] is None, row[group_by] or ""))
+
+
+async def migrate_to_timeseries(db, batch_size: int = MIGRATION_BATCH_SIZE, report=None) -> dict:
+    """Move finished entries from ``time_entries`` into the time-series collection.
+
+    Entries are copied before they are deleted, and each batch skips ids
+    already in the history, so an interrupted run can simply be repeated.
+    """
+    moved = 0
+    while True:
+        batch = await db.time_entries.find(
+            {"end_time": {"$ne": None}}, {"_id": 0}
+        ).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        # Entries from before project_id was recorded get it from their task
+        missing = {entry["task_id"] for entry in batch if "project_id" not in entry}
+        if missing:
+            tasks = await db.tasks.find({"id": {"$in": list(missing)}}, {"_id": 0, "id": 1, "project_id": 1}).to_list(None)
+            projects = {task["id"]: task.get("project_id") for task in tasks}
+            for entry in batch:
+                entry.setdefault("project_id", projects.get(entry["task_id"]))
+        ids = [entry["id"] for entry in batch]
+        existing = set(await db[HISTORY].distinct("id", {
+            "meta.task_id": {"$in": list({entry["task_id"] for entry in batch})}, "id": {"$in": ids},
+        }))
+        fresh = [to_history(entry) for entry in batch if entry["id"] not in existing]
+        if fresh:
+            await db[HISTORY].insert_many(fresh)
+        await db.time_entries.delete_many({"id": {"$in": ids}})
+        moved += len(fresh)
+        if report:
+            await report(moved=moved)
+    return {"moved": moved}
+
+
+async def embed_rollups(db, batch_size: int = MIGRATION_BATCH_SIZE, report=None,
+                        collection: str = "tasks") -> dict:
+    """Replace embedded ``Task.time_entries`` arrays in ``collection`` with a ``time_summary`` rollup.
+
+    Embedded entries missing from the collection are copied there first,
+    then the rollup is recomputed from the collection, so rerunning is safe.
+    """
+    migrated = copied = 0
+    while True:
+        tasks = await db[collection].find(
+            {"$or": [{"time_entries": {"$exists": True}}, {"time_summary": {"$exists": False}}]},
+            {"_id": 0, "id": 1, "project_id": 1, "time_entries": 1}
+        ).limit(batch_size).to_list(batch_size)
+        if not tasks:
+            break
+        embedded = [
+            {"id": entry.get("id") or f"{task['id']}:{index}", "task_id": task["id"],
+             "project_id": task.get("project_id"), "start_time": entry.get("start_time"),
+             "end_time": entry.get("end_time"), "duration_minutes": entry.get("duration_minutes"),
+             "description": entry.get("description", "")}
+            for task in tasks for index, entry in enumerate(task.get("time_entries") or [])
+            if isinstance(entry, dict) and entry.get("start_time")
+        ]
+        if embedded:
+            known = set(await db.time_entries.distinct("id", {"id": {"$in": [e["id"] for e in embedded]}}))
+            if TIME_ENTRIES_TIMESERIES:
+                known.update(await db[HISTORY].distinct("id", {
+                    "meta.task_id": {"$in": [task["id"] for task in tasks]}, "id": {"$in": [e["id"] for e in embedded]},
+                }))
+            fresh = [entry for entry in embedded if entry["id"] not in known]
+            if fresh:
+                await db.time_entries.insert_many(fresh)
+                copied += len(fresh)
+        rollups = await summaries(db, [task["id"] for task in tasks])
+        await db[collection].bulk_write([
+            UpdateOne({"id": task_id}, {"$set": {"time_summary": summary}, "$unset": {"time_entries": ""}})
+            for task_id, summary in rollups.items()
+        ], ordered=False)
+        migrated += len(tasks)
+        if report:
+            await report(migrated=migrated, copied_entries=copied)
+    return {"tasks": migrated, "copied_entries": copied}
@@ -0,0 +1,140 @@
+"""Write-behind coalescing of counter updates on hot documents.
+
+Stopping a timer increments the task's ``actual_hours`` and bumps its
+``updated_at``. With many timers on the same tasks those single-field
+writes dominate, so ``IncrementBuffer`` can hold them for a short window,
+merge everything pending per document (``$inc`` values are summed,
+``$max`` values keep the largest) and flush one ``bulk_write`` per window.
+
+Durability: only the buffered increments are deferred. Callers write the
+source records (the time entries) immediately, so a crash loses at most
+one window of ``actual_hours`` increments, which the time entries still
+account for. Reads may lag the buffered increments by up to one window.
+With ``stamp`` the named timestamp field is raised to the flush time, so a
+delta sync that ran while the change was buffered still picks it up,
+however long the window.
+A failed flush is merged back and retried on the next one; ``stop``
+flushes whatever is left.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+import metrics
+from storage import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# Flush window in milliseconds; 0 writes through immediately
+TIME_WRITE_BEHIND_MS = float(os.environ.get('TIME_WRITE_BEHIND_MS', '0'))
+
+
+class _Pending:
+    __slots__ = ("inc", "max", "since")
+
+    def __init__(self, since: float):
+        self.inc: Dict[str, float] = {}
+        self.max: Dict[str, object] = {}
+        self.since = since
+
+
+class IncrementBuffer:
+    def __init__(self, name: str, get_storage, collection: str, window_ms: float = TIME_WRITE_BEHIND_MS,
+                 stamp: Optional[str] = None):
+        self.name = name
+        self.get_storage = get_storage
+        self.collection = collection
+        self.window = window_ms / 1000
+        self.stamp = stamp
+        self._pending: Dict[str, _Pending] = {}
+        self._flusher: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    async def add(self, document_id: str, inc: Optional[dict] = None, max: Optional[dict] = None):
+        """Apply ``$inc``/``$max`` to the document, now or within one window when buffering."""
+        if not self.enabled:
+            update = {}
+            if inc:
+                update["$inc"] = inc
+            if max:
+                update["$max"] = max
+            await self.get_storage()[self.collection].update_one({"id": document_id}, update)
+            return
+        pending = self._pending.get(document_id)
+        if pending is None:
+            pending = self._pending[document_id] = _Pending(time.monotonic())
+        else:
+            metrics.WRITE_BEHIND_COALESCED.labels(self.name).inc()
+        self._merge(pending, inc or {}, max or {})
+        metrics.WRITE_BEHIND_PENDING.labels(self.name).set(len(self._pending))
+
+    @staticmethod
+    def _merge(pending: _Pending, inc: dict, max: dict):
+        for field, value in inc.items():
+            pending.inc[field] = pending.inc.get(field, 0) + value
+        for field, value in max.items():
+            if field not in pending.max or value > pending.max[field]:
+                pending.max[field] = value
+
+    async def flush(self) -> int:
+        """Write everything pending; returns the number of documents written."""
+        if not self._pending:
+            return 0
+        batch, self._pending = self._pending, {}
+        now = time.monotonic()
+        flushed_at = datetime.utcnow()
+        requests = []
+        for document_id, pending in batch.items():
+            update = {}
+            if pending.inc:
+                update["$inc"] = pending.inc
+            if pending.max or self.stamp:
+                update["$max"] = {**pending.max, self.stamp: flushed_at} if self.stamp else pending.max
+            requests.append(UpdateOne({"id": document_id}, update))
+        try:
+            await self.get_storage()[self.collection].bulk_write(requests, ordered=False)
+        except Exception:
+            # Requeue so the increments are not lost; newer changes merge on top
+            metrics.WRITE_BEHIND_FAILURES.labels(self.name).inc()
+            logger.exception("Write-behind flush of %d %s documents failed; retrying", len(batch), self.collection)
+            for document_id, pending in batch.items():
+                current = self._pending.get(document_id)
+                if current is None:
+                    self._pending[document_id] = pending
+                else:
+                    self._merge(current, pending.inc, pending.max)
+                    current.since = min(current.since, pending.since)
+            raise
+        finally:
+            metrics.WRITE_BEHIND_PENDING.labels(self.name).set(len(self._pending))
+        metrics.WRITE_BEHIND_FLUSH_LAG.labels(self.name).observe(now - min(p.since for p in batch.values()))
+        metrics.WRITE_BEHIND_FLUSH_SIZE.labels(self.name).observe(len(requests))
+        return len(requests)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.window)
+            try:
+                await self.flush()
+            except Exception:
+                pass  # Logged and requeued by flush
+
+    async def start(self):
+        if self.enabled and self._flusher is None:
+            self._flusher = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.error("Dropping %d buffered %s updates at shutdown", len(self._pending), self.collection)
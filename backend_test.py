@@ -542,9 +542,17 @@ def test_project_deletion(project_id):
         return False
     
     try:
+        # Deletion is accepted and the task cascade runs as a background job
         response = requests.delete(f"{API_URL}/projects/{project_id}")
-        success = response.status_code == 200 and "message" in response.json()
-        print_result("Delete Project", success, response.json())
+        data = response.json()
+        success = response.status_code == 202 and "job_id" in data and "deletion" in data
+        print_result("Delete Project", success, data)
+        if not success:
+            return False
+        
+        response = requests.get(f"{API_URL}/projects/{project_id}/deletion")
+        success = response.status_code == 200 and "remaining_tasks" in response.json()
+        print_result("Project Deletion Progress", success, response.json())
         return success
     except Exception as e:
         print_result("Project Deletion", False, error=str(e))
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""Bytes on the wire and CPU cost of response compression.
+
+Seeds a generated workspace into the in-process app (MemoryStorage) and, for
+each hot payload, reports the identity size and, per available encoding, the
+compressed size, ratio and CPU milliseconds per compression, plus the
+latency of a response cache miss against a hit.
+
+    python benchmarks/compression_bytes.py --scale medium
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR))
+sys.path.insert(0, str(BENCH_DIR.parent / "backend"))
+
+from datagen import Scale, generate, seed  # noqa: E402
+
+PAYLOADS = {
+    "tasks": "/api/tasks",
+    "bootstrap": "/api/bootstrap",
+    "gtd_analysis": "/api/gtd/analysis",
+    "dashboard": "/api/stats/dashboard",
+    "export_ndjson": "/api/tasks/export",
+}
+
+
+def cpu_ms(function, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.process_time()
+        function()
+        samples.append(time.process_time() - started)
+    return round(statistics.median(samples) * 1000, 3)
+
+
+async def timed_get(client, url: str, encoding: str) -> float:
+    started = time.perf_counter()
+    response = await client.get(url, headers={"Accept-Encoding": encoding})
+    response.raise_for_status()
+    return time.perf_counter() - started
+
+
+async def measure(scale: Scale, repeat: int, seed_value: int) -> dict:
+    os.environ["STORAGE_BACKEND"] = "memory"
+    import compression
+    import server
+
+    await seed(server.db, generate(scale, seed=seed_value))
+    server.db.watch(server.response_cache.on_change)
+    transport = httpx.ASGITransport(app=server.app)
+    report = {"encodings": compression.ENCODINGS, "payloads": {}}
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=60) as client:
+        for name, url in PAYLOADS.items():
+            body = (await client.get(url, headers={"Accept-Encoding": "identity"})).content
+            result = {"identity_bytes": len(body)}
+            for encoding in compression.ENCODINGS:
+                compressed = compression.compress(body, encoding)
+                result[encoding] = {
+                    "bytes": len(compressed),
+                    "ratio": round(len(body) / len(compressed), 2) if compressed else 0.0,
+                    "cpu_ms": cpu_ms(lambda: compression.compress(body, encoding), repeat),
+                }
+            if server.response_cache.covers(url):
+                server.response_cache.clear()
+                encoding = compression.ENCODINGS[0]
+                miss = await timed_get(client, url, encoding)
+                hits = [await timed_get(client, url, encoding) for _ in range(repeat)]
+                result["cache_miss_ms"] = round(miss * 1000, 3)
+                result["cache_hit_ms"] = round(statistics.median(hits) * 1000, 3)
+            report["payloads"][name] = result
+    server.analysis_runner.shutdown()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", choices=["small", "medium", "large"], default="small")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("-o", "--output", help="write the JSON report here")
+    args = parser.parse_args()
+    report = asyncio.run(measure(Scale.named(args.scale), args.repeat, args.seed))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Deterministic synthetic workspaces for benchmarking the API."""
+import random
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+PRIORITIES = ["low", "medium", "high"]
+STATUSES = ["todo", "todo", "in_progress", "completed", "approved"]
+TASK_TYPES = ["general", "meeting", "review", "development", "admin"]
+TAGS = ["urgent", "client", "internal", "bug", "feature", "docs", "ops", "research", "design", "finance"]
+TITLE_WORDS = [
+    "contract", "nda", "agreement", "review", "presentation", "slides", "document", "prepare",
+    "meeting", "agenda", "invite", "launch", "test", "deploy", "draft", "approve", "budget", "report",
+]
+
+
+@dataclass
+class Scale:
+    projects: int = 20
+    tasks_per_project: int = 50
+    dependency_ratio: float = 0.2
+    time_entries_per_task: int = 3
+    comments_per_task: int = 2
+    templates: int = 10
+
+    @classmethod
+    def named(cls, name: str) -> "Scale":
+        return {
+            "small": cls(projects=5, tasks_per_project=20),
+            "medium": cls(),
+            "large": cls(projects=100, tasks_per_project=100),
+        }[name]
+
+
+def _uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def generate(scale: Scale, seed: int = 42, now: datetime = None) -> Dict[str, List[dict]]:
+    """Build documents for every collection, shaped like the API would store them."""
+    rng = random.Random(seed)
+    now = now or datetime.utcnow()
+    data: Dict[str, List[dict]] = {
+        "projects": [], "tasks": [], "time_entries": [], "comments": [], "task_templates": [],
+    }
+
+    for p in range(scale.projects):
+        project_id = _uuid(rng)
+        created = now - timedelta(days=rng.randint(30, 365))
+        project_tasks = []
+        for t in range(scale.tasks_per_project):
+            task_id = _uuid(rng)
+            status = rng.choice(STATUSES)
+            created_at = created + timedelta(hours=rng.randint(0, 24 * 30))
+            deadline = now + timedelta(days=rng.randint(-10, 30), hours=rng.randint(0, 23)) if rng.random() < 0.7 else None
+            dependencies = []
+            if project_tasks and rng.random() < scale.dependency_ratio:
+                dependencies = [d["id"] for d in rng.sample(project_tasks, k=min(len(project_tasks), rng.randint(1, 3)))]
+            task = {
+                "id": task_id,
+                "title": " ".join(rng.sample(TITLE_WORDS, k=3)) + f" #{p}-{t}",
+                "description": " ".join(rng.choices(TITLE_WORDS, k=12)),
+                "priority": rng.choice(PRIORITIES),
+                "status": status,
+                "deadline": deadline,
+                "project_id": project_id,
+                "task_type": rng.choice(TASK_TYPES),
+                "estimated_hours": float(rng.randint(1, 16)),
+                "actual_hours": 0.0,
+                "tags": rng.sample(TAGS, k=rng.randint(0, 3)),
+                "template_id": None,
+                "recurrence_type": "none",
+                "recurrence_interval": 1,
+                "next_due_date": None,
+                "dependencies": dependencies,
+                "is_template": False,
+                "created_at": created_at,
+                "updated_at": created_at,
+                "completed_at": created_at + timedelta(days=2) if status in ("completed", "approved") else None,
+                "started_at": created_at + timedelta(days=1) if status != "todo" else None,
+                "time_summary": {"entry_count": 0, "total_minutes": 0, "last_entry_at": None},
+            }
+            for _ in range(scale.time_entries_per_task):
+                start = created_at + timedelta(hours=rng.randint(1, 24 * 20))
+                minutes = rng.randint(5, 180)
+                data["time_entries"].append({
+                    "id": _uuid(rng),
+                    "task_id": task_id,
+                    "project_id": project_id,
+                    "start_time": start,
+                    "end_time": start + timedelta(minutes=minutes),
+                    "duration_minutes": minutes,
+                    "description": "",
+                })
+                task["actual_hours"] += minutes / 60
+                summary = task["time_summary"]
+                summary["entry_count"] += 1
+                summary["total_minutes"] += minutes
+                summary["last_entry_at"] = max(filter(None, [summary["last_entry_at"], start + timedelta(minutes=minutes)]))
+            for _ in range(scale.comments_per_task):
+                data["comments"].append({
+                    "id": _uuid(rng),
+                    "task_id": task_id,
+                    "author": "User",
+                    "content": " ".join(rng.choices(TITLE_WORDS, k=8)),
+                    "created_at": created_at + timedelta(hours=rng.randint(1, 24 * 20)),
+                })
+            project_tasks.append(task)
+        data["tasks"].extend(project_tasks)
+        data["projects"].append({
+            "id": project_id,
+            "title": f"Project {p}",
+            "description": "",
+            "status": rng.choice(["active", "active", "completed", "archived"]),
+            "deadline": now + timedelta(days=rng.randint(7, 90)),
+            "color": "#06B6D4",
+            "created_at": created,
+            "updated_at": created,
+            "task_count": len(project_tasks),
+        })
+
+    for n in range(scale.templates):
+        data["task_templates"].append({
+            "id": _uuid(rng),
+            "name": f"Template {n}",
+            "title_template": " ".join(rng.sample(TITLE_WORDS, k=3)),
+            "description_template": " ".join(rng.choices(TITLE_WORDS, k=10)),
+            "priority": rng.choice(PRIORITIES),
+            "estimated_hours": float(rng.randint(1, 8)),
+            "task_type": rng.choice(TASK_TYPES),
+            "tags": rng.sample(TAGS, k=2),
+            "created_at": now,
+        })
+    return data
+
+
+async def seed(storage, data: Dict[str, List[dict]], batch_size: int = 1000):
+    """Replace the contents of ``storage`` with ``data``."""
+    for name, documents in data.items():
+        collection = storage[name]
+        await collection.delete_many({})
+        for start in range(0, len(documents), batch_size):
+            await collection.insert_many([dict(doc) for doc in documents[start:start + batch_size]])
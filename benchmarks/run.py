@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""Concurrent load benchmark for the GTD Task Manager API.
+
+Seeds a synthetic workspace, drives a weighted mix of frontend-like
+scenarios from concurrent async clients and writes p50/p95/p99 latency and
+throughput per endpoint to a JSON report.
+
+    python benchmarks/run.py --backend memory --scale small --duration 10 -o bench.json
+    python benchmarks/run.py --backend mongo --compare bench.json
+
+``--backend memory`` runs the app in-process against MemoryStorage,
+``--backend mongo`` in-process against ``MONGO_URL`` (database
+``BENCH_DB_NAME``, default ``gtd_benchmark``), and ``--base-url`` targets
+an already running server after seeding its database.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR))
+sys.path.insert(0, str(BENCH_DIR.parent / "backend"))
+
+from datagen import Scale, generate, seed  # noqa: E402
+from scenarios import SCENARIOS, Recorder, Session  # noqa: E402
+
+# Per-request client logging would dominate the output and the timings
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank percentile
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarise(samples, errors: int, elapsed: float) -> dict:
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "errors": errors,
+        "rps": round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def make_client(args):
+    if args.base_url:
+        return httpx.AsyncClient(base_url=args.base_url, timeout=30)
+    os.environ["STORAGE_BACKEND"] = args.backend
+    if args.backend == "mongo":
+        os.environ["DB_NAME"] = os.environ.get("BENCH_DB_NAME", "gtd_benchmark")
+    import server
+
+    await server.db.create_indexes()
+    transport = httpx.ASGITransport(app=server.app)
+    return httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=30)
+
+
+async def prepare_workspace(args) -> dict:
+    data = generate(Scale.named(args.scale) if args.scale else Scale(
+        projects=args.projects, tasks_per_project=args.tasks_per_project
+    ), seed=args.seed)
+    if not args.no_seed:
+        if args.base_url:
+            from storage import create_storage
+
+            storage = create_storage("mongo")
+        else:
+            import server
+
+            storage = server.db
+        await seed(storage, data)
+    return {
+        "task_ids": [task["id"] for task in data["tasks"]],
+        "project_ids": [project["id"] for project in data["projects"]],
+        "counts": {name: len(documents) for name, documents in data.items()},
+    }
+
+
+async def run_load(client, workspace: dict, args) -> dict:
+    recorder = Recorder()
+    names = [name for name in SCENARIOS if not args.scenario or name in args.scenario]
+    weights = [SCENARIOS[name][1] for name in names]
+    deadline = time.perf_counter() + args.duration
+    iterations = {"n": 0}
+
+    async def worker(worker_id: int):
+        rng = random.Random(args.seed * 1000 + worker_id)
+        session = Session(client, recorder, workspace, rng)
+        while time.perf_counter() < deadline:
+            if args.iterations and iterations["n"] >= args.iterations:
+                return
+            iterations["n"] += 1
+            name = rng.choices(names, weights=weights)[0]
+            await SCENARIOS[name][0](session)
+
+    # Warm up code paths and caches before measuring
+    warmup = Session(client, Recorder(), workspace, random.Random(args.seed))
+    for name in names:
+        await SCENARIOS[name][0](warmup)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    endpoints = {
+        label: summarise(samples, recorder.errors.get(label, 0), elapsed)
+        for label, samples in sorted(recorder.samples.items())
+    }
+    all_samples = [value for samples in recorder.samples.values() for value in samples]
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "overall": summarise(all_samples, sum(recorder.errors.values()), elapsed),
+        "endpoints": endpoints,
+    }
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> list:
+    """Endpoints whose p95 regressed by more than ``threshold`` percent."""
+    regressions = []
+    print(f"\n{'endpoint':40} {'base p95':>10} {'new p95':>10} {'delta':>8}")
+    for label, stats in report["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(label)
+        if not before or not before["p95_ms"]:
+            continue
+        delta = (stats["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100
+        flag = " !" if delta > threshold else ""
+        print(f"{label:40} {before['p95_ms']:>10.2f} {stats['p95_ms']:>10.2f} {delta:>7.1f}%{flag}")
+        if delta > threshold:
+            regressions.append(label)
+    return regressions
+
+
+def print_report(report: dict):
+    print(f"\n{'endpoint':40} {'count':>7} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'err':>5}")
+    rows = list(report["results"]["endpoints"].items()) + [("overall", report["results"]["overall"])]
+    for label, stats in rows:
+        print(f"{label:40} {stats['count']:>7} {stats['rps']:>8.1f} {stats['p50_ms']:>8.2f} "
+              f"{stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f} {stats['errors']:>5}")
+
+
+async def main(args) -> int:
+    client = await make_client(args)
+    async with client:
+        workspace = await prepare_workspace(args)
+        results = await run_load(client, workspace, args)
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "python": platform.python_version(),
+        "target": args.base_url or f"in-process/{args.backend}",
+        "config": {
+            "scale": args.scale or {"projects": args.projects, "tasks_per_project": args.tasks_per_project},
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "iterations": args.iterations,
+            "seed": args.seed,
+            "scenarios": args.scenario or list(SCENARIOS),
+        },
+        "dataset": workspace["counts"],
+        "results": results,
+    }
+    print_report(report)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"\nReport written to {args.output}")
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        regressions = compare(results, baseline.get("results", baseline), args.threshold)
+        if regressions:
+            print(f"\np95 regressions above {args.threshold}%: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["memory", "mongo"], default="memory")
+    parser.add_argument("--base-url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--scale", choices=["small", "medium", "large"])
+    parser.add_argument("--projects", type=int, default=20)
+    parser.add_argument("--tasks-per-project", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of measured load")
+    parser.add_argument("--iterations", type=int, default=0, help="stop after this many scenarios (0 = duration only)")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="restrict the mix (repeatable)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-seed", action="store_true", help="reuse the existing dataset")
+    parser.add_argument("-o", "--output", help="write the JSON report here")
+    parser.add_argument("--compare", help="baseline JSON report to compare p95 latency against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed p95 regression in percent")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -0,0 +1,94 @@
+"""Load scenarios mirroring how the frontend talks to the API."""
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+
+class Recorder:
+    """Collects per-endpoint latency samples and error counts."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    def record(self, label: str, seconds: float, ok: bool):
+        self.samples[label].append(seconds)
+        if not ok:
+            self.errors[label] += 1
+
+
+class Session:
+    def __init__(self, client, recorder: Recorder, workspace: dict, rng: random.Random):
+        self.client = client
+        self.recorder = recorder
+        self.workspace = workspace
+        self.rng = rng
+
+    async def request(self, label: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            ok = response.status_code < 500
+        except Exception:
+            response, ok = None, False
+        self.recorder.record(label, time.perf_counter() - started, ok)
+        return response
+
+    def task_id(self) -> str:
+        return self.rng.choice(self.workspace["task_ids"])
+
+    def project_id(self) -> str:
+        return self.rng.choice(self.workspace["project_ids"])
+
+
+async def startup(session: Session):
+    """App.js and Dashboard.js loading the main views."""
+    await session.request("GET /api/tasks", "GET", "/api/tasks")
+    await session.request("GET /api/projects", "GET", "/api/projects")
+    await session.request("GET /api/stats/dashboard", "GET", "/api/stats/dashboard")
+    await session.request("GET /api/notifications", "GET", "/api/notifications")
+    await session.request("GET /api/templates", "GET", "/api/templates")
+    await session.request("GET /api/gtd/analysis", "GET", "/api/gtd/analysis")
+
+
+async def project_view(session: Session):
+    """ProjectManager.js listing each project's tasks."""
+    for _ in range(3):
+        await session.request("GET /api/tasks?project_id", "GET", "/api/tasks",
+                              params={"project_id": session.project_id()})
+
+
+async def triage(session: Session):
+    """Status changes and comments from the task manager."""
+    task_id = session.task_id()
+    await session.request("PUT /api/tasks/{id}", "PUT", f"/api/tasks/{task_id}",
+                          json={"status": session.rng.choice(["todo", "in_progress", "completed"])})
+    await session.request("GET /api/comments/{id}", "GET", f"/api/comments/{task_id}")
+    await session.request("POST /api/comments", "POST", "/api/comments",
+                          json={"task_id": task_id, "content": "benchmark comment"})
+
+
+async def time_tracking(session: Session):
+    task_id = session.task_id()
+    await session.request("POST /api/time-tracking/start", "POST", f"/api/time-tracking/start/{task_id}")
+    await session.request("POST /api/time-tracking/stop", "POST", f"/api/time-tracking/stop/{task_id}")
+
+
+async def create_task(session: Session):
+    await session.request("POST /api/tasks", "POST", "/api/tasks", json={
+        "title": f"Benchmark task {session.rng.randint(0, 10 ** 6)}",
+        "project_id": session.project_id(),
+        "priority": session.rng.choice(["low", "medium", "high"]),
+        "tags": ["benchmark"],
+    })
+
+
+# Relative frequency of each scenario in the default mix
+SCENARIOS = {
+    "startup": (startup, 2),
+    "project_view": (project_view, 3),
+    "triage": (triage, 3),
+    "time_tracking": (time_tracking, 2),
+    "create_task": (create_task, 1),
+}
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""Memory footprint of the analytics task snapshot.
+
+Loads generated tasks into MemoryStorage, builds a ``TaskSnapshot`` and
+prints its size next to the size of the same tasks as plain dicts, both
+scaled to 100k tasks.
+
+    python benchmarks/snapshot_memory.py --tasks 100000
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR))
+sys.path.insert(0, str(BENCH_DIR.parent / "backend"))
+
+from datagen import Scale, generate  # noqa: E402
+from snapshot import ACTIVE_STATUSES, TaskSnapshot  # noqa: E402
+from storage import MemoryStorage  # noqa: E402
+
+
+def dict_bytes(value) -> int:
+    """Deep size of plain JSON-like values."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(dict_bytes(key) + dict_bytes(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(dict_bytes(item) for item in value)
+    return size
+
+
+async def measure(tasks: int, seed: int) -> dict:
+    projects = max(1, tasks // 100)
+    data = generate(Scale(projects=projects, tasks_per_project=-(-tasks // projects),
+                          time_entries_per_task=0, comments_per_task=0, templates=0), seed=seed)
+    storage = MemoryStorage()
+    await storage.tasks.insert_many(data["tasks"])
+
+    snapshot = TaskSnapshot(lambda: storage)
+    started = time.perf_counter()
+    await snapshot.refresh()
+    load_seconds = time.perf_counter() - started
+
+    active = [task for task in data["tasks"] if task["status"] in ACTIVE_STATUSES and not task.get("is_template")]
+    stats = snapshot.stats()
+    full_bytes = sum(dict_bytes(task) for task in active)
+    return {
+        "generated_tasks": len(data["tasks"]),
+        "snapshot_rows": stats["rows"],
+        "load_seconds": round(load_seconds, 3),
+        "snapshot_bytes_per_100k_tasks": stats["bytes_per_100k_tasks"],
+        "documents_bytes_per_100k_tasks": round(full_bytes / len(active) * 100_000) if active else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(measure(args.tasks, args.seed)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
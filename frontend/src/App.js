@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef } from "react";
 import "./App.css";
 import { BrowserRouter, Routes, Route } from "react-router-dom";
 import axios from "axios";
@@ -9,42 +9,90 @@ import ProjectManager from "./components/ProjectManager";
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+// Apply one /sync page to a replica keyed by id
+const applySync = (replica, changed, deleted) => {
+  changed.forEach((doc) => replica.set(doc.id, doc));
+  deleted.forEach((id) => replica.delete(id));
+};
+
+const emptyReplica = () => ({ token: null, tasks: new Map(), projects: new Map(), templates: new Map() });
+
 function App() {
   const [tasks, setTasks] = useState([]);
   const [projects, setProjects] = useState([]);
+  const [templates, setTemplates] = useState([]);
+  const [bootstrap, setBootstrap] = useState(null);
   const [loading, setLoading] = useState(true);
+  // Local replica kept current by delta sync; the token marks how far it is up to date
+  const replica = useRef(emptyReplica());
 
-  // Fetch tasks and projects on app load
+  // One bootstrap request on app load, then delta syncs
   useEffect(() => {
-    fetchTasks();
-    fetchProjects();
+    loadBootstrap();
   }, []);
 
-  const fetchTasks = async () => {
+  const applyPage = (page) => {
+    const state = replica.current;
+    applySync(state.tasks, page.changes.tasks, page.deleted.tasks);
+    applySync(state.projects, page.changes.projects, page.deleted.projects);
+    applySync(state.templates, page.changes.templates, page.deleted.templates);
+    state.token = page.token;
+  };
+
+  const publish = () => {
+    const state = replica.current;
+    setTasks([...state.tasks.values()].filter((task) => !task.is_template));
+    setProjects([...state.projects.values()]);
+    setTemplates([...state.templates.values()]);
+  };
+
+  const syncData = async () => {
+    let hasMore = true;
+    while (hasMore) {
+      const state = replica.current;
+      const response = await axios.get(`${API}/sync`, {
+        params: state.token ? { since: state.token } : {},
+        validateStatus: (status) => status < 400 || status === 410,
+      });
+      if (response.status === 410) {
+        // Token too old for the server's tombstones; start over from a full sync
+        replica.current = emptyReplica();
+        continue;
+      }
+      applyPage(response.data);
+      hasMore = response.data.has_more;
+    }
+    publish();
+  };
+
+  const loadBootstrap = async () => {
     try {
-      const response = await axios.get(`${API}/tasks`);
-      setTasks(response.data);
+      const response = await axios.get(`${API}/bootstrap`);
+      const { sync, stats, notifications, projects_summary: projectsSummary, analysis } = response.data;
+      applyPage(sync);
+      if (sync.has_more) {
+        await syncData();
+      } else {
+        publish();
+      }
+      setBootstrap({ stats, notifications, projectsSummary, analysis });
     } catch (error) {
-      console.error('Error fetching tasks:', error);
+      console.error('Error loading app data:', error);
     } finally {
       setLoading(false);
     }
   };
 
-  const fetchProjects = async () => {
+  const refreshData = async () => {
+    // After a mutation the bootstrap stats are out of date; components fetch fresh ones
+    setBootstrap((current) => current && { ...current, stats: null, notifications: null, projectsSummary: null });
     try {
-      const response = await axios.get(`${API}/projects`);
-      setProjects(response.data);
+      await syncData();
     } catch (error) {
-      console.error('Error fetching projects:', error);
+      console.error('Error syncing tasks and projects:', error);
     }
   };
 
-  const refreshData = () => {
-    fetchTasks();
-    fetchProjects();
-  };
-
   if (loading) {
     return (
       <div className="min-h-screen bg-gray-900 flex items-center justify-center">
@@ -63,6 +111,9 @@ function App() {
               <Dashboard 
                 tasks={tasks} 
                 projects={projects} 
+                templates={templates}
+                initialStats={bootstrap?.stats}
+                initialNotifications={bootstrap?.notifications}
                 refreshData={refreshData}
               />
             } 
@@ -72,6 +123,7 @@ function App() {
             element={
               <EnhancedTaskManager 
                 tasks={tasks} 
+                templates={templates}
                 refreshData={refreshData}
               />
             } 
@@ -81,6 +133,8 @@ function App() {
             element={
               <ProjectManager 
                 projects={projects} 
+                tasks={tasks}
+                projectsSummary={bootstrap?.projectsSummary}
                 refreshData={refreshData}
               />
             } 
@@ -90,6 +144,8 @@ function App() {
             element={
               <ProjectManager 
                 projects={projects} 
+                tasks={tasks}
+                projectsSummary={bootstrap?.projectsSummary}
                 refreshData={refreshData}
               />
             } 
@@ -5,17 +5,20 @@ import axios from 'axios';
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
-const Dashboard = ({ tasks, projects, refreshData }) => {
+const Dashboard = ({ tasks, projects, templates, initialStats, initialNotifications, refreshData }) => {
   const navigate = useNavigate();
-  const [dashboardStats, setDashboardStats] = useState(null);
-  const [notifications, setNotifications] = useState([]);
-  const [templates, setTemplates] = useState([]);
+  const [dashboardStats, setDashboardStats] = useState(initialStats || null);
+  const [notifications, setNotifications] = useState(initialNotifications || []);
   const [showNotifications, setShowNotifications] = useState(false);
 
   useEffect(() => {
-    fetchDashboardStats();
-    fetchNotifications();
-    fetchTemplates();
+    // The app bootstrap already carries stats and notifications for the first render
+    if (!initialStats) {
+      fetchDashboardStats();
+    }
+    if (!initialNotifications) {
+      fetchNotifications();
+    }
     
     // Auto-refresh notifications every 5 minutes
     const interval = setInterval(fetchNotifications, 300000);
@@ -40,15 +43,6 @@ const Dashboard = ({ tasks, projects, refreshData }) => {
     }
   };
 
-  const fetchTemplates = async () => {
-    try {
-      const response = await axios.get(`${API}/templates`);
-      setTemplates(response.data);
-    } catch (error) {
-      console.error('Error fetching templates:', error);
-    }
-  };
-
   const processRecurringTasks = async () => {
     try {
       const response = await axios.post(`${API}/recurring-tasks/process`);
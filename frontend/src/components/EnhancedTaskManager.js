@@ -5,7 +5,7 @@ import axios from 'axios';
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
-const EnhancedTaskManager = ({ tasks, refreshData }) => {
+const EnhancedTaskManager = ({ tasks, templates, refreshData }) => {
   const navigate = useNavigate();
   const [showCreateModal, setShowCreateModal] = useState(false);
   const [showTemplateModal, setShowTemplateModal] = useState(false);
@@ -14,10 +14,10 @@ const EnhancedTaskManager = ({ tasks, refreshData }) => {
   const [gtdData, setGTDData] = useState(null);
   const [editingTask, setEditingTask] = useState(null);
   const [selectedTask, setSelectedTask] = useState(null);
+  const [externalTasks, setExternalTasks] = useState({});
   const [filter, setFilter] = useState('all');
   const [sortBy, setSortBy] = useState('created_at');
   const [searchTerm, setSearchTerm] = useState('');
-  const [templates, setTemplates] = useState([]);
   const [comments, setComments] = useState([]);
   const [activeTimers, setActiveTimers] = useState({});
   const [newComment, setNewComment] = useState('');
@@ -45,22 +45,30 @@ const EnhancedTaskManager = ({ tasks, refreshData }) => {
     tags: []
   });
 
-  useEffect(() => {
-    fetchTemplates();
-  }, []);
-
   useEffect(() => {
     if (selectedTask) {
       fetchComments(selectedTask.id);
     }
   }, [selectedTask]);
 
-  const fetchTemplates = async () => {
+  // Dependencies outside the synced list (archived tasks) are resolved in one batch request
+  useEffect(() => {
+    const known = new Set(tasks.map(task => task.id));
+    const unresolved = [...new Set(tasks.flatMap(task => task.dependencies || []))]
+      .filter(id => !known.has(id) && !(id in externalTasks));
+    if (unresolved.length > 0) {
+      fetchExternalTasks(unresolved.slice(0, 500));
+    }
+  }, [tasks]);
+
+  const fetchExternalTasks = async (ids) => {
     try {
-      const response = await axios.get(`${API}/templates`);
-      setTemplates(response.data);
+      const response = await axios.post(`${API}/tasks/batch-get`, { ids, fields: ['title', 'status'] });
+      const resolved = Object.fromEntries(response.data.missing.map(id => [id, null]));
+      response.data.tasks.forEach(task => { resolved[task.id] = task; });
+      setExternalTasks(current => ({ ...current, ...resolved }));
     } catch (error) {
-      console.error('Error fetching templates:', error);
+      console.error('Error fetching dependency tasks:', error);
     }
   };
 
@@ -132,7 +140,7 @@ const EnhancedTaskManager = ({ tasks, refreshData }) => {
         tags: []
       });
       setShowTemplateModal(false);
-      fetchTemplates();
+      refreshData();
     } catch (error) {
       console.error('Error creating template:', error);
     }
@@ -385,7 +393,7 @@ const EnhancedTaskManager = ({ tasks, refreshData }) => {
             <p className="text-xs text-slate-400 mb-1">Dependencies:</p>
             <div className="dependency-line">
               {task.dependencies.map(depId => {
-                const depTask = tasks.find(t => t.id === depId);
+                const depTask = tasks.find(t => t.id === depId) || externalTasks[depId];
                 return depTask ? (
                   <div key={depId} className="dependency-item mb-1">
                     {depTask.title}
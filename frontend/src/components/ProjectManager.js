@@ -5,13 +5,13 @@ import axios from 'axios';
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
-const ProjectManager = ({ projects, refreshData }) => {
+const ProjectManager = ({ projects, tasks, projectsSummary, refreshData }) => {
   const navigate = useNavigate();
   const { projectId } = useParams();
   const [showCreateModal, setShowCreateModal] = useState(false);
   const [showTaskModal, setShowTaskModal] = useState(false);
   const [selectedProject, setSelectedProject] = useState(null);
-  const [projectTasks, setProjectTasks] = useState([]);
+  const [summaries, setSummaries] = useState(projectsSummary || []);
   const [draggingTask, setDraggingTask] = useState(null);
 
   const [newProject, setNewProject] = useState({
@@ -29,24 +29,34 @@ const ProjectManager = ({ projects, refreshData }) => {
     project_id: projectId || ''
   });
 
-  // Fetch project tasks when project is selected
+  // The selected project's tasks come from the synced task list; no per-project requests
+  const projectTasks = projectId ? tasks.filter(task => task.project_id === projectId) : [];
+
   useEffect(() => {
     if (projectId) {
       const project = projects.find(p => p.id === projectId);
       setSelectedProject(project);
-      fetchProjectTasks(projectId);
     }
   }, [projectId, projects]);
 
-  const fetchProjectTasks = async (id) => {
+  // Per-project status counts for every card in one request
+  useEffect(() => {
+    if (!projectId) {
+      fetchSummaries();
+    }
+  }, [projectId, projects]);
+
+  const fetchSummaries = async () => {
     try {
-      const response = await axios.get(`${API}/tasks?project_id=${id}`);
-      setProjectTasks(response.data);
+      const response = await axios.get(`${API}/projects/summary`);
+      setSummaries(response.data);
     } catch (error) {
-      console.error('Error fetching project tasks:', error);
+      console.error('Error fetching project summaries:', error);
     }
   };
 
+  const summaryById = Object.fromEntries(summaries.map(summary => [summary.id, summary]));
+
   // Create project
   const handleCreateProject = async (e) => {
     e.preventDefault();
@@ -87,7 +97,7 @@ const ProjectManager = ({ projects, refreshData }) => {
         project_id: selectedProject.id
       });
       setShowTaskModal(false);
-      fetchProjectTasks(selectedProject.id);
+      refreshData();
     } catch (error) {
       console.error('Error creating task:', error);
     }
@@ -97,7 +107,7 @@ const ProjectManager = ({ projects, refreshData }) => {
   const handleUpdateTaskStatus = async (taskId, newStatus) => {
     try {
       await axios.put(`${API}/tasks/${taskId}`, { status: newStatus });
-      fetchProjectTasks(selectedProject.id);
+      refreshData();
     } catch (error) {
       console.error('Error updating task:', error);
     }
@@ -437,8 +447,13 @@ const ProjectManager = ({ projects, refreshData }) => {
                     {project.status.toUpperCase()}
                   </span>
                   <span className="bg-gray-700 text-gray-300 px-2 py-1 rounded-full text-xs">
-                    {project.task_count || 0} tasks
+                    {summaryById[project.id]?.total ?? project.task_count ?? 0} tasks
                   </span>
+                  {summaryById[project.id] && (
+                    <span className="text-xs text-gray-400">
+                      {summaryById[project.id].by_status.completed + summaryById[project.id].by_status.approved} done
+                    </span>
+                  )}
                 </div>
                 {project.deadline && (
                   <span className="text-xs text-gray-400">
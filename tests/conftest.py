@@ -0,0 +1,27 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ["STORAGE_BACKEND"] = "memory"
+
+import server  # noqa: E402
+from storage import MemoryStorage  # noqa: E402
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    memory = MemoryStorage()
+    monkeypatch.setattr(server, "db", memory)
+    return memory
+
+
+@pytest.fixture
+def client(storage):
+    from fastapi.testclient import TestClient
+
+    with TestClient(server.app) as test_client:
+        yield test_client
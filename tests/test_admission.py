@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+import admission
+import server
+
+
+def test_limiter_queues_in_order_and_rejects_when_full():
+    limiter = admission.Limiter("test", concurrency=1, queue=2, timeout=1)
+    order = []
+
+    async def hold(name, seconds):
+        await limiter.acquire()
+        order.append(name)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            limiter.release()
+
+    async def scenario():
+        first = asyncio.ensure_future(hold("first", 0.02))
+        await asyncio.sleep(0)
+        queued = [asyncio.ensure_future(hold(name, 0)) for name in ("second", "third")]
+        await asyncio.sleep(0)
+        assert (limiter.active, limiter.waiting) == (1, 2)
+        with pytest.raises(admission.Overloaded) as rejected:
+            await limiter.acquire()
+        await asyncio.gather(first, *queued)
+        return rejected.value.reason
+
+    assert asyncio.run(scenario()) == "queue_full"
+    assert order == ["first", "second", "third"]
+    assert (limiter.active, limiter.waiting) == (0, 0)
+
+
+def test_limiter_times_out_waiters_without_leaking_slots():
+    limiter = admission.Limiter("test", concurrency=1, queue=1, timeout=0.01)
+
+    async def scenario():
+        await limiter.acquire()
+        with pytest.raises(admission.Overloaded) as timed_out:
+            await limiter.acquire()
+        limiter.release()
+        await limiter.acquire()
+        limiter.release()
+        return timed_out.value.reason
+
+    assert asyncio.run(scenario()) == "timeout"
+    assert (limiter.active, limiter.waiting) == (0, 0)
+
+
+def test_parse_limits():
+    assert admission.parse_limits("gtd_analysis=2:16, search=8") == {"gtd_analysis": (2, 16), "search": (8, 0)}
+
+
+def test_saturated_routes_answer_503_and_writes_keep_priority(client, monkeypatch):
+    limiter = admission.limiters["recurring_tasks"]
+    monkeypatch.setattr(limiter, "active", limiter.concurrency)
+    response = client.post("/api/recurring-tasks/process")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(admission.ADMISSION_RETRY_AFTER_SECONDS)
+    monkeypatch.setattr(limiter, "active", 0)
+    assert client.post("/api/recurring-tasks/process").status_code == 200
+
+    # Past the in-flight bound reads are shed while interactive writes use the reserve
+    monkeypatch.setattr(admission, "_in_flight", admission.ADMISSION_MAX_IN_FLIGHT)
+    assert client.get("/api/tasks").status_code == 503
+    assert client.post("/api/recurring-tasks/process").status_code == 503
+    assert client.post("/api/tasks", json={"title": "Still writable"}).status_code == 200
+
+
+def test_export_holds_its_slot_until_the_stream_ends(client, monkeypatch):
+    limiter = admission.limiters["export"]
+    client.post("/api/tasks", json={"title": "Exported"})
+
+    scope = {"type": "http", "method": "GET", "path": "/api/tasks/export", "headers": []}
+
+    async def export(disconnect: bool):
+        response = await server.export_tasks()
+        held, sent = limiter.active, []
+
+        async def receive():
+            if not disconnect:
+                await asyncio.Event().wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if disconnect:
+                await asyncio.Event().wait()  # The client is gone before the body is read
+            sent.append(message)
+
+        await response(scope, receive, send)
+        return held, b"".join(message.get("body", b"") for message in sent)
+
+    held, body = asyncio.run(export(disconnect=False))
+    assert (held, limiter.active) == (1, 0) and body.count(b"\n") == 1
+    held, body = asyncio.run(export(disconnect=True))
+    assert (held, limiter.active, body) == (1, 0, b"")
+
+    # A response dropped without ever being sent gives its slot back too
+    asyncio.run(server.export_tasks())
+    assert limiter.active == 0
+
+    monkeypatch.setattr(limiter, "active", limiter.concurrency)
+    monkeypatch.setattr(limiter, "queue", 0)
+    assert client.get("/api/tasks/export").status_code == 503
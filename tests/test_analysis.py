@@ -0,0 +1,53 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import analysis
+
+
+def slow_sum(items, delay):
+    time.sleep(delay)
+    return sum(items)
+
+
+def task(id, title, priority="medium", deadline=None, hours=None, deps=(), task_type="general"):
+    return analysis.compact_task({"id": id, "title": title, "priority": priority, "deadline": deadline,
+                                  "estimated_hours": hours, "dependencies": list(deps), "task_type": task_type})
+
+
+def test_analyse_scores_groups_suggests_and_finds_critical_path():
+    now = datetime(2024, 5, 1, 12)
+    tasks = [
+        task("a", "Launch website", "high", deadline=now + timedelta(hours=20), hours=2, deps=["b"]),
+        task("b", "Test checkout", "low", hours=5, deps=["c"]),
+        task("c", "Review copy", "low", deadline=now - timedelta(days=1), deps=["a"]),  # cycle back to a
+        task("d", "Deploy launch notes", "high", task_type="ops"),
+    ]
+    result = analysis.analyse(tasks, analysis.epoch_seconds(now))
+
+    assert result["high_impact"] == ["a", "c"]
+    assert result["batches"] == [["b", "c"]]
+    assert [(s["main_task_id"], s["suggested_dependency_id"]) for s in result["suggestions"]] == [
+        ("a", "b"), ("a", "c"), ("a", "d"), ("d", "b"), ("d", "c"),
+    ]
+    assert result["critical_path"] == ["c", "b", "a"] and result["critical_path_hours"] == 8
+    assert (result["pending_count"], result["high_priority_count"], result["overdue_count"]) == (4, 2, 1)
+
+
+def test_runner_uses_process_pool_and_falls_back_to_last_result():
+    runner = analysis.AnalysisRunner(workers=1, timeout=0.5, inline_below=2)
+
+    async def scenario():
+        inline = await runner.run("inline", slow_sum, [5], 0)
+        pooled = await runner.run("sum", slow_sum, [1, 2, 3], 0)
+        stale = await runner.run("sum", slow_sum, [4, 5, 6], 2)
+        with pytest.raises(analysis.AnalysisUnavailable):
+            await runner.run("other", slow_sum, [1, 1], 2)
+        return inline, pooled, stale
+
+    try:
+        assert asyncio.run(scenario()) == ((5, False), (6, False), (6, True))
+    finally:
+        runner.shutdown()
@@ -0,0 +1,399 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.01)
+
+
+def test_project_and_task_lifecycle(client):
+    project = client.post("/api/projects", json={"title": "Launch"}).json()
+    task = client.post("/api/tasks", json={
+        "title": "Prepare launch",
+        "project_id": project["id"],
+        "priority": "high",
+        "deadline": (datetime.utcnow() + timedelta(hours=12)).isoformat() + "Z",
+    }).json()
+
+    assert client.get(f"/api/projects/{project['id']}").json()["task_count"] == 1
+    assert [t["id"] for t in client.get(f"/api/tasks?project_id={project['id']}").json()] == [task["id"]]
+
+    updated = client.put(f"/api/tasks/{task['id']}", json={"status": "in_progress"}).json()
+    assert updated["status"] == "in_progress" and updated["started_at"]
+
+    analysis = client.get("/api/gtd/analysis").json()
+    assert [t["id"] for t in analysis["high_impact_tasks"]] == [task["id"]]
+
+    deleted = client.delete(f"/api/projects/{project['id']}")
+    assert deleted.status_code == 202
+    assert client.get(f"/api/projects/{project['id']}").status_code == 404
+    wait_for(lambda: client.get(f"/api/jobs/{deleted.json()['job_id']}").json()["status"] == "succeeded")
+    assert client.get(f"/api/projects/{project['id']}/deletion").json()["state"] == "completed"
+    assert client.get(f"/api/tasks/{task['id']}").status_code == 404
+
+
+def test_time_tracking_updates_stats(client):
+    task = client.post("/api/tasks", json={"title": "Write report"}).json()
+
+    assert client.post(f"/api/time-tracking/start/{task['id']}").status_code == 200
+    assert client.post(f"/api/time-tracking/start/{task['id']}").status_code == 400
+    assert client.post(f"/api/time-tracking/stop/{task['id']}").json()["duration_minutes"] == 0
+
+    entries = client.get(f"/api/time-tracking/{task['id']}").json()
+    assert len(entries) == 1 and entries[0]["end_time"]
+    stats = client.get("/api/stats/dashboard").json()
+    assert stats["tasks"]["total"] == 1 and stats["time_tracking"]["total_entries"] == 1
+
+    day = entries[0]["start_time"][:10]
+    report = client.get("/api/reports/time", params={
+        "start": f"{day}T00:00:00", "end": "2100-01-01T00:00:00", "group_by": "task",
+    }).json()
+    assert report == [{"task": task["id"], "entries": 1, "minutes": 0}]
+
+    detail = client.get(f"/api/tasks/{task['id']}", params={"include": "time_entries"}).json()
+    assert detail["time_summary"]["entry_count"] == 1 and detail["time_summary"]["last_entry_at"]
+    assert [entry["id"] for entry in detail["time_entries"]] == [entries[0]["id"]]
+    listed = client.get("/api/tasks").json()
+    assert listed[0]["time_entries"] is None and listed[0]["time_summary"]["entry_count"] == 1
+
+
+def test_recurring_tasks_spawn_one_off_instances(client):
+    # Creating the task schedules the next instance one interval after its deadline
+    deadline = datetime.utcnow() - timedelta(days=8)
+    task = client.post("/api/tasks", json={
+        "title": "Weekly review", "recurrence_type": "weekly", "deadline": deadline.isoformat() + "Z",
+    }).json()
+    due = deadline + timedelta(weeks=1)
+
+    assert client.post("/api/recurring-tasks/process").json()["message"] == "Created 1 recurring task instances"
+    assert client.post("/api/recurring-tasks/process").json()["message"] == "Created 0 recurring task instances"
+
+    tasks = {t["id"]: t for t in client.get("/api/tasks").json()}
+    instance = next(t for task_id, t in tasks.items() if task_id != task["id"])
+    assert instance["recurrence_type"] == "none" and instance["next_due_date"] is None
+    assert instance["deadline"].startswith(due.isoformat()[:16])
+    assert tasks[task["id"]]["next_due_date"].startswith((due + timedelta(weeks=1)).isoformat()[:16])
+
+
+def test_search_ranks_and_highlights_across_collections(client):
+    project = client.post("/api/projects", json={"title": "Legal"}).json()
+    contract = client.post("/api/tasks", json={
+        "title": "Review contract", "description": "Check the NDA terms", "project_id": project["id"],
+    }).json()
+    other = client.post("/api/tasks", json={"title": "Book travel", "description": "contract hotel rates"}).json()
+    client.post("/api/comments", json={"task_id": other["id"], "content": "Contracts signed <b>today</b>"})
+    client.post("/api/templates", json={
+        "name": "Contract review", "title_template": "Review", "description_template": "",
+    })
+
+    body = client.get("/api/search", params={"q": "contract"}).json()
+    assert body["counts"] == {"task": 2, "comment": 1, "template": 1}
+    assert body["results"][0]["id"] == contract["id"]
+    assert body["results"][0]["highlights"]["title"] == "Review <mark>contract</mark>"
+    comment = next(r for r in body["results"] if r["type"] == "comment")
+    assert comment["highlights"]["content"] == "<mark>Contracts</mark> signed &lt;b&gt;today&lt;/b&gt;"
+
+    filtered = client.get("/api/search", params={"q": "contract", "project_id": project["id"]}).json()
+    assert [r["id"] for r in filtered["results"]] == [contract["id"]]
+    paged = client.get("/api/search", params={"q": "contract", "page": 2, "page_size": 3}).json()
+    assert len(paged["results"]) == 1 and paged["total"] == 4
+    assert client.get("/api/search", params={"q": "contract", "page": 51}).status_code == 422
+
+
+def test_filtered_comment_search_is_capped_to_recent_tasks(client, storage, monkeypatch):
+    import search
+
+    monkeypatch.setattr(search, "SEARCH_MAX_FILTER_TASKS", 1)
+    project = client.post("/api/projects", json={"title": "Capped"}).json()
+    for title in ("Older", "Newer"):
+        task = client.post("/api/tasks", json={"title": title, "project_id": project["id"]}).json()
+        client.post("/api/comments", json={"task_id": task["id"], "content": f"Invoice for {title}"})
+    asyncio.run(storage.tasks.update_one({"title": "Older"}, {"$set": {"updated_at": datetime(2020, 1, 1)}}))
+    body = client.get("/api/search", params={"q": "invoice", "project_id": project["id"]}).json()
+    assert [r["task_id"] for r in body["results"]] == [task["id"]]
+
+
+def test_task_listing_filters_sorts_and_paginates(client):
+    now = datetime.utcnow()
+    for n, (status, priority, tags) in enumerate([
+        ("todo", "high", ["client", "urgent"]),
+        ("todo", "low", ["client"]),
+        ("in_progress", "high", ["internal"]),
+        ("completed", "medium", ["client", "urgent"]),
+    ]):
+        client.post("/api/tasks", json={
+            "title": f"Task {n}", "status": status, "priority": priority, "tags": tags,
+            "deadline": (now + timedelta(days=n)).isoformat(),
+        })
+
+    def titles(**params):
+        response = client.get("/api/tasks", params=params)
+        assert response.status_code == 200, response.text
+        return [t["title"] for t in response.json()], int(response.headers["X-Total-Count"])
+
+    assert titles(status=["todo", "in_progress"], sort="-deadline") == (["Task 2", "Task 1", "Task 0"], 3)
+    assert titles(tag=["client", "urgent"], tag_mode="all", sort="deadline") == (["Task 0", "Task 3"], 2)
+    assert titles(priority="high", deadline_to=(now + timedelta(days=1)).isoformat()) == (["Task 0"], 1)
+    assert titles(sort="deadline", offset=1, limit=2) == (["Task 1", "Task 2"], 4)
+
+    response = client.get("/api/tasks", params={"status": "todo", "sort": "created_at"})
+    assert response.status_code == 400 and "Supported" in response.json()["detail"]
+
+
+def test_tag_counts_follow_task_writes(client):
+    project = client.post("/api/projects", json={"title": "Web"}).json()
+    first = client.post("/api/tasks", json={"title": "A", "tags": ["ui", "bug"], "project_id": project["id"]}).json()
+    client.post("/api/tasks/batch-create", json=[
+        {"title": "B", "tags": ["ui"], "project_id": project["id"]},
+        {"title": "C", "tags": ["ui", "docs"]},
+    ])
+    client.put(f"/api/tasks/{first['id']}", json={"tags": ["ui", "perf"]})
+
+    assert client.get("/api/tags", params={"project_id": project["id"]}).json() == [
+        {"tag": "ui", "count": 2}, {"tag": "perf", "count": 1},
+    ]
+    overall = client.get("/api/tags").json()
+    assert overall[0] == {"tag": "ui", "count": 3, "projects": {project["id"]: 2, "none": 1}}
+
+    expected = client.get("/api/tags").json()
+    client.post("/api/tags/rebuild")
+    assert client.get("/api/tags").json() == expected
+
+    client.delete(f"/api/tasks/{first['id']}")
+    assert {t["tag"] for t in client.get("/api/tags").json()} == {"ui", "docs"}
+
+
+def test_project_deletion_cascade_cleans_up_and_resumes(client, storage):
+    import cascade
+
+    project = client.post("/api/projects", json={"title": "Old"}).json()
+    doomed = [client.post("/api/tasks", json={"title": f"T{n}", "project_id": project["id"], "tags": ["x"]}).json()
+              for n in range(5)]
+    survivor = client.post("/api/tasks", json={"title": "Keep", "dependencies": [doomed[0]["id"]]}).json()
+    client.post("/api/comments", json={"task_id": doomed[1]["id"], "content": "bye"})
+    client.post(f"/api/time-tracking/start/{doomed[2]['id']}")
+
+    # Simulate a crash after the project was marked deleted but before the cascade ran
+    client.portal.call(cascade.mark_project_deleted, storage, project["id"])
+    assert [p["id"] for p in client.get("/api/projects").json()] == []
+    import server
+    client.portal.call(cascade.resume_project_cascades, storage, server.job_queue)
+
+    wait_for(lambda: client.get(f"/api/projects/{project['id']}/deletion").json()["state"] == "completed")
+    progress = client.get(f"/api/projects/{project['id']}/deletion").json()
+    assert progress["processed_tasks"] == 5 and progress["remaining_tasks"] == 0
+    assert client.get(f"/api/tasks/{survivor['id']}").json()["dependencies"] == []
+    assert client.get(f"/api/comments/{doomed[1]['id']}").json() == []
+    assert client.get(f"/api/time-tracking/{doomed[2]['id']}").json() == []
+    assert client.get("/api/tags").json() == []
+
+
+def test_bulk_update_by_ids_and_filter(client):
+    project = client.post("/api/projects", json={"title": "Sprint"}).json()
+    tasks = [client.post("/api/tasks", json={"title": f"T{n}", "project_id": project["id"], "tags": ["sprint"]}).json()
+             for n in range(3)]
+    client.put(f"/api/tasks/{tasks[0]['id']}", json={"status": "in_progress"})
+    started_at = client.get(f"/api/tasks/{tasks[0]['id']}").json()["started_at"]
+
+    moved = client.post("/api/tasks/bulk-update", json={
+        "ids": [t["id"] for t in tasks] + ["missing"], "patch": {"status": "in_progress", "tags": ["next"]},
+    }).json()
+    assert moved == {"matched": 3, "modified": 3, "missing": ["missing"]}
+    reloaded = [client.get(f"/api/tasks/{t['id']}").json() for t in tasks]
+    assert reloaded[0]["started_at"] == started_at and all(t["started_at"] for t in reloaded)
+    assert [(t["tag"], t["count"]) for t in client.get("/api/tags").json()] == [("next", 3)]
+
+    done = client.post("/api/tasks/bulk-update", json={
+        "filter": {"project_id": project["id"], "status": ["in_progress"]}, "patch": {"status": "completed"},
+    }).json()
+    assert done["matched"] == 3
+    assert all(client.get(f"/api/tasks/{t['id']}").json()["completed_at"] for t in tasks)
+    assert client.get("/api/stats/dashboard").json()["tasks"]["pending"] == 0
+
+    assert client.post("/api/tasks/bulk-update", json={"patch": {"status": "todo"}}).status_code == 400
+    assert client.post("/api/tasks/bulk-update", json={
+        "filter": {"deadline_from": "2024-01-01T00:00:00"}, "patch": {"priority": "low"}, "ids": []
+    }).status_code == 400
+    # A filter with only tag_mode (or empty values) selects nothing and must not update every task
+    for empty in ({"tag_mode": "all"}, {"tag": [], "status": None}):
+        assert client.post("/api/tasks/bulk-update", json={
+            "filter": empty, "patch": {"priority": "low"}
+        }).status_code == 400
+    assert client.get("/api/tasks", params={"priority": "low"}).json() == []
+
+
+def test_template_instantiation_renders_placeholders(client, storage):
+    import templating
+
+    project = client.post("/api/projects", json={"title": "Ops"}).json()
+    template = client.post("/api/templates", json={
+        "name": "Standup", "title_template": "Standup #{n:02d} {date:%d %b} ({team})",
+        "description_template": "Notes for {team}, {n} of {count}; keep {braces}", "tags": ["daily"],
+    }).json()
+
+    created = client.post(f"/api/templates/{template['id']}/instantiate", json={
+        "count": 3, "project_id": project["id"], "start": 9, "date": "2024-03-05T00:00:00",
+        "variables": {"team": "Core"},
+    }).json()["created_tasks"]
+    assert [t["title"] for t in created] == [
+        "Standup #09 05 Mar (Core)", "Standup #10 05 Mar (Core)", "Standup #11 05 Mar (Core)"
+    ]
+    assert created[2]["description"] == "Notes for Core, 11 of 3; keep {braces}"
+    assert client.get(f"/api/projects/{project['id']}").json()["task_count"] == 3
+    assert client.get("/api/tags").json()[0]["count"] == 3
+
+    single = client.post(f"/api/templates/{template['id']}/create-task").json()
+    assert single["title"].startswith("Standup #01 ") and single["title"].endswith("({team})")
+    assert templating.compile_template.cache_info().hits > 0
+
+    # Format specs that would render huge strings are refused, including in templates saved earlier
+    for spec in ("{n:999999999d}", "{n:.999999999f}", "{team:x>101}"):
+        bad = {"name": "Huge", "title_template": spec, "description_template": ""}
+        assert client.post("/api/templates", json=bad).status_code == 400
+    assert client.post("/api/templates", json={
+        "name": "Wide", "title_template": "{n:>100}", "description_template": "{date:%Y %m}"}).status_code == 200
+    asyncio.run(storage.task_templates.update_one({"id": template["id"]}, {"$set": {"title_template": "{n:.5000f}"}}))
+    assert client.post(f"/api/templates/{template['id']}/instantiate", json={"count": 1}).status_code == 400
+
+
+def test_finished_tasks_archive_and_read_through(client, storage):
+    done = client.post("/api/tasks", json={"title": "Ship v1", "tags": ["release"]}).json()
+    client.put(f"/api/tasks/{done['id']}", json={"status": "completed"})
+    recent = client.post("/api/tasks", json={"title": "Ship v2"}).json()
+    client.put(f"/api/tasks/{recent['id']}", json={"status": "approved"})
+    open_task = client.post("/api/tasks", json={"title": "Plan v3"}).json()
+
+    long_ago = datetime.utcnow() - timedelta(days=90)
+    asyncio.run(storage.tasks.update_one({"id": done["id"]}, {"$set": {"completed_at": long_ago}}))
+    result = client.post("/api/tasks/archive", params={"older_than_days": 30}).json()
+    assert result["archived"] == 1
+
+    assert [t["id"] for t in client.get("/api/tasks").json()] == [recent["id"], open_task["id"]]
+    assert client.get(f"/api/tasks/{done['id']}").json()["title"] == "Ship v1"
+    assert client.get("/api/tags").json() == []
+    stats = client.get("/api/stats/dashboard").json()["tasks"]
+    assert (stats["total"], stats["completed"], stats["archived"], stats["pending"]) == (3, 2, 1, 1)
+
+    assert client.post(f"/api/tasks/{done['id']}/restore").json()["id"] == done["id"]
+    assert client.post(f"/api/tasks/{done['id']}/restore").status_code == 404
+    assert len(client.get("/api/tasks").json()) == 3
+    assert client.get("/api/tags").json()[0]["tag"] == "release"
+
+
+def test_delta_sync_returns_only_changes_and_deletions(client, monkeypatch):
+    import sync
+
+    monkeypatch.setattr(sync, "SYNC_OVERLAP_SECONDS", 0)
+    project = client.post("/api/projects", json={"title": "Ops"}).json()
+    kept = client.post("/api/tasks", json={"title": "Rotate keys"}).json()
+    dropped = client.post("/api/tasks", json={"title": "Old task", "project_id": project["id"]}).json()
+    client.post("/api/comments", json={"task_id": kept["id"], "content": "first"})
+    time.sleep(0.01)
+
+    full = client.get("/api/sync").json()
+    assert full["full"] and not full["has_more"]
+    assert {t["id"] for t in full["changes"]["tasks"]} == {kept["id"], dropped["id"]}
+    assert len(full["changes"]["comments"]) == 1 and full["changes"]["templates"] == []
+    time.sleep(0.01)
+
+    client.put(f"/api/tasks/{kept['id']}", json={"title": "Rotate all keys"})
+    client.delete(f"/api/tasks/{dropped['id']}")
+    comment = client.post("/api/comments", json={"task_id": kept["id"], "content": "second"}).json()
+
+    delta = client.get("/api/sync", params={"since": full["token"]}).json()
+    assert not delta["full"]
+    assert [t["title"] for t in delta["changes"]["tasks"]] == ["Rotate all keys"]
+    assert [c["id"] for c in delta["changes"]["comments"]] == [comment["id"]]
+    assert [p["task_count"] for p in delta["changes"]["projects"]] == [0]
+    assert delta["deleted"]["tasks"] == [dropped["id"]]
+
+    assert client.get("/api/sync", params={"since": "not-a-token"}).status_code == 400
+    expired = sync.encode_token(sync.SyncToken(since=datetime.utcnow() - timedelta(days=31)))
+    assert client.get("/api/sync", params={"since": expired}).status_code == 410
+
+
+def test_sync_pages_through_shared_and_old_timestamps(storage):
+    import sync
+
+    # Bulk updates stamp many documents with one updated_at; these are also older than the tombstone TTL
+    stamp = datetime.utcnow() - timedelta(days=40)
+    asyncio.run(storage.tasks.insert_many([{"id": f"t{index}", "title": str(index), "updated_at": stamp}
+                                           for index in range(5)]))
+
+    seen, token, pages = [], None, 0
+    while True:
+        page = asyncio.run(sync.changes_since(storage, token, page_size=2))
+        seen += [task["id"] for task in page["changes"]["tasks"]]
+        token, pages = page["token"], pages + 1
+        if not page["has_more"]:
+            break
+        assert pages < 5
+    assert seen == [f"t{index}" for index in range(5)] and pages == 3
+
+    # The finished round's token continues with changes only
+    asyncio.run(storage.tasks.update_one({"id": "t3"}, {"$set": {"updated_at": datetime.utcnow()}}))
+    delta = asyncio.run(sync.changes_since(storage, token, page_size=2))
+    assert [task["id"] for task in delta["changes"]["tasks"]] == ["t3"] and not delta["has_more"]
+
+
+def test_bootstrap_and_project_summary(client, storage, monkeypatch):
+    import admission
+    import server
+
+    project = client.post("/api/projects", json={"title": "Site"}).json()
+    other = client.post("/api/projects", json={"title": "Empty"}).json()
+    first = client.post("/api/tasks", json={"title": "Design", "project_id": project["id"], "priority": "high"}).json()
+    client.post("/api/tasks", json={"title": "Build", "project_id": project["id"]})
+    client.put(f"/api/tasks/{first['id']}", json={"status": "completed"})
+    client.post("/api/templates", json={"name": "Bug", "title_template": "Fix {n}", "description_template": ""})
+
+    summary = {row["id"]: row for row in client.get("/api/projects/summary").json()}
+    assert summary[project["id"]]["total"] == 2
+    assert summary[project["id"]]["by_status"] == {"todo": 1, "in_progress": 0, "completed": 1, "approved": 0}
+    assert summary[other["id"]]["total"] == 0
+
+    response = client.get("/api/bootstrap", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    body = response.json()
+    assert {t["id"] for t in body["sync"]["changes"]["tasks"]} == {first["id"], *(
+        t["id"] for t in client.get("/api/tasks").json())}
+    assert [t["name"] for t in body["sync"]["changes"]["templates"]] == ["Bug"]
+    assert body["stats"]["tasks"]["completed"] == 1
+    assert len(body["projects_summary"]) == 2 and body["analysis"]["stale"] is False
+    assert body["sync"]["token"] and isinstance(body["notifications"], list)
+
+    # Synced documents carry the task list's fields only; an overloaded summary is left out
+    asyncio.run(storage.tasks.update_one({"id": first["id"]}, {"$set": {"scratch": "internal"}}))
+    limiter = admission.limiters["projects_summary"]
+    monkeypatch.setattr(limiter, "active", limiter.concurrency)
+    monkeypatch.setattr(limiter, "queue", 0)
+    body = client.get("/api/bootstrap").json()
+    assert body["projects_summary"] is None and len(body["sync"]["changes"]["tasks"]) == 2
+    assert all(set(task) <= set(server.Task.model_fields) for task in body["sync"]["changes"]["tasks"])
+
+
+def test_batch_get_and_dependency_expansion(client, storage):
+    a = client.post("/api/tasks", json={"title": "Draft"}).json()
+    b = client.post("/api/tasks", json={"title": "Review"}).json()
+    c = client.post("/api/tasks", json={"title": "Publish", "dependencies": [a["id"], b["id"]]}).json()
+    client.put(f"/api/tasks/{a['id']}", json={"status": "completed"})
+    asyncio.run(storage.tasks.update_one({"id": a["id"]}, {"$set": {"completed_at": datetime(2020, 1, 1)}}))
+    client.post("/api/tasks/archive")
+
+    batch = client.post("/api/tasks/batch-get", json={
+        "ids": [c["id"], "nope", a["id"], c["id"]], "fields": ["title"],
+    }).json()
+    assert batch["tasks"] == [{"id": c["id"], "title": "Publish"}, {"id": a["id"], "title": "Draft"}]
+    assert batch["missing"] == ["nope"]
+    assert client.post("/api/tasks/batch-get", json={"ids": [a["id"]], "fields": ["$where"]}).status_code == 400
+    assert client.post("/api/tasks/batch-get", json={"ids": ["x"] * 501}).status_code == 422
+
+    expanded = client.get(f"/api/tasks/{c['id']}", params={"expand": "dependencies"}).json()
+    assert [(t["title"], t["status"]) for t in expanded["dependency_tasks"]] == [("Draft", "completed"), ("Review", "todo")]
+    listed = {t["id"]: t for t in client.get("/api/tasks", params={"expand": "dependencies"}).json()}
+    assert [t["id"] for t in listed[c["id"]]["dependency_tasks"]] == [a["id"], b["id"]]
+    assert listed[b["id"]]["dependency_tasks"] == []
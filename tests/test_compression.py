@@ -0,0 +1,61 @@
+import gzip
+import json
+import zlib
+
+import compression
+import server
+
+
+def test_negotiate_prefers_quality_then_codec_order():
+    assert compression.negotiate("gzip, deflate") == "gzip"
+    assert compression.negotiate("gzip;q=0, identity") is None
+    assert compression.negotiate("*;q=0.5") == compression.ENCODINGS[0]
+    assert compression.negotiate("") is None
+    assert compression.negotiate("br;q=0.2, gzip;q=0.8") == "gzip"
+
+
+def test_stream_compressor_flushes_decodable_chunks():
+    stream = compression.StreamCompressor("gzip")
+    decoder = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    first = decoder.decompress(stream.chunk(b'{"a":1}\n'))
+    second = decoder.decompress(stream.chunk(b'{"b":2}\n') + stream.finish())
+    assert (first, second) == (b'{"a":1}\n', b'{"b":2}\n')
+
+
+def test_responses_are_compressed_cached_and_invalidated(client):
+    for index in range(30):
+        assert client.post("/api/tasks", json={"title": f"Compressible task {index}"}).status_code == 200
+    hits = compression.metrics.RESPONSE_CACHE_REQUESTS.labels("hit")._value.get()
+
+    first = client.get("/api/tasks", headers={"Accept-Encoding": "gzip"})
+    assert first.headers["content-encoding"] == "gzip" and "Accept-Encoding" in first.headers["vary"]
+    assert first.headers["x-total-count"] == "30" and len(first.json()) == 30
+    variants = len(server.response_cache)
+    second = client.get("/api/tasks", headers={"Accept-Encoding": "gzip"})
+    assert second.content == first.content
+    assert compression.metrics.RESPONSE_CACHE_REQUESTS.labels("hit")._value.get() == hits + 1
+    assert len(server.response_cache) == variants == 1
+
+    # The identity variant of the same entry, then a write drops it
+    plain = client.get("/api/tasks", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers and plain.json() == first.json()
+    client.post("/api/tasks", json={"title": "Fresh"})
+    assert len(server.response_cache) == 0
+    assert client.get("/api/tasks").headers["x-total-count"] == "31"
+
+    # Small bodies are not worth compressing
+    small = client.get("/api/tasks", params={"limit": 1, "status": "approved"}, headers={"Accept-Encoding": "gzip"})
+    assert small.json() == [] and "content-encoding" not in small.headers
+
+
+def test_ndjson_export_streams_compressed_lines(client):
+    for index in range(server.EXPORT_CHUNK_TASKS + 5):
+        client.post("/api/tasks", json={"title": f"Export {index}"})
+
+    with client.stream("GET", "/api/tasks/export", headers={"Accept-Encoding": "gzip"}) as response:
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert response.headers["content-encoding"] == "gzip" and "content-length" not in response.headers
+        raw = b"".join(response.iter_raw())
+    tasks = [json.loads(line) for line in gzip.decompress(raw).decode().splitlines()]
+    assert len(tasks) == server.EXPORT_CHUNK_TASKS + 5
+    assert {task["title"] for task in tasks} == {f"Export {index}" for index in range(len(tasks))}
@@ -0,0 +1,86 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import idempotency
+
+
+def test_retried_posts_replay_the_first_response(client, storage):
+    project = client.post("/api/projects", json={"title": "Retries"}).json()
+    headers = {"Idempotency-Key": "create-1"}
+    body = {"title": "Only once", "project_id": project["id"]}
+
+    first = client.post("/api/tasks", json=body, headers=headers)
+    retry = client.post("/api/tasks", json=body, headers=headers)
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json() and retry.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in first.headers
+    assert client.get("/api/projects/" + project["id"]).json()["task_count"] == 1
+    assert client.get("/api/tasks").headers["x-total-count"] == "1"
+
+    # Same key for another request is refused; requests without a key are unaffected
+    assert client.post("/api/tasks", json={**body, "title": "Other"}, headers=headers).status_code == 422
+    assert client.post("/api/tasks/batch-create", json=[body], headers=headers).status_code == 422
+    client.post("/api/tasks", json=body)
+    assert client.get("/api/projects/" + project["id"]).json()["task_count"] == 2
+
+    batch = [{"title": "Batch a"}, {"title": "Batch b"}]
+    created = client.post("/api/tasks/batch-create", json=batch, headers={"Idempotency-Key": "batch-1"}).json()
+    assert client.post("/api/tasks/batch-create", json=batch, headers={"Idempotency-Key": "batch-1"}).json() == created
+    assert client.get("/api/tasks").headers["x-total-count"] == "4"
+
+    task_id = first.json()["id"]
+    start = client.post(f"/api/time-tracking/start/{task_id}", headers={"Idempotency-Key": "timer-1"})
+    assert client.post(f"/api/time-tracking/start/{task_id}", headers={"Idempotency-Key": "timer-1"}).json() == start.json()
+    assert len(client.get(f"/api/time-tracking/{task_id}").json()) == 1
+
+
+def test_in_progress_keys_conflict_until_their_lock_expires(client, storage):
+    now = datetime.utcnow()
+    fingerprint = idempotency.fingerprint("POST", "/api/tasks", b"", b'{"title":"Slow"}')
+
+    async def hold(locked_until):
+        await storage[idempotency.KEYS].delete_many({})
+        await storage[idempotency.KEYS].insert_one({
+            "key": "slow", "fingerprint": fingerprint, "state": "in_progress", "claim_id": "other",
+            "locked_until": locked_until, "created_at": now, "response": None,
+        })
+
+    asyncio.run(hold(now + timedelta(minutes=1)))
+    headers = {"Idempotency-Key": "slow", "Content-Type": "application/json"}
+    busy = client.post("/api/tasks", content=b'{"title":"Slow"}', headers=headers)
+    assert busy.status_code == 409 and busy.headers["retry-after"] == str(idempotency.IDEMPOTENCY_RETRY_AFTER_SECONDS)
+
+    # A claim whose request died is taken over, and the response is stored for later retries
+    asyncio.run(hold(now - timedelta(seconds=1)))
+    taken = client.post("/api/tasks", content=b'{"title":"Slow"}', headers=headers)
+    assert taken.status_code == 200
+    record = asyncio.run(storage[idempotency.KEYS].find_one({"key": "slow"}))
+    assert record["state"] == "completed" and record["claim_id"] != "other"
+    assert client.post("/api/tasks", content=b'{"title":"Slow"}', headers=headers).json() == taken.json()
+
+    assert client.post("/api/tasks", json={"title": "x"}, headers={"Idempotency-Key": "k" * 256}).status_code == 400
+
+
+def test_unkept_responses_still_complete_the_key(client, storage, monkeypatch):
+    body = {"title": "Large"}
+    limit = idempotency.IDEMPOTENCY_MAX_BODY_BYTES
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_MAX_BODY_BYTES", 10)
+    assert client.post("/api/tasks", json=body, headers={"Idempotency-Key": "big"}).status_code == 200
+    retry = client.post("/api/tasks", json=body, headers={"Idempotency-Key": "big"})
+    assert retry.status_code == 409 and "retry-after" not in retry.headers
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_MAX_BODY_BYTES", limit)
+
+    # A response that cannot be stored leaves a completed key without it
+    complete = idempotency.complete
+
+    async def failing_complete(db, key, claim_id, status, headers, response_body):
+        if response_body is not None:
+            raise RuntimeError("document too large")
+        await complete(db, key, claim_id, status, headers, response_body)
+
+    monkeypatch.setattr(idempotency, "complete", failing_complete)
+    assert client.post("/api/tasks", json=body, headers={"Idempotency-Key": "unstored"}).status_code == 200
+    record = asyncio.run(storage[idempotency.KEYS].find_one({"key": "unstored"}))
+    assert record["state"] == "completed" and record["response"]["body"] is None
+    assert client.post("/api/tasks", json=body, headers={"Idempotency-Key": "unstored"}).status_code == 409
+    assert client.get("/api/tasks").headers["x-total-count"] == "2"
@@ -0,0 +1,148 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import jobs
+from storage import MemoryStorage
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def drain(queue, job_id, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        job = await queue.get(job_id)
+        if job["status"] in jobs.FINISHED_STATES:
+            return job
+        assert asyncio.get_running_loop().time() < deadline, job
+        await asyncio.sleep(0.01)
+
+
+def test_jobs_succeed_report_progress_and_retry_with_backoff(monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_RETRY_BASE_SECONDS", 0.01)
+    storage = MemoryStorage()
+    queue = jobs.JobQueue(lambda: storage, concurrency=2, poll_seconds=0.01)
+    calls = []
+
+    @queue.handler("count")
+    async def count(job, payload):
+        await job.report(done=payload["n"])
+        return {"total": payload["n"] * 2}
+
+    @queue.handler("flaky")
+    async def flaky(job, payload):
+        calls.append(datetime.utcnow())
+        if len(calls) < 3:
+            raise RuntimeError("transient")
+        return {"attempt": len(calls)}
+
+    @queue.handler("broken")
+    async def broken(job, payload):
+        raise ValueError("nope")
+
+    async def scenario():
+        await queue.start()
+        try:
+            ok = await queue.enqueue("count", {"n": 21})
+            retried = await queue.enqueue("flaky")
+            failed = await queue.enqueue("broken", max_attempts=2)
+            return [await drain(queue, job["id"]) for job in (ok, retried, failed)]
+        finally:
+            await queue.stop()
+
+    ok, retried, failed = run(scenario())
+    assert ok["status"] == "succeeded" and ok["result"] == {"total": 42} and ok["progress"] == {"done": 21}
+    assert retried["status"] == "succeeded" and retried["attempts"] == 3 and retried["result"] == {"attempt": 3}
+    assert calls[2] - calls[1] >= calls[1] - calls[0]
+    assert failed["status"] == "failed" and failed["attempts"] == 2
+    assert failed["error"]["message"] == "nope" and failed["finished_at"]
+
+    with pytest.raises(ValueError):
+        run(queue.enqueue("unknown"))
+
+
+def test_expired_lease_is_reclaimed_and_dedupe_returns_unfinished_job():
+    storage = MemoryStorage()
+    crashed = jobs.JobQueue(lambda: storage, concurrency=0)
+    survivor = jobs.JobQueue(lambda: storage, concurrency=1, poll_seconds=0.01)
+    for queue in (crashed, survivor):
+        queue.handler("work")(lambda job, payload: asyncio.sleep(0, result={"by": job.queue.worker_id}))
+
+    async def scenario():
+        job = await crashed.enqueue("work", dedupe_key="once")
+        assert (await crashed.enqueue("work", dedupe_key="once"))["id"] == job["id"]
+        # The first worker claims the job and dies without finishing it
+        claimed = await crashed._claim()
+        assert claimed["lease_owner"] == crashed.worker_id
+        assert await survivor._claim() is None
+        await storage.jobs.update_one(
+            {"id": job["id"]}, {"$set": {"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)}}
+        )
+        await survivor.start()
+        try:
+            return await drain(survivor, job["id"])
+        finally:
+            await survivor.stop()
+
+    job = run(scenario())
+    assert job["status"] == "succeeded" and job["attempts"] == 2
+    assert job["result"] == {"by": survivor.worker_id}
+
+
+def test_dedupe_key_is_unique_among_unfinished_jobs():
+    storage = MemoryStorage()
+    queue = jobs.JobQueue(lambda: storage, concurrency=0)
+    queue.handler("work")(lambda job, payload: asyncio.sleep(0))
+    lookup = storage.jobs.find_one
+    lookups = []
+
+    async def racing_lookup(filter, projection=None):
+        # The first lookup misses, as if another process inserted right after it
+        lookups.append(filter)
+        return None if len(lookups) == 1 else await lookup(filter, projection)
+
+    async def scenario():
+        await storage.create_indexes()
+        first = await queue.enqueue("work", dedupe_key="once")
+        storage.jobs.find_one = racing_lookup
+        assert (await queue.enqueue("work", dedupe_key="once"))["id"] == first["id"]
+        storage.jobs.find_one = lookup
+        assert len(lookups) == 2
+
+        # Finished jobs and jobs without a key do not count
+        await storage.jobs.update_one({"id": first["id"]}, {"$set": {"status": "succeeded"}})
+        assert (await queue.enqueue("work", dedupe_key="once"))["id"] != first["id"]
+        await queue.enqueue("work")
+        await queue.enqueue("work")
+        return await storage.jobs.count_documents({})
+
+    assert run(scenario()) == 4
+
+
+def test_lost_lease_cancels_the_handler():
+    storage = MemoryStorage()
+    queue = jobs.JobQueue(lambda: storage, concurrency=0, lease_seconds=0.03)
+    cancelled = []
+
+    @queue.handler("slow")
+    async def slow(job, payload):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(job.id)
+            raise
+
+    async def scenario():
+        job = await queue.enqueue("slow")
+        running = asyncio.create_task(queue._run(await queue._claim()))
+        await asyncio.sleep(0)
+        await storage.jobs.update_one({"id": job["id"]}, {"$set": {"lease_owner": "other-worker"}})
+        await asyncio.wait_for(running, 1)
+        return await queue.get(job["id"])
+
+    job = run(scenario())
+    assert cancelled == [job["id"]]
+    assert job["status"] == "running" and job["lease_owner"] == "other-worker"
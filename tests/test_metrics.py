@@ -0,0 +1,28 @@
+from types import SimpleNamespace
+
+import metrics
+
+
+def test_requests_are_recorded_per_route_template(client):
+    task = client.post("/api/tasks", json={"title": "Measure me"}).json()
+    client.get(f"/api/tasks/{task['id']}")
+
+    body = client.get("/metrics").text
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/tasks/{task_id}"} ' in body
+    assert 'http_requests_total{method="POST",route="/api/tasks",status="200"}' in body
+
+
+def test_command_listener_attributes_commands_to_the_current_request():
+    stats = metrics.RequestStats()
+    token = metrics.current_request.set(stats)
+    try:
+        metrics.command_listener.succeeded(SimpleNamespace(
+            command_name="find", duration_micros=1500,
+            reply={"cursor": {"firstBatch": [{}, {}, {}]}},
+        ))
+        metrics.command_listener.failed(SimpleNamespace(command_name="update", duration_micros=500))
+    finally:
+        metrics.current_request.reset(token)
+
+    assert stats.commands == 2 and stats.documents == 3
+    assert abs(stats.db_seconds - 0.002) < 1e-9
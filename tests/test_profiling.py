@@ -0,0 +1,37 @@
+import marshal
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import profiling
+import server
+
+
+def test_header_triggered_profile_is_stored_and_retrievable(storage, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_ADMIN_TOKEN", "secret")
+    admin = {"X-Admin-Token": "secret"}
+    app = FastAPI()
+    app.middleware("http")(profiling.profile_middleware(lambda: storage))
+
+    @app.get("/slow")
+    async def slow():
+        return {"total": sum(i * i for i in range(10000))}
+
+    with TestClient(app) as client:
+        assert "X-Profile-Id" not in client.get("/slow").headers
+        assert "X-Profile-Id" not in client.get("/slow", headers={"X-Profile": "1"}).headers
+        profile_id = client.get("/slow", headers={"X-Profile": "1", **admin}).headers["X-Profile-Id"]
+
+    with TestClient(server.app) as client:
+        listed = client.get("/api/admin/profiles", headers=admin).json()
+        assert [p["id"] for p in listed] == [profile_id] and listed[0]["route"] == "/slow"
+        profile = client.get(f"/api/admin/profiles/{profile_id}", headers=admin).json()
+        assert profile["top_functions"] and "cumulative" in profile["report"]
+        raw = client.get(f"/api/admin/profiles/{profile_id}/raw", headers=admin).content
+        assert isinstance(marshal.loads(raw), dict)
+
+        # Wrong or missing tokens are refused, and without a configured token the endpoints are off
+        assert client.get("/api/admin/profiles", headers={"X-Admin-Token": "guess"}).status_code == 403
+        assert client.get(f"/api/admin/profiles/{profile_id}/raw").status_code == 403
+        monkeypatch.setattr(profiling, "PROFILE_ADMIN_TOKEN", "")
+        assert client.get("/api/admin/profiles", headers={"X-Admin-Token": ""}).status_code == 404
@@ -0,0 +1,53 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import schema
+from storage import MemoryStorage
+
+
+def test_guard_canonicalises_dates_on_every_write_path():
+    async def scenario():
+        db = MemoryStorage()
+        db.guard(schema.guard)
+        await db.tasks.insert_one({"id": "a", "deadline": "2024-05-01T12:00:00Z", "title": "x"})
+        await db.tasks.update_one({"id": "a"}, {"$set": {"next_due_date": "2024-05-08T12:00:00+02:00"}})
+        await db.tasks.update_one({"id": "a"}, {"$set": {"time_summary": {"last_entry_at": "2024-05-02"}}})
+        await db.projects.insert_one({"id": "p", "deletion": {"started_at": datetime(2024, 5, 1, tzinfo=timezone.utc)}})
+        with pytest.raises(schema.InvalidDate):
+            await db.tasks.update_one({"id": "a"}, {"$set": {"deadline": "next tuesday"}})
+        return (await db.tasks.find_one({"id": "a"}, {"_id": 0}),
+                await db.projects.find_one({"id": "p"}, {"_id": 0}))
+
+    task, project = asyncio.run(scenario())
+    assert task["deadline"] == datetime(2024, 5, 1, 12)
+    assert task["next_due_date"] == datetime(2024, 5, 8, 10)
+    assert task["time_summary"]["last_entry_at"] == datetime(2024, 5, 2)
+    assert task["schema_version"] == schema.SCHEMA_VERSION
+    assert project["deletion"]["started_at"] == datetime(2024, 5, 1)
+
+
+def test_date_migration_converts_reports_and_is_repeatable():
+    async def scenario():
+        db = MemoryStorage()
+        await db.tasks.insert_many([
+            {"id": "a", "deadline": "2024-05-01T12:00:00Z", "created_at": datetime(2024, 4, 1)},
+            {"id": "b", "deadline": "soon", "next_due_date": "2024-05-03"},
+            {"id": "c", "deadline": datetime(2024, 5, 1)},
+        ])
+        await db.time_entries.insert_one({"id": "e", "task_id": "a", "start_time": "2024-04-30T09:00:00"})
+        first = await schema.migrate_dates(db, batch_size=2)
+        again = await schema.migrate_dates(db)
+        overdue = await db.tasks.distinct("id", {"deadline": {"$lt": datetime(2024, 6, 1)}})
+        b = await db.tasks.find_one({"id": "b"}, {"_id": 0})
+        return first, again, overdue, b
+
+    first, again, overdue, b = asyncio.run(scenario())
+    assert first["tasks"]["scanned"] == 3 and first["tasks"]["converted"] == 2 and first["tasks"]["invalid"] == 1
+    assert first["tasks"]["invalid_samples"] == [{"id": "b", "fields": {"deadline": "soon"}}]
+    assert first["time_entries"]["converted"] == 1
+    assert again["tasks"]["scanned"] == 0
+    assert sorted(overdue) == ["a", "c"]
+    assert b["deadline"] is None and b["schema_invalid"] == {"deadline": "soon"}
+    assert b["next_due_date"] == datetime(2024, 5, 3)
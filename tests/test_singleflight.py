@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+import metrics
+import singleflight
+
+
+def counted(name):
+    return (metrics.SINGLE_FLIGHT_CALLS.labels(name)._value.get(),
+            metrics.SINGLE_FLIGHT_COALESCED.labels(name)._value.get())
+
+
+def test_concurrent_identical_calls_share_one_computation():
+    flight = singleflight.SingleFlight("test-share")
+    calls = []
+
+    async def compute(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return {"key": key}
+
+    async def scenario():
+        results = await asyncio.gather(*(flight.do(key, lambda key=key: compute(key)) for key in "aaab"))
+        # Finished calls are not cached
+        again = await flight.do("a", lambda: compute("a"))
+        return results, again
+
+    results, again = asyncio.run(scenario())
+    assert results == [{"key": "a"}] * 3 + [{"key": "b"}]
+    assert results[0] is results[1] is results[2]
+    assert again == {"key": "a"} and calls == ["a", "b", "a"]
+    assert counted("test-share") == (3, 2)
+    assert len(flight) == 0
+
+
+def test_waiters_share_failures_survive_cancellation_and_writes_detach():
+    flight = singleflight.SingleFlight("test-detach")
+    started = []
+
+    async def compute(result):
+        started.append(result)
+        await asyncio.sleep(0.02)
+        if result == "boom":
+            raise ValueError(result)
+        return result
+
+    async def scenario():
+        first = asyncio.ensure_future(flight.do("k", lambda: compute("old")))
+        joined = asyncio.ensure_future(flight.do("k", lambda: compute("unused")))
+        await asyncio.sleep(0)
+        first.cancel()
+        flight.forget()
+        fresh = await flight.do("k", lambda: compute("new"))
+        failures = await asyncio.gather(
+            flight.do("f", lambda: compute("boom")), flight.do("f", lambda: compute("boom")),
+            return_exceptions=True,
+        )
+        return fresh, await joined, failures, first.cancelled()
+
+    fresh, joined, failures, cancelled = asyncio.run(scenario())
+    assert cancelled and joined == "old" and fresh == "new"
+    assert [str(failure) for failure in failures] == ["boom", "boom"]
+    assert started == ["old", "new", "boom"]
+
+
+def test_coalesce_only_wraps_enabled_routes(monkeypatch):
+    monkeypatch.setattr(singleflight, "SINGLE_FLIGHT_ROUTES", frozenset({"on"}))
+
+    async def route(limit: int = 10):
+        return limit
+
+    assert singleflight.coalesce("off")(route) is route
+    wrapped = singleflight.coalesce("on")(route)
+    assert wrapped.__wrapped__ is route and isinstance(wrapped.flight, singleflight.SingleFlight)
+    assert asyncio.run(wrapped(limit=3)) == 3
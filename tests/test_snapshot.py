@@ -0,0 +1,56 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import snapshot
+from storage import MemoryStorage, filter_ids
+
+
+def test_filter_ids():
+    assert filter_ids({"id": "a"}) == ("a",)
+    assert filter_ids({"id": {"$in": ["a", "b"]}}) == ("a", "b")
+    assert filter_ids({"id": {"$ne": "a"}}) is None
+    assert filter_ids({"project_id": "p"}) is None
+
+
+def test_snapshot_follows_change_events():
+    storage = MemoryStorage()
+    view = snapshot.TaskSnapshot(lambda: storage, max_age=3600)
+    storage.watch(view.on_change)
+    now = datetime.utcnow()
+
+    async def scenario():
+        await storage.tasks.insert_many([
+            {"id": "a", "title": "Overdue", "status": "todo", "priority": "high", "deadline": now - timedelta(hours=1)},
+            {"id": "b", "title": "Soon", "status": "in_progress", "deadline": now + timedelta(hours=2),
+             "estimated_hours": 0.1, "dependencies": ["a"]},
+            {"id": "c", "title": "Done", "status": "completed"},
+            {"id": "t", "title": "Template", "status": "todo", "is_template": True},
+        ])
+        await view.refresh()
+        assert sorted(view.ids) == ["a", "b"]
+        assert view.count_overdue(now) == 1
+        assert [row.id for row in view.rows(view.due_between(now, now + timedelta(days=1)))] == ["b"]
+        # Estimates keep full precision, so sums such as 0.1 + 0.2 do not pick up float32 noise
+        assert next(task for task in view.compact_tasks() if task[0] == "b")[5:] == (0.1, ("a",))
+
+        # Writes keyed by id refresh just those rows
+        loaded_at = view.loaded_at
+        await storage.tasks.update_one({"id": "a"}, {"$set": {"status": "completed"}})
+        await storage.tasks.update_one({"id": "c"}, {"$set": {"status": "todo", "title": "Reopened"}})
+        await view.refresh()
+        assert view.loaded_at == loaded_at
+        assert sorted(view.ids) == ["b", "c"] and view.row(view.ids.index("c")).title == "Reopened"
+
+        # Writes the snapshot cannot attribute to ids force a reload
+        await storage.tasks.update_many({"status": "todo"}, {"$set": {"priority": "low"}})
+        await view.refresh()
+        assert view.loaded_at > loaded_at
+        assert view.row(view.ids.index("c")).priority == "low"
+
+        await storage.tasks.delete_one({"id": "b"})
+        await view.refresh()
+        assert view.ids == ["c"]
+
+    asyncio.run(scenario())
+    stats = view.stats()
+    assert stats["rows"] == 1 and stats["memory_bytes"] > 0 and stats["pending_changes"] == 0
@@ -0,0 +1,139 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from storage import DeleteOne, InsertOne, MemoryStorage, UpdateMany, UpdateOne
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_query_operators_follow_mongo_semantics():
+    async def scenario():
+        db = MemoryStorage()
+        now = datetime.utcnow()
+        await db.tasks.insert_many([
+            {"id": "a", "status": "todo", "deadline": now - timedelta(days=1), "tags": ["x", "y"]},
+            {"id": "b", "status": "completed", "deadline": now + timedelta(days=1), "tags": ["y"]},
+            {"id": "c", "status": "in_progress", "deadline": None, "tags": []},
+            {"id": "d", "status": "todo"},
+        ])
+        overdue = await db.tasks.find({"deadline": {"$lt": now}, "status": {"$nin": ["completed"]}}).to_list(None)
+        assert [t["id"] for t in overdue] == ["a"]
+        assert await db.tasks.count_documents({"deadline": None}) == 2
+        assert await db.tasks.count_documents({"tags": "y"}) == 2
+        assert await db.tasks.count_documents({"tags": {"$all": ["x", "y"]}}) == 1
+        assert await db.tasks.count_documents({"is_template": {"$ne": True}}) == 4
+        ordered = await db.tasks.find({}, {"_id": 0, "id": 1}).sort("deadline", -1).to_list(None)
+        assert ordered == [{"id": "b"}, {"id": "a"}, {"id": "c"}, {"id": "d"}]
+
+    run(scenario())
+
+
+def test_updates_and_upserts():
+    async def scenario():
+        db = MemoryStorage()
+        await db.tasks.insert_one({"id": "a", "actual_hours": 1.0, "dependencies": ["b", "c"]})
+        await db.tasks.update_one({"id": "a"}, {"$inc": {"actual_hours": 0.5}, "$set": {"meta.n": 1}})
+        await db.tasks.update_many({"dependencies": "b"}, {"$pull": {"dependencies": "b"}})
+        task = await db.tasks.find_one({"id": "a"}, {"_id": 0})
+        assert task == {"id": "a", "actual_hours": 1.5, "dependencies": ["c"], "meta": {"n": 1}}
+
+        result = await db.counters.update_one({"key": "k"}, {"$inc": {"n": 1}}, upsert=True)
+        assert result.upserted_id is not None
+        await db.counters.update_one({"key": "k"}, {"$inc": {"n": 1}}, upsert=True)
+        assert (await db.counters.find_one({"key": "k"}))["n"] == 2
+
+    run(scenario())
+
+
+def test_documents_are_normalised_like_bson():
+    async def scenario():
+        db = MemoryStorage()
+        aware = datetime(2024, 1, 1, 12, 0, 0, 123456, tzinfo=timezone(timedelta(hours=2)))
+        document = {"id": "a", "deadline": aware}
+        await db.tasks.insert_one(document)
+        assert "_id" in document
+        stored = await db.tasks.find_one({"id": "a"})
+        assert stored["deadline"] == datetime(2024, 1, 1, 10, 0, 0, 123000)
+        stored["deadline"] = None
+        assert (await db.tasks.find_one({"id": "a"}))["deadline"] is not None
+
+    run(scenario())
+
+
+def test_unique_index_rejects_duplicates():
+    async def scenario():
+        db = MemoryStorage()
+        await db.create_indexes()
+        await db.tasks.insert_one({"id": "a"})
+        with pytest.raises(DuplicateKeyError):
+            await db.tasks.insert_one({"id": "a"})
+        await db.tasks.insert_one({"id": "b", "project_id": "p"})
+        assert [t["id"] for t in await db.tasks.find({"project_id": {"$in": ["p", "q"]}}).to_list(None)] == ["b"]
+
+    run(scenario())
+
+
+def test_aggregation_pipeline():
+    async def scenario():
+        db = MemoryStorage()
+        await db.tasks.insert_many([
+            {"id": "a", "project_id": "p", "tags": ["x", "y"], "hours": 2},
+            {"id": "b", "project_id": "p", "tags": ["x"], "hours": 3},
+            {"id": "c", "project_id": "q", "tags": [], "hours": 1},
+        ])
+        grouped = await db.tasks.aggregate([
+            {"$match": {"project_id": "p"}},
+            {"$unwind": "$tags"},
+            {"$group": {"_id": {"project": "$project_id", "tag": "$tags"}, "count": {"$sum": 1},
+                        "hours": {"$sum": "$hours"}}},
+            {"$sort": {"count": -1, "_id.tag": 1}},
+            {"$project": {"_id": 0, "tag": "$_id.tag", "count": 1, "hours": 1}},
+        ]).to_list(None)
+        assert grouped == [{"count": 2, "hours": 5, "tag": "x"}, {"count": 1, "hours": 2, "tag": "y"}]
+
+    run(scenario())
+
+
+def test_bulk_write_applies_operations_in_order():
+    async def scenario():
+        db = MemoryStorage()
+        await db.tasks.insert_many([{"id": "a", "n": 1}, {"id": "b", "n": 1}])
+        result = await db.tasks.bulk_write([
+            UpdateOne({"id": "a"}, {"$inc": {"n": 1}}),
+            UpdateOne({"id": "z"}, {"$set": {"n": 0}}, upsert=True),
+            InsertOne({"id": "c", "n": 5}),
+            UpdateMany({"n": {"$gte": 1}}, {"$inc": {"n": 10}}),
+            DeleteOne({"id": "b"}),
+        ])
+        counts = (result.inserted_count, result.matched_count, result.modified_count,
+                  result.upserted_count, result.deleted_count)
+        return counts, await db.tasks.find({}, {"_id": 0}).sort("id").to_list(None)
+
+    counts, documents = run(scenario())
+    assert counts == (1, 4, 4, 1, 1)
+    assert documents == [{"id": "a", "n": 12}, {"id": "c", "n": 15}, {"id": "z", "n": 0}]
+
+
+def test_motor_bulk_write_builds_driver_operations():
+    import pymongo
+    from storage import MotorCollection
+
+    class Driver:
+        name = "tasks"
+
+        async def bulk_write(self, requests, ordered=True):
+            self.requests = requests
+
+    driver, events = Driver(), []
+    collection = MotorCollection(driver, listeners=[events.append])
+    run(collection.bulk_write([UpdateOne({"id": "a"}, {"$set": {"n": 1}}, upsert=True), InsertOne({"id": "b"}),
+                               DeleteOne({"id": "c"})]))
+    assert driver.requests == [pymongo.UpdateOne({"id": "a"}, {"$set": {"n": 1}}, upsert=True),
+                               pymongo.InsertOne({"id": "b"}), pymongo.DeleteOne({"id": "c"})]
+    assert [(event.operation, event.ids) for event in events] == [("update", ("a",)), ("insert", ("b",)),
+                                                                  ("delete", ("c",))]
@@ -0,0 +1,108 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import time_entries
+from storage import MemoryStorage
+
+
+def test_timeseries_history_migration_reads_and_reports(monkeypatch):
+    monkeypatch.setattr(time_entries, "TIME_ENTRIES_TIMESERIES", True)
+    db = MemoryStorage()
+    day = datetime(2024, 4, 1, 9)
+
+    async def scenario():
+        await db.tasks.insert_many([{"id": "a", "project_id": "p"}, {"id": "b", "project_id": None}])
+        await db.time_entries.insert_many([
+            {"id": "e1", "task_id": "a", "start_time": day, "end_time": day + timedelta(minutes=30),
+             "duration_minutes": 30},
+            {"id": "e2", "task_id": "b", "start_time": day + timedelta(days=1), "end_time": day, "duration_minutes": 15},
+            {"id": "running", "task_id": "a", "project_id": "p", "start_time": day + timedelta(days=2), "end_time": None},
+        ])
+        await time_entries.ensure_storage(db)
+        # A copy left behind by an interrupted run is not duplicated
+        await db[time_entries.HISTORY].insert_one(time_entries.to_history(
+            {"id": "e1", "task_id": "a", "project_id": "p", "start_time": day, "duration_minutes": 30}
+        ))
+        moved = await time_entries.migrate_to_timeseries(db, batch_size=1)
+        assert moved == {"moved": 1}
+        assert await db.time_entries.distinct("id") == ["running"]
+
+        running = await db.time_entries.find_one({"id": "running"}, {"_id": 0})
+        await time_entries.complete_entry(db, running, day + timedelta(days=2, minutes=45), 45)
+        assert await db.time_entries.count_documents({}) == 0
+
+        entries = await time_entries.entries_for_task(db, "a")
+        assert [(e["id"], e["project_id"], e["duration_minutes"]) for e in entries] == [
+            ("e1", "p", 30), ("running", "p", 45)
+        ]
+        assert await time_entries.totals(db) == {"entries": 3, "minutes": 90}
+        by_day = await time_entries.time_report(db, day, day + timedelta(days=7))
+        by_project = await time_entries.time_report(db, day, day + timedelta(days=2), group_by="project")
+
+        await time_entries.delete_for_tasks(db, ["a"])
+        remaining = await db[time_entries.HISTORY].distinct("id")
+        return by_day, by_project, remaining
+
+    by_day, by_project, remaining = asyncio.run(scenario())
+    assert by_day == [
+        {"day": "2024-04-01", "entries": 1, "minutes": 30},
+        {"day": "2024-04-02", "entries": 1, "minutes": 15},
+        {"day": "2024-04-03", "entries": 1, "minutes": 45},
+    ]
+    assert by_project == [{"project": "p", "entries": 1, "minutes": 30}, {"project": None, "entries": 1, "minutes": 15}]
+    assert remaining == ["e2"]
+
+
+def test_embedded_time_entries_move_to_collection_with_rollup():
+    db = MemoryStorage()
+    start = datetime(2024, 4, 1, 9)
+
+    async def scenario():
+        await db.tasks.insert_many([
+            {"id": "a", "project_id": "p", "time_entries": [
+                {"id": "e1", "start_time": start, "end_time": start + timedelta(minutes=20), "duration_minutes": 20},
+                {"start_time": start + timedelta(days=1), "end_time": start + timedelta(days=1, minutes=5),
+                 "duration_minutes": 5},
+            ]},
+            {"id": "b", "time_entries": []},
+            {"id": "c"},
+        ])
+        # e1 was already copied by an earlier, interrupted run
+        await db.time_entries.insert_one({"id": "e1", "task_id": "a", "project_id": "p", "start_time": start,
+                                          "end_time": start + timedelta(minutes=20), "duration_minutes": 20})
+        first = await time_entries.embed_rollups(db, batch_size=2)
+        again = await time_entries.embed_rollups(db, batch_size=2)
+        tasks = await db.tasks.find({}, {"_id": 0}).sort("id", 1).to_list(None)
+        return first, again, tasks, await db.time_entries.count_documents({"task_id": "a"})
+
+    first, again, tasks, stored = asyncio.run(scenario())
+    assert first == {"tasks": 3, "copied_entries": 1} and again == {"tasks": 0, "copied_entries": 0}
+    assert stored == 2
+    assert all("time_entries" not in task for task in tasks)
+    assert tasks[0]["time_summary"] == {
+        "entry_count": 2, "total_minutes": 25, "last_entry_at": start + timedelta(days=1, minutes=5),
+    }
+    assert tasks[1]["time_summary"] == tasks[2]["time_summary"] == time_entries.empty_summary()
+
+
+def test_time_summary_migration_covers_archived_tasks_and_is_recorded():
+    import migrations
+
+    db = MemoryStorage()
+    start = datetime(2024, 4, 1, 9)
+
+    async def scenario():
+        await db.tasks.insert_one({"id": "live", "time_summary": time_entries.empty_summary()})
+        # Archived before the migration ran, still in the old shape
+        await db.archived_tasks.insert_one({"id": "old", "time_entries": [
+            {"id": "e1", "start_time": start, "end_time": start + timedelta(minutes=10), "duration_minutes": 10},
+        ]})
+        before = await migrations.pending(db)
+        result = await migrations.apply(db, "task-time-summary", 10)
+        return before, result, await migrations.pending(db), await db.archived_tasks.find_one({"id": "old"})
+
+    before, result, after, archived = asyncio.run(scenario())
+    assert "task-time-summary" in before and "task-time-summary" not in after
+    assert "time-entries-timeseries" not in before  # Disabled without TIME_ENTRIES_TIMESERIES
+    assert result == {"tasks": 1, "copied_entries": 1} and "time_entries" not in archived
+    assert archived["time_summary"]["total_minutes"] == 10
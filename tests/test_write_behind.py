@@ -0,0 +1,70 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import write_behind
+from storage import MemoryStorage
+
+
+def test_increments_are_coalesced_and_flushed_in_one_bulk_write():
+    storage = MemoryStorage()
+    buffer = write_behind.IncrementBuffer("test", lambda: storage, "tasks", window_ms=10_000)
+    now = datetime(2024, 1, 1, 12)
+    writes = []
+    storage.watch(lambda event: writes.append(event))
+
+    async def scenario():
+        await storage.tasks.insert_many([{"id": "a", "actual_hours": 1.0}, {"id": "b", "actual_hours": 0.0}])
+        writes.clear()
+        await buffer.add("a", inc={"actual_hours": 0.5}, max={"updated_at": now})
+        await buffer.add("a", inc={"actual_hours": 0.25}, max={"updated_at": now - timedelta(minutes=5)})
+        await buffer.add("b", inc={"actual_hours": 2.0}, max={"updated_at": now})
+        assert writes == [] and (await storage.tasks.find_one({"id": "a"}))["actual_hours"] == 1.0
+        assert await buffer.flush() == 2
+        return await storage.tasks.find({}, {"_id": 0}).to_list(None)
+
+    assert asyncio.run(scenario()) == [
+        {"id": "a", "actual_hours": 1.75, "updated_at": now},
+        {"id": "b", "actual_hours": 2.0, "updated_at": now},
+    ]
+
+
+def test_failed_flush_is_requeued_and_stop_flushes():
+    storage = MemoryStorage()
+    buffer = write_behind.IncrementBuffer("test", lambda: storage, "tasks", window_ms=10_000)
+
+    async def scenario():
+        await storage.tasks.insert_one({"id": "a", "actual_hours": 0.0})
+        await buffer.add("a", inc={"actual_hours": 1.0})
+        original = storage.tasks.bulk_write
+
+        async def failing(requests, ordered=True):
+            raise RuntimeError("primary stepped down")
+
+        storage.tasks.bulk_write = failing
+        with pytest.raises(RuntimeError):
+            await buffer.flush()
+        await buffer.add("a", inc={"actual_hours": 0.5})
+        storage.tasks.bulk_write = original
+        await buffer.start()
+        await buffer.stop()
+        return (await storage.tasks.find_one({"id": "a"}))["actual_hours"]
+
+    assert asyncio.run(scenario()) == 1.5
+
+
+def test_stamped_flushes_raise_the_timestamp_to_the_flush_time():
+    storage = MemoryStorage()
+    buffer = write_behind.IncrementBuffer("test", lambda: storage, "tasks", window_ms=10_000, stamp="updated_at")
+    stopped_at = datetime.utcnow() - timedelta(minutes=10)
+
+    async def scenario():
+        await storage.tasks.insert_one({"id": "a", "actual_hours": 0.0, "updated_at": stopped_at})
+        await buffer.add("a", inc={"actual_hours": 1.0}, max={"updated_at": stopped_at})
+        await buffer.flush()
+        return await storage.tasks.find_one({"id": "a"})
+
+    # A sync that read the task while the increment was buffered finds it again from its round start
+    task = asyncio.run(scenario())
+    assert task["actual_hours"] == 1.0 and task["updated_at"] > stopped_at + timedelta(minutes=9)